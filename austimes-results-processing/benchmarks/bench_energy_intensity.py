@@ -0,0 +1,72 @@
+"""Regression benchmark: vectorised EInt engine against the original iterrows loop.
+
+Run from the austimes-results-processing directory:
+    python benchmarks/bench_energy_intensity.py [n_rows]
+"""
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from energy_intensity import calculate_eint  # noqa: E402
+
+SORT_COLS = ['scenario', 'state', 'sector', 'subsector_p', 'enduse', 'start_fuel', 'end_fuel', 'unit', 'year']
+
+
+def make_frame(n_rows, seed=0):
+    """Random commercial-shaped frame with EnInt/Out rows and some zero denominators."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'scenario': rng.choice(['Sc1', 'Sc2', 'Sc3'], n_rows),
+        'state': rng.choice(['NSW', 'VIC', 'QLD', 'SA', 'WA'], n_rows),
+        'sector': 'Commercial',
+        'subsector_p': rng.choice(['Office', 'Retail', 'Hosp'], n_rows),
+        'enduse': rng.choice(['Heating', 'Cooling', 'Lighting'], n_rows),
+        'start_fuel': rng.choice(['Gas', 'Electricity'], n_rows),
+        'end_fuel': rng.choice(['Gas', 'Electricity', 'Hydrogen'], n_rows),
+        'unit': 'PJ',
+        'year': rng.choice([2020, 2025, 2030, 2040, 2050], n_rows),
+        'varbl': rng.choice(['IESTCS_EnInt', 'IESTCS_Out', 'Other'], n_rows, p=[0.4, 0.5, 0.1]),
+        'val': rng.random(n_rows) * 10,
+        'val~den': np.where(rng.random(n_rows) < 0.1, 0, rng.random(n_rows) * 5),
+    })
+
+
+def legacy_eint(df):
+    """The iterrows loop previously used in processing.py."""
+    df = df.sort_values(by=SORT_COLS)
+    value = 0
+    eint_list = []
+    for _, row in df.iterrows():
+        if row['varbl'] == 'IESTCS_EnInt':
+            value = row['val'] / row['val~den'] if row['val~den'] != 0 else 0
+            eint_list.append(None)
+        elif row['varbl'] == 'IESTCS_Out':
+            eint_list.append(value)
+        else:
+            eint_list.append(None)
+    df['EInt'] = eint_list
+    return df
+
+
+def main(n_rows=50_000):
+    df = make_frame(n_rows)
+
+    start = time.perf_counter()
+    expected = legacy_eint(df)
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = calculate_eint(df, SORT_COLS)
+    engine_time = time.perf_counter() - start
+
+    pd.testing.assert_series_equal(result['EInt'], expected['EInt'].astype(float))
+    print(f'{n_rows} rows: loop {legacy_time:.3f}s, engine {engine_time:.3f}s '
+          f'({legacy_time / engine_time:.0f}x), results identical')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50_000)
@@ -0,0 +1,151 @@
+"""Benchmark suite: times each processing module, the energy pivot and gap fill, and the export on synthetic inputs.
+
+Run from the austimes-results-processing directory:
+    python benchmarks/bench_pipeline.py [--rows N] [--scenarios N] [--states N] [--repeat N] [--no-memory]
+
+Each stage's best time over --repeat runs, and its peak traced memory, is
+printed next to the last recorded run at the same scale, then appended to
+HISTORY_FILE with the current git commit so results can be compared across
+commits. Inputs are generated by synthetic_inputs.py into a temporary
+directory and read without the input cache.
+"""
+import argparse
+import contextlib
+import io
+import json
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import processing  # noqa: E402
+from directories import Directories  # noqa: E402
+from gap_filling import gap_fill, gap_fill_long  # noqa: E402
+from input_cache import set_cache_enabled  # noqa: E402
+from output_writers import HAS_PYARROW, output_writer  # noqa: E402
+from synthetic_inputs import generate_inputs  # noqa: E402
+
+HISTORY_FILE = Path(Directories().CACHE_PATH) / 'benchmarks.jsonl'
+
+
+def git_commit():
+    """Short hash of the checked out commit, marked '+dirty' with uncommitted changes, or None outside git."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True,
+                               text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ('+dirty' if dirty else '')
+
+
+def measure(func, repeat=3, memory=True):
+    """Runs func repeat times, returning its last result, the best time in seconds and the peak memory in MB.
+
+    Peak memory is traced in one extra run, so tracing doesn't slow the timed
+    runs. Output printed by func is suppressed.
+    """
+    best = float('inf')
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = func()
+            best = min(best, time.perf_counter() - start)
+        peak_mb = None
+        if memory:
+            tracemalloc.start()
+            try:
+                func()
+                peak_mb = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+            finally:
+                tracemalloc.stop()
+    return result, best, peak_mb
+
+
+def run_benchmarks(input_path, output_path, repeat=3, memory=True):
+    """Times every stage on the inputs in input_path, returning {stage: {'seconds': ..., 'peak_mb': ...}}."""
+    processing.INPUT_PATH = Path(input_path)
+    set_cache_enabled(False)
+    stages = {}
+
+    def stage(name, func):
+        result, seconds, peak_mb = measure(func, repeat, memory)
+        stages[name] = {'seconds': seconds, 'peak_mb': peak_mb}
+        print(f'{name:<28} {seconds:8.3f}s' + (f' {peak_mb:9.1f} MB' if peak_mb is not None else ''))
+        return result
+
+    results = {name: stage(f'module {name}', func) for name, func in processing.MODULES.items()}
+
+    energy = stage('combine energy', lambda: processing.combine_sums(
+        [results[name] for name in processing.ENERGY_MODULES]))
+    pivot = stage('pivot energy', lambda: energy.unstack('year', fill_value=0))
+    all_energy = stage('gap fill energy', lambda: gap_fill(pivot).reset_index())
+    stage('gap fill energy (long)', lambda: gap_fill_long(energy, fill_value=0))
+
+    tables = {'energy_all_sectors': all_energy, 'elec_gen': results['elec_cap_gen'], 'h2_gen': results['h2'],
+              'emissions': results['emissions'], 'energy_efficiency': results['energy_efficiency']}
+    for output_format in ['csv', 'parquet', 'feather'] if HAS_PYARROW else ['csv']:
+        writer = output_writer(output_format)
+        stage(f'export {output_format}', lambda: [writer.write(table, output_path, name)
+                                                  for name, table in tables.items()])
+    return stages
+
+
+def previous_run(history_file, scale):
+    """The last recorded run at the same scale, or None."""
+    if not history_file.exists():
+        return None
+    with open(history_file) as f:
+        runs = [json.loads(line) for line in f if line.strip()]
+    return next((run for run in reversed(runs) if run['scale'] == scale), None)
+
+
+def compare(stages, previous):
+    """Prints each stage's time against the previous run's."""
+    print(f'\nCompared with {previous["commit"]} ({previous["time"]}):')
+    for name, result in stages.items():
+        before = previous['stages'].get(name)
+        if before is None:
+            print(f'{name:<28} {result["seconds"]:8.3f}s  (new)')
+            continue
+        change = (result['seconds'] - before['seconds']) / before['seconds'] * 100 if before['seconds'] else 0
+        print(f'{name:<28} {result["seconds"]:8.3f}s  was {before["seconds"]:8.3f}s  {change:+6.1f}%')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the processing pipeline on synthetic inputs')
+    parser.add_argument('--rows', type=int, default=100_000, help='rows per input file')
+    parser.add_argument('--scenarios', type=int, default=3)
+    parser.add_argument('--states', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per stage (the best is kept)')
+    parser.add_argument('--no-memory', action='store_true', help='skip the peak memory runs')
+    parser.add_argument('--no-history', action='store_true', help=f'do not record the results in {HISTORY_FILE}')
+    args = parser.parse_args()
+    scale = {'rows': args.rows, 'scenarios': args.scenarios, 'states': args.states, 'seed': args.seed}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        generate_inputs(Path(tmp) / 'inputs', rows=args.rows, scenarios=args.scenarios, states=args.states,
+                        seed=args.seed)
+        (Path(tmp) / 'outputs').mkdir()
+        print(f'Synthetic inputs: {scale}')
+        stages = run_benchmarks(Path(tmp) / 'inputs', Path(tmp) / 'outputs', args.repeat, not args.no_memory)
+
+    previous = previous_run(HISTORY_FILE, scale)
+    if previous is not None:
+        compare(stages, previous)
+    if not args.no_history:
+        run = {'commit': git_commit(), 'time': datetime.now().isoformat(timespec='seconds'), 'scale': scale,
+               'stages': stages}
+        HISTORY_FILE.parent.mkdir(parents=True, exist_ok=True)
+        with open(HISTORY_FILE, 'a') as f:
+            f.write(json.dumps(run) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+"""Synthetic Veda-shaped inputs, for benchmarking and testing at scale without the confidential exports.
+
+Writes every input of processing.py and process_to_sql.py (the INPUT_FILES of
+processing.py, EnEff files included) with the columns in INPUT_SCHEMAS. Labels
+are drawn from the keys of the real mapping files, so processing.py runs on
+the output without unmapped keys. Rows are listed scenario by scenario, as STREAMING requires.
+
+process_to_sql.py runs on the same files, but some of its paths are not
+exercised: emission sectors are those of emis_sector_mapping.csv, so its
+Residential, Commercial and LU_CO2seq emissions rules match no rows, and
+H2 processes are the mapped names of h2_mapping.csv (including the
+H2prd_<type> names it classifies).
+
+Run from the austimes-results-processing directory:
+    python benchmarks/synthetic_inputs.py OUTPUT_DIR [--rows N] [--scenarios N] [--states N] [--years Y ...]
+"""
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from ingestion import INPUT_SCHEMAS  # noqa: E402
+from mappings import MappingRegistry  # noqa: E402
+from process_codes import H2_PROCESS_TYPES  # noqa: E402
+from processing import INPUT_FILES  # noqa: E402
+
+STATES = ['NSW', 'VIC', 'QLD', 'SA', 'WA', 'TAS', 'NT', 'ACT']
+YEARS = [2020, 2025, 2030, 2035, 2040, 2045, 2050]
+FUELS = ['Gas', 'Electricity', 'Coal', 'Diesel', 'Hydrogen', 'Biomass', 'Solar', 'Wind', 'Renewable']
+# Fuel switched to, where '-' (or blank) means no switch
+SWITCH_FUELS = ['-', '-', '-', 'Hydrogen', 'Electricity', None]
+FUEL_SECTORS = ['Coal', 'Gas', 'Renew']
+EMISSION_VARIABLES = ['Emi_CO2', 'Cap_CO2', 'Emi_IndCO2_energy']
+INDUSTRY_EE_CATEGORIES = ['Frontier levers', 'EE 1', 'EE 2', 'EE 3', 'ETI', '-']
+BUILDING_EE_CATEGORIES = ['EE', 'EE new', 'EE existing', '-']
+RESIDENTIAL_TYPES = ['Appt', 'Shou', 'Thou', 'Appartment', 'SingleHouse', 'TownHouse']
+
+
+def mapping_keys(mappings):
+    """Labels for each input column, from the keys of the mapping files they are looked up in."""
+    def keys(name):
+        return [key for key in mappings.table(name).index if isinstance(key, str) and key != '-']
+
+    sd2s = set(keys('sd2s'))
+    h2sector = set(keys('h2sector'))
+    residential = [key for key in keys('sp2s') if key in RESIDENTIAL_TYPES]
+    return {
+        # Transport enduses must also map on from subsector detail to subsector
+        'transport_enduse': [key for key in keys('enduse') if mappings.table('enduse')[key] in sd2s],
+        'enduse': keys('enduse'),
+        'residential_type': residential,
+        'commercial_type': [key for key in keys('sp2s') if key not in residential],
+        'subsector_detail': sorted(sd2s - {'Unassigned energy emissions'}),
+        'subsector_p_cca': keys('spc2sd'),
+        'commodity': keys('com2et'),
+        'tech': keys('t2tech'),
+        'process_code': keys('pc2td'),
+        'h2_process': [key for key in keys('h2tech') if mappings.table('h2tech')[key] in h2sector],
+        'emission_sector': keys('emsector'),
+    }
+
+
+class InputGenerator:
+    """Builds the synthetic input frames for scenarios, states and years, with rows rows each."""
+
+    def __init__(self, keys, rows=10_000, scenarios=2, states=3, years=YEARS, seed=0):
+        self.keys = keys
+        self.rows = rows
+        self.scenarios = [f'Scenario {i + 1}' for i in range(scenarios)]
+        self.states = STATES[:states]
+        self.years = list(years)
+        self.rng = np.random.default_rng(seed)
+
+    def choice(self, values, p=None):
+        return self.rng.choice(np.array(values, dtype=object), self.rows, p=p)
+
+    def base(self, **columns):
+        """Common columns plus columns (values, or lists of values to draw from), listed scenario by scenario."""
+        df = pd.DataFrame({
+            'scenario': np.sort(self.choice(self.scenarios)),
+            'study': 'Synthetic',
+            'state': self.choice(self.states),
+            'year': self.choice(self.years),
+            'val': self.rng.random(self.rows) * 100,
+        })
+        for column, values in columns.items():
+            df[column] = self.choice(values) if isinstance(values, list) else values
+        return df
+
+    def energy_intensity(self, df):
+        """Adds the EnInt/Out rows and denominators (some zero) that EInt is calculated from."""
+        df['varbl'] = self.choice(['IESTCS_EnInt', 'IESTCS_Out', 'Other'], p=[0.4, 0.5, 0.1])
+        df['val~den'] = np.where(self.rng.random(self.rows) < 0.05, 0, self.rng.random(self.rows) * 50)
+        return df
+
+    def transport(self):
+        return self.base(sector_p='Transport', enduse=self.keys['transport_enduse'], fuel=FUELS[:6], unit='PJ')
+
+    def commercial(self):
+        return self.energy_intensity(self.base(
+            sector_p='Commercial', subsector_p='Commercial', enduse=self.keys['enduse'],
+            buildingtype=self.keys['commercial_type'], fuel=FUELS[:6], fuel_override=SWITCH_FUELS, unit='PJ'))
+
+    def residential(self):
+        return self.base(sector_p='Residential', subsector_p=self.keys['residential_type'], enduse=self.keys['enduse'],
+                         fuel=FUELS[:6], fuel_switched=SWITCH_FUELS, unit='PJ')
+
+    def industry(self):
+        return self.energy_intensity(self.base(
+            sector_p='Industry', subsector_p=['Ind', 'Min', 'Agr'], subsector_c=self.keys['subsector_detail'],
+            fuel=FUELS[:6], fuel_override=SWITCH_FUELS, unit='PJ'))
+
+    def power(self):
+        return self.base(sector_p='Power', tech=self.keys['tech'], technology0_process=FUEL_SECTORS, fuel=FUELS,
+                         fuel_override=SWITCH_FUELS, unit='PJ')
+
+    def emissions(self):
+        df = self.base(sector_p=self.keys['emission_sector'], subsector_c=self.keys['subsector_detail'] + ['-'],
+                       subsector_p_cca=self.keys['subsector_p_cca'] + ['-'], enduse=self.keys['enduse'],
+                       tech=self.keys['tech'], commodity=self.keys['commodity'], varbl=EMISSION_VARIABLES,
+                       source=['-'] * 9 + ['Process Negative Emissions'])
+        df['source_p'] = df['source']
+
+        # subsector_p is a building type for buildings, and '-' or a subsector detail for industry
+        buildings = df['sector_p'] == 'Buildings'
+        industry = df['sector_p'] == 'Industry'
+        df['subsector_p'] = '-'
+        df.loc[buildings, 'subsector_p'] = self.choice(self.keys['residential_type'] + self.keys['commercial_type'])[buildings]
+        df.loc[industry, 'subsector_p'] = self.choice(self.keys['subsector_detail'] + ['-'] * 20)[industry]
+        transport = df['sector_p'] == 'Transport'
+        df.loc[transport, 'enduse'] = self.choice(self.keys['transport_enduse'])[transport]
+        return df
+
+    def elec_cap_gen(self):
+        df = self.base(sector_p='Power', tech=self.keys['tech'], technology0_process=FUEL_SECTORS,
+                       unit=['GW', 'TWh'])
+        # Process names like 'EE_CCGT01-NSW', with the odd unmapped code
+        codes = self.choice(self.keys['process_code'] + ['Other'])
+        numbers = self.rng.integers(1, 20, self.rows)
+        df['process'] = [f'EE_{code}{number:02d}-{state}' for code, number, state in zip(codes, numbers, df['state'])]
+        return df
+
+    def h2(self):
+        # Mapped names used by processing.py, which include one name for each H2 type classified by process_to_sql.py
+        processes = self.keys['h2_process']
+        missing = [process_type for process_type in H2_PROCESS_TYPES if f'H2prd_{process_type}' not in processes]
+        if missing:
+            raise ValueError(f'h2_mapping.csv has no H2prd_<type> process for H2 types: {", ".join(missing)}')
+        df = self.base(sector_p='Hydrogen', fuel='Hydrogen', process=processes, unit='PJ')
+        df['GrandTotal'] = df['val']
+        return df
+
+    def eneff_ind(self):
+        return self.base(subsector_p=self.keys['subsector_detail'], fuel=FUELS[:6], source=['EE', 'ETI', 'Fuel switch'],
+                         ee_category=INDUSTRY_EE_CATEGORIES, unit='PJ')
+
+    def eneff_bld(self):
+        return self.base(sector_p=['Commercial', 'Residential'], enduse_c=self.keys['enduse'],
+                         buildingtype=self.keys['residential_type'] + self.keys['commercial_type'],
+                         fuel=FUELS[:6], ee_category=BUILDING_EE_CATEGORIES, unit='PJ')
+
+    def frame(self, key):
+        return getattr(self, key)()[INPUT_SCHEMAS[key]]
+
+
+def generate_inputs(path, mapping_path=None, **options):
+    """Writes every synthetic input to path, returning {input key: file}. options are passed to InputGenerator."""
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    mappings = MappingRegistry(mapping_path) if mapping_path else MappingRegistry()
+    generator = InputGenerator(mapping_keys(mappings), **options)
+    files = {}
+    for key, filename in INPUT_FILES.items():
+        files[key] = path / filename
+        generator.frame(key).to_csv(files[key], index=False)
+    return files
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write synthetic Veda-shaped input files')
+    parser.add_argument('output_dir', help='directory to write the inputs to')
+    parser.add_argument('--rows', type=int, default=10_000, help='rows per input file')
+    parser.add_argument('--scenarios', type=int, default=2)
+    parser.add_argument('--states', type=int, default=3, help=f'number of states (up to {len(STATES)})')
+    parser.add_argument('--years', type=int, nargs='+', default=YEARS, help='reported (milestone) years')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    files = generate_inputs(args.output_dir, rows=args.rows, scenarios=args.scenarios, states=args.states,
+                            years=args.years, seed=args.seed)
+    print(f'Wrote {len(files)} inputs of {args.rows} rows to {args.output_dir}')
+
+
+if __name__ == '__main__':
+    main()
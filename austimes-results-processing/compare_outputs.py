@@ -0,0 +1,277 @@
+import argparse
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from directories import Directories
+from output_writers import OUTPUT_WRITERS
+
+# ---------------------------------------------
+# Output comparison
+# ---------------------------------------------
+# Compares two output folders (e.g. the last two timestamped runs) table by
+# table. Rows are matched on their key columns (every column other than the
+# year columns of wide tables, or the value column of long ones) with a hash
+# join, and the values of matched rows compared year by year as arrays. Cells
+# whose value moved by more than the thresholds are written to a change report
+# in the report folder:
+#
+#     summary.csv            per table: rows, keys added and removed, cells changed, largest change,
+#                            key columns added and removed
+#     year_totals.csv        per table and year: old and new totals and cells changed
+#     <table>_changes.csv    each changed cell: keys, year, old and new values, change and status
+#
+# A table whose key columns changed between the runs (e.g. a new breakdown
+# column) is compared on the keys both versions share, each version summed
+# over its other keys; the summary lists the key columns added and removed.
+#
+# Tables in CSV, Parquet (including partitioned folders) and Feather are read,
+# so runs written in different formats can be compared. For outputs too large
+# to compare in memory, buckets > 1 streams both tables in chunks into that
+# many spill files by a hash of their keys, then compares one bucket at a time.
+#
+# Run from the austimes-results-processing directory:
+#     python compare_outputs.py OLD_DIR NEW_DIR [--report DIR] [--abs-tol X] [--rel-tol X] [--buckets N]
+
+OUTPUT_SUFFIXES = [writer.suffix for writer in OUTPUT_WRITERS.values()]
+ABS_TOL = 1e-9      # Changes up to this size are ignored (e.g. rounding from summing in a different order)
+REL_TOL = 0.0       # Changes up to this fraction of the old value are ignored
+CHUNK_ROWS = 1_000_000
+
+CACHE_PATH = Path(Directories().CACHE_PATH)
+
+
+def output_tables(directory):
+    """Output tables in directory, {name: path}, with partitioned Parquet folders (name.parquet/) as single tables."""
+    return {path.stem: path for path in sorted(Path(directory).iterdir()) if path.suffix in OUTPUT_SUFFIXES}
+
+
+def _dataset(path):
+    import pyarrow.dataset as ds
+    if path.is_dir():
+        return ds.dataset(path, format='parquet', partitioning='hive')
+    return ds.dataset(path, format='feather' if path.suffix == '.feather' else 'parquet')
+
+
+def table_columns(path):
+    """Column labels of an output table, without reading its rows."""
+    path = Path(path)
+    if path.suffix == '.csv':
+        return list(pd.read_csv(path, nrows=0).columns)
+    return _dataset(path).schema.names
+
+
+def iter_table(path, chunk_rows=None):
+    """Reads an output table, all at once or (with chunk_rows) in frames of up to chunk_rows rows."""
+    path = Path(path)
+    if path.suffix == '.csv':
+        if chunk_rows is None:
+            yield pd.read_csv(path)
+            return
+        with pd.read_csv(path, chunksize=chunk_rows) as reader:
+            yield from reader
+        return
+    dataset = _dataset(path)
+    if chunk_rows is None:
+        yield dataset.to_table().to_pandas()
+        return
+    for batch in dataset.to_batches(batch_size=chunk_rows):
+        yield batch.to_pandas()
+
+
+def split_columns(columns):
+    """Key and value columns of a table: one value column per year if wide, or year as a key if long."""
+    if 'year' in columns and 'value' in columns:
+        return [col for col in columns if col != 'value'], ['value']
+    years = [col for col in columns if str(col).isdigit()]
+    return [col for col in columns if col not in years], years
+
+
+def sum_over(df, keys, values):
+    """df summed over its columns other than keys and values, by keys (cells with no values stay missing)."""
+    values = [col for col in values if col in df.columns]
+    return df.groupby(keys, dropna=False, observed=True, sort=False)[values].sum(min_count=1).reset_index()
+
+
+class TableDiff:
+    """Changes between the old and new versions of a table, added up over parts with distinct keys.
+
+    keys_added and keys_removed are the key columns only in the new or old
+    version, which the versions are summed over before comparing.
+    """
+
+    def __init__(self, name, keys, values, abs_tol=ABS_TOL, rel_tol=REL_TOL, keys_added=(), keys_removed=()):
+        self.name = name
+        self.keys = keys
+        self.keys_added = list(keys_added)
+        self.keys_removed = list(keys_removed)
+        self.values = values
+        self.abs_tol = abs_tol
+        self.rel_tol = rel_tol
+        self.wide = values != ['value']
+        self.counts = {'rows_old': 0, 'rows_new': 0, 'keys_added': 0, 'keys_removed': 0, 'cells_changed': 0,
+                       'max_abs_change': 0.0}
+        self.totals = []
+
+    def compare(self, old, new):
+        """Compares the rows of old and new (all the rows of their keys), returning the changed cells."""
+        if self.keys_removed:
+            old = sum_over(old, self.keys, self.values)
+        if self.keys_added:
+            new = sum_over(new, self.keys, self.values)
+        # Object keys, so parts read with different dtypes (e.g. categoricals, or all-NaN columns) still match
+        old = old.reindex(columns=self.keys + self.values).astype({key: object for key in self.keys})
+        new = new.reindex(columns=self.keys + self.values).astype({key: object for key in self.keys})
+        merged = old.merge(new, on=self.keys, how='outer', suffixes=(' old', ' new'), indicator=True,
+                           validate='one_to_one')
+        old_values = merged[[f'{col} old' for col in self.values]].to_numpy(dtype=float)
+        new_values = merged[[f'{col} new' for col in self.values]].to_numpy(dtype=float)
+
+        # Missing cells count as zero change from or to nothing; the status records which side is missing
+        change = np.nan_to_num(new_values) - np.nan_to_num(old_values)
+        abs_change = np.abs(change)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rel_change = abs_change / np.abs(old_values)
+        changed = (abs_change > self.abs_tol) & ~(rel_change <= self.rel_tol)
+
+        side = merged['_merge']
+        self.counts['rows_old'] += int((side != 'right_only').sum())
+        self.counts['rows_new'] += int((side != 'left_only').sum())
+        self.counts['keys_added'] += int((side == 'right_only').sum())
+        self.counts['keys_removed'] += int((side == 'left_only').sum())
+        self.counts['cells_changed'] += int(changed.sum())
+        if changed.any():
+            self.counts['max_abs_change'] = max(self.counts['max_abs_change'], float(abs_change[changed].max()))
+        self.totals.append(self._year_totals(merged, old_values, new_values, changed))
+
+        rows, cols = np.nonzero(changed)
+        changes = merged[self.keys].iloc[rows].reset_index(drop=True)
+        if self.wide:
+            changes['year'] = np.array([int(col) for col in self.values])[cols]
+        old_cells, new_cells = old_values[rows, cols], new_values[rows, cols]
+        changes['old'] = old_cells
+        changes['new'] = new_cells
+        changes['change'] = change[rows, cols]
+        changes['rel_change'] = changes['change'] / np.abs(old_cells)
+        changes['status'] = np.where(np.isnan(old_cells), 'added', np.where(np.isnan(new_cells), 'removed', 'changed'))
+        return changes.iloc[np.argsort(-abs_change[rows, cols], kind='stable')]
+
+    def _year_totals(self, merged, old_values, new_values, changed):
+        if self.wide:
+            return pd.DataFrame({
+                'old_total': np.nansum(old_values, axis=0),
+                'new_total': np.nansum(new_values, axis=0),
+                'cells_changed': changed.sum(axis=0),
+            }, index=pd.Index([int(col) for col in self.values], name='year'))
+        cells = pd.DataFrame({'year': merged['year'].to_numpy(), 'old_total': old_values[:, 0],
+                              'new_total': new_values[:, 0], 'cells_changed': changed[:, 0]})
+        return cells.groupby('year').sum()
+
+    def key_changes(self):
+        """Key columns added and removed, for the summary."""
+        return {'key_columns_added': ', '.join(map(str, self.keys_added)),
+                'key_columns_removed': ', '.join(map(str, self.keys_removed))}
+
+    def year_totals(self):
+        """Old and new totals, their difference and the cells changed, by year."""
+        totals = pd.concat(self.totals)
+        totals = totals.groupby(level='year').sum()
+        totals.insert(2, 'change', totals['new_total'] - totals['old_total'])
+        return totals.reset_index()
+
+
+def partition(path, keys, directory, side, buckets, chunk_rows=CHUNK_ROWS):
+    """Spills the rows of the table at path into buckets files in directory, by a hash of their keys."""
+    for i, chunk in enumerate(iter_table(path, chunk_rows)):
+        bucket_ids = pd.util.hash_pandas_object(chunk[keys].astype(str), index=False).to_numpy() % buckets
+        for bucket, part in chunk.groupby(bucket_ids, sort=False):
+            part.to_pickle(Path(directory) / f'{side}-{bucket}-{i}.pkl')
+
+
+def read_bucket(directory, side, bucket, columns):
+    parts = sorted(Path(directory).glob(f'{side}-{bucket}-*.pkl'))
+    if not parts:
+        return pd.DataFrame(columns=columns)
+    return pd.concat([pd.read_pickle(part) for part in parts], ignore_index=True)
+
+
+def compare_table(name, old_path, new_path, changes_path, abs_tol=ABS_TOL, rel_tol=REL_TOL, buckets=1,
+                  chunk_rows=CHUNK_ROWS):
+    """Compares the old and new versions of a table, writing its changed cells to changes_path."""
+    old_keys, old_values = split_columns(table_columns(old_path))
+    new_keys, new_values = split_columns(table_columns(new_path))
+    # Compared on the key columns of both versions
+    keys = [key for key in old_keys if key in new_keys]
+    if not keys:
+        raise ValueError(f'{name} has no key columns in common between the two outputs')
+    values = sorted(set(old_values) | set(new_values), key=str)
+    diff = TableDiff(name, keys, values, abs_tol, rel_tol, keys_added=[key for key in new_keys if key not in keys],
+                     keys_removed=[key for key in old_keys if key not in keys])
+    if diff.keys_added or diff.keys_removed:
+        print(f'{name}: key columns changed, comparing on the shared keys '
+              f'(added: {", ".join(map(str, diff.keys_added)) or "none"}; '
+              f'removed: {", ".join(map(str, diff.keys_removed)) or "none"})')
+
+    if buckets == 1:
+        changes = diff.compare(next(iter_table(old_path)), next(iter_table(new_path)))
+        changes.to_csv(changes_path, index=False)
+        return diff
+
+    CACHE_PATH.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=CACHE_PATH) as spill:
+        partition(old_path, keys, spill, 'old', buckets, chunk_rows)
+        partition(new_path, keys, spill, 'new', buckets, chunk_rows)
+        for bucket in range(buckets):
+            changes = diff.compare(read_bucket(spill, 'old', bucket, old_keys + old_values),
+                                   read_bucket(spill, 'new', bucket, new_keys + new_values))
+            changes.to_csv(changes_path, index=False, mode='w' if bucket == 0 else 'a', header=bucket == 0)
+    return diff
+
+
+def compare_outputs(old_dir, new_dir, report_dir, tables=None, **options):
+    """Compares the tables found in both output folders (or just tables), writing the change report to report_dir.
+
+    options are passed to compare_table. Returns the summary, one row per table.
+    """
+    old_tables, new_tables = output_tables(old_dir), output_tables(new_dir)
+    names = [name for name in old_tables if name in new_tables] if tables is None else tables
+    missing = [name for name in names if name not in old_tables or name not in new_tables]
+    if missing:
+        raise ValueError(f'Tables not in both outputs: {", ".join(missing)}')
+
+    report_dir = Path(report_dir)
+    report_dir.mkdir(parents=True, exist_ok=True)
+    summary, totals = [], []
+    for name in names:
+        diff = compare_table(name, old_tables[name], new_tables[name], report_dir / f'{name}_changes.csv', **options)
+        summary.append({'table': name, **diff.counts, **diff.key_changes()})
+        totals.append(diff.year_totals().assign(table=name))
+    summary = pd.DataFrame(summary)
+    summary.to_csv(report_dir / 'summary.csv', index=False)
+    totals = pd.concat(totals, ignore_index=True)
+    totals[['table'] + [col for col in totals.columns if col != 'table']].to_csv(report_dir / 'year_totals.csv',
+                                                                                 index=False)
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the tables of two output folders')
+    parser.add_argument('old_dir', type=Path, help='output folder to compare against (e.g. the previous run)')
+    parser.add_argument('new_dir', type=Path, help='output folder to compare')
+    parser.add_argument('--report', type=Path, help='folder for the change report (default: in NEW_DIR)')
+    parser.add_argument('--tables', nargs='+', help='tables to compare (default: every table in both folders)')
+    parser.add_argument('--abs-tol', type=float, default=ABS_TOL, help='ignore changes up to this size')
+    parser.add_argument('--rel-tol', type=float, default=REL_TOL,
+                        help='ignore changes up to this fraction of the old value')
+    parser.add_argument('--buckets', type=int, default=1,
+                        help='compare in this many parts by key hash, streaming the inputs (for large outputs)')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS, help='rows read at a time when streaming')
+    args = parser.parse_args()
+
+    report_dir = args.report or args.new_dir / f'changes_since_{args.old_dir.name}'
+    summary = compare_outputs(args.old_dir, args.new_dir, report_dir, args.tables, abs_tol=args.abs_tol,
+                              rel_tol=args.rel_tol, buckets=args.buckets, chunk_rows=args.chunk_rows)
+    print(summary.to_string(index=False))
+    print(f'Change report written to {report_dir}')
@@ -2,4 +2,6 @@ class Directories:
     def __init__(self):
         self.INPUT_PATH = "inputs/"
         self.OUTPUT_PATH = "outputs/"
-        self.MAPPING_PATH = "mapping/"
\ No newline at end of file
+        self.MAPPING_PATH = "mapping/"
+        self.CACHE_PATH = "cache/"
+        self.TEMPLATE_PATH = "templates/"
\ No newline at end of file
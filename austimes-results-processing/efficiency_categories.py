@@ -0,0 +1,46 @@
+from process_codes import parse_unique
+
+# ---------------------------------------------
+# Energy efficiency categories
+# ---------------------------------------------
+# The Core EnEff inputs label their savings with Veda's ee_category (and, for
+# buildings, sector_p). Both scripts translate these to output categories
+# through the tables below, looking up each distinct label once (the
+# categories, for categorical columns) and spreading the results over the
+# rows. Labels not in a table, and missing labels, are given UNLISTED.
+
+UNLISTED = '-'
+
+# Efficiency category of each ee_category, by input (an INPUT_SCHEMAS key)
+EFFICIENCY_CATEGORIES = {
+    'eneff_ind': {
+        'Frontier levers': 'Frontier levers',
+        'EE 1': 'Process improvements',
+        'EE 2': 'Small equipment upgrades',
+        'EE 3': 'Major equipment upgrades',
+        'ETI': 'ETI upgrade',
+    },
+    'eneff_bld': {
+        'EE': 'Commercial general',
+        'EE new': 'Residential new',
+        'EE existing': 'Residential existing',
+    },
+}
+
+# Sector of each buildings sector_p
+BUILDING_SECTORS = {'Commercial': 'Commercial buildings', 'Residential': 'Residential buildings'}
+
+
+def lookup(labels, table):
+    """Value in table (a dict) of each label of a Series, or UNLISTED, as an object Series aligned with labels."""
+    return parse_unique(labels, lambda values: values.map(table)).fillna(UNLISTED)
+
+
+def efficiency_categories(ee_category, key):
+    """Efficiency category of each ee_category of the input key ('eneff_ind' or 'eneff_bld')."""
+    return lookup(ee_category, EFFICIENCY_CATEGORIES[key])
+
+
+def building_sectors(sector_p):
+    """Sector of each buildings sector_p."""
+    return lookup(sector_p, BUILDING_SECTORS)
@@ -0,0 +1,189 @@
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+# ---------------------------------------------
+# Emissions classification rules
+# ---------------------------------------------
+# Emissions rows are classified into sector, subsector, subsector_detail and
+# emis_type by an ordered list of rules:
+#
+#     Rule(name, when, assign, unless)
+#
+# A rule applies to the rows matching every condition in when and none in
+# unless. A condition maps a column to a value, or a list of values, it must
+# be equal to. assign maps each target column to a literal value, a Column
+# (copied from another column) or a Mapped value (looked up in a mapping).
+# Rules run in order, so a later rule can test or overwrite columns set by an
+# earlier one.
+#
+# Rules work on plain arrays of the columns they use, and each condition is
+# evaluated once and reused until a rule rewrites its column.
+
+Rule = namedtuple('Rule', 'name when assign unless', defaults=(None,))
+
+# The value of another column
+Column = namedtuple('Column', 'name')
+
+# column looked up in a mapping of the MappingRegistry. Keys missing from the
+# mapping take fallback (a literal or Column), or are reported if it is None.
+Mapped = namedtuple('Mapped', 'mapping column fallback', defaults=(None,))
+
+# Label Veda gives unassigned classifications
+BLANK = '-'
+
+BUILDINGS = ['Residential buildings', 'Commercial buildings']
+CDR = 'Carbon dioxide removal'
+
+EMISSION_RULES = {
+    # processing.py: sectors from emis_sector_mapping.csv, with industry
+    # subsectors falling back to subsector_p_cca
+    'processing': [
+        Rule('sector from sector mapping', {}, {'sector': Mapped('emsector', 'sector_p')}),
+        Rule('industry subsector_detail', {'sector': 'Industry'}, {'subsector_detail': Column('subsector_c')}),
+        Rule('industry subsector_detail from subsector_p_cca', {'sector': 'Industry', 'subsector_detail': BLANK},
+             {'subsector_detail': Mapped('spc2sd', 'subsector_p_cca', Column('subsector_p_cca'))}),
+        Rule('industry unassigned subsector_detail', {'sector': 'Industry', 'subsector_detail': BLANK},
+             {'subsector_detail': 'Unassigned emissions'}),
+        Rule('industry subsector', {'sector': 'Industry'},
+             {'subsector': Mapped('sd2s', 'subsector_detail', 'Unassigned emissions')}),
+        Rule('transport and buildings subsectors', {'sector': ['Transport'] + BUILDINGS},
+             {'subsector_detail': Mapped('enduse', 'enduse'), 'subsector': Mapped('sp2s', 'subsector_p')}),
+        Rule('land use sequestration', {'sector': CDR, 'sector_p': 'LU_CO2seq'},
+             {'subsector_detail': 'Land use sequestration'}),
+        Rule('direct air capture', {'sector': CDR, 'sector_p': 'DAC'}, {'subsector_detail': 'Direct air capture'}),
+        Rule('land removals', {'sector': CDR, 'subsector_detail': 'Land use sequestration'}, {'subsector': 'Land'}),
+        Rule('engineered removals', {'sector': CDR, 'subsector_detail': 'Direct air capture'},
+             {'subsector': 'Engineered'}),
+        Rule('other removals', {'sector': CDR}, {'subsector': '-'},
+             unless={'subsector_detail': ['Land use sequestration', 'Direct air capture']}),
+        Rule('power and hydrogen subsector', {'sector': ['Power', 'Hydrogen']}, {'subsector': Column('tech')}),
+        Rule('emission type from commodity', {}, {'emis_type': Mapped('com2et', 'commodity', '-')}),
+        Rule('industry energy emissions', {'sector': 'Industry', 'varbl': 'Emi_CO2', 'commodity': 'INDCO2N'},
+             {'emis_type': 'Energy'}),
+        Rule('industry process emissions', {'sector': 'Industry', 'varbl': 'Emi_CO2', 'commodity': 'INDCO2P'},
+             {'emis_type': 'Process'}),
+        Rule('industry capture', {'sector': 'Industry', 'varbl': 'Cap_CO2'}, {'emis_type': 'Capture'}),
+        Rule('industry energy emissions (IndCO2)', {'sector': 'Industry', 'varbl': 'Emi_IndCO2_energy'},
+             {'emis_type': 'Energy'}),
+        Rule('mineral carbonation', {'sector': 'Industry', 'source_p': 'Process Negative Emissions'},
+             {'sector': CDR, 'subsector': 'Engineered', 'subsector_detail': 'Mineral carbonation',
+              'emis_type': 'Sequestration'}),
+        Rule('forestry sequestration',
+             {'sector': 'Industry', 'subsector': 'Forestry and logging', 'emis_type': 'Process'},
+             {'sector': CDR, 'subsector': 'Land', 'subsector_detail': 'Forestry and logging',
+              'emis_type': 'Sequestration'}),
+    ],
+    # process_to_sql.py: sectors from sector_p, industry subsectors from
+    # subsector_p/subsector_c
+    'sql': [
+        Rule('defaults', {}, {'sector': Column('sector_p'), 'subsector': '-', 'subsector_detail': '-',
+                              'emis_type': ''}),
+        Rule('carbon dioxide removal sector', {'sector_p': ['LU_CO2seq', 'DAC']}, {'sector': CDR}),
+        Rule('residential sector', {'sector_p': 'Residential'}, {'sector': 'Residential buildings'}),
+        Rule('commercial sector', {'sector_p': 'Commercial'}, {'sector': 'Commercial buildings'}),
+        Rule('industry subsector_detail', {'sector': 'Industry'}, {'subsector_detail': Column('subsector_p')}),
+        Rule('industry subsector_detail from subsector_c', {'sector': 'Industry', 'subsector_p': '-'},
+             {'subsector_detail': Column('subsector_c')}, unless={'subsector_c': '-'}),
+        Rule('industry unassigned emissions', {'sector': 'Industry', 'subsector_p': '-', 'subsector_c': '-'},
+             {'subsector_detail': 'Unassigned energy emissions'}),
+        Rule('industry land use sequestration',
+             {'sector': 'Industry', 'subsector_p': '-', 'subsector_c': '-', 'commodity': 'UC_Bld_LU_CO2seq-'},
+             {'subsector_detail': 'UC_Bld_LU_CO2seq-'}),
+        Rule('transport and buildings subsector_detail', {'sector': ['Transport'] + BUILDINGS},
+             {'subsector_detail': Mapped('enduse', 'enduse')}),
+        Rule('land use sequestration', {'sector': CDR, 'sector_p': 'LU_CO2seq'},
+             {'subsector_detail': 'Land use sequestration'}),
+        Rule('direct air capture', {'sector': CDR, 'sector_p': 'DAC'}, {'subsector_detail': 'Direct air capture'}),
+        Rule('buildings subsector', {'sector': BUILDINGS}, {'subsector': Mapped('sp2s', 'subsector_p')}),
+        Rule('power and hydrogen subsector', {'sector': ['Power', 'Hydrogen']}, {'subsector': Column('tech')}),
+        Rule('land removals', {'sector': CDR, 'subsector_detail': 'Land use sequestration'}, {'subsector': 'Land'}),
+        Rule('engineered removals', {'sector': CDR, 'subsector_detail': 'Direct air capture'},
+             {'subsector': 'Engineered'}),
+        Rule('transport and industry subsector', {'sector': ['Transport', 'Industry']},
+             {'subsector': Mapped('sd2s', 'subsector_detail')}),
+        Rule('emission type from commodity', {}, {'emis_type': Mapped('com2et', 'commodity')},
+             unless={'sector': 'Industry'}),
+        Rule('industry energy emissions', {'sector': 'Industry', 'varbl': 'Emi_CO2', 'commodity': 'INDCO2N'},
+             {'emis_type': 'Energy'}),
+        Rule('industry process emissions', {'sector': 'Industry', 'varbl': 'Emi_CO2', 'commodity': 'INDCO2P'},
+             {'emis_type': 'Process'}),
+        Rule('industry capture', {'sector': 'Industry', 'varbl': 'Cap_CO2'}, {'emis_type': 'Capture'}),
+        Rule('industry energy emissions (IndCO2)', {'sector': 'Industry', 'varbl': 'Emi_IndCO2_energy'},
+             {'emis_type': 'Energy'}),
+        # Unassigned energy emissions duplicate other rows and are dropped, so are left for the caller to find
+        Rule('mineral carbonation', {'sector': 'Industry', 'source': 'Process Negative Emissions'},
+             {'sector': CDR, 'subsector': 'Engineered', 'subsector_detail': 'Mineral carbonation'},
+             unless={'subsector_detail': 'Unassigned energy emissions'}),
+        Rule('forestry sequestration',
+             {'sector': 'Industry', 'subsector': 'Forestry and logging', 'emis_type': 'Process'},
+             {'sector': CDR, 'subsector': 'Land', 'subsector_detail': 'Forestry and logging',
+              'emis_type': 'Sequestration'}),
+    ],
+}
+
+
+def classify_emissions(df, rules, mappings):
+    """Applies emissions rules to df in place and returns the number of rows each rule applied to.
+
+    rules is either a key of EMISSION_RULES or a list of Rules. mappings is the
+    MappingRegistry used for Mapped values. Target columns are written back as
+    object columns, with NaN where no rule set a value.
+    """
+    if isinstance(rules, str):
+        rules = EMISSION_RULES[rules]
+    columns = {}
+    masks = {}
+
+    def column(name):
+        if name not in columns:
+            if name in df.columns:
+                columns[name] = np.array(df[name], dtype=object)
+            else:
+                columns[name] = np.full(len(df), np.nan, dtype=object)
+        return columns[name]
+
+    def matches(name, values):
+        key = (name, tuple(values) if isinstance(values, list) else values)
+        if key not in masks:
+            values = values if isinstance(values, list) else [values]
+            masks[key] = pd.Series(column(name), copy=False).isin(values).to_numpy()
+        return masks[key]
+
+    counts = {}
+    for rule in rules:
+        rows = np.ones(len(df), dtype=bool)
+        for name, values in rule.when.items():
+            rows &= matches(name, values)
+        for name, values in (rule.unless or {}).items():
+            rows &= ~matches(name, values)
+        counts[rule.name] = int(rows.sum())
+        if not counts[rule.name]:
+            continue
+
+        # Evaluate every value before assigning, so a rule reads the columns as they were before it
+        values = {target: _rule_values(value, rows, column, mappings) for target, value in rule.assign.items()}
+        for target, target_values in values.items():
+            column(target)[rows] = target_values
+            for key in [key for key in masks if key[0] == target]:
+                del masks[key]
+
+    for target in dict.fromkeys(target for rule in rules for target in rule.assign):
+        df[target] = column(target)
+    return pd.Series(counts, name='rows')
+
+
+def _rule_values(value, rows, column, mappings):
+    """Values of a rule's assignment for the selected rows."""
+    if isinstance(value, Column):
+        return column(value.name)[rows]
+    if isinstance(value, Mapped):
+        keys = pd.Series(column(value.column)[rows])
+        mapped = mappings.map(value.mapping, keys, report=value.fallback is None)
+        if isinstance(value.fallback, Column):
+            mapped = mapped.fillna(pd.Series(column(value.fallback.name)[rows]))
+        elif value.fallback is not None:
+            mapped = mapped.fillna(value.fallback)
+        return mapped.to_numpy(dtype=object)
+    return value
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+
+from instrumentation import stage
+
+# ---------------------------------------------
+# Energy intensity (EInt) engine
+# ---------------------------------------------
+# Veda exports the commercial and industry final energy as pairs of rows:
+# an IESTCS_EnInt row holding the intensity ratio (val / val~den) and the
+# IESTCS_Out rows that follow it in sort order. Each IESTCS_Out row takes
+# the ratio of the most recent IESTCS_EnInt row above it.
+
+ENINT_VARBL = 'IESTCS_EnInt'
+OUT_VARBL = 'IESTCS_Out'
+
+
+def eint_ratio(df):
+    """Returns val / val~den for every row, with a zero denominator giving 0."""
+    val = df['val'].to_numpy(dtype=float)
+    den = df['val~den'].to_numpy(dtype=float)
+    ratio = np.zeros(len(df))
+    np.divide(val, den, out=ratio, where=den != 0)
+    # NaN denominators propagate, as they did in the row loop
+    ratio[np.isnan(den)] = np.nan
+    return ratio
+
+
+def carry_forward_eint(df, group_cols=None):
+    """Carries the last IESTCS_EnInt ratio forward onto the following IESTCS_Out rows.
+
+    df must already be in the order the ratios should be carried in. Rows that
+    are not IESTCS_Out get NaN. IESTCS_Out rows with no IESTCS_EnInt row above
+    them get 0. By default the ratio carries across group boundaries, exactly as
+    the original row loop did; pass group_cols to restart the carry per group.
+    """
+    varbl = df['varbl'].to_numpy()
+    is_enint = varbl == ENINT_VARBL
+    is_out = varbl == OUT_VARBL
+
+    # Position of the most recent IESTCS_EnInt row at or above each row
+    if group_cols:
+        group_ids = df.groupby(group_cols, sort=False, dropna=False).ngroup().to_numpy()
+        group_start = np.diff(group_ids, prepend=-1) != 0
+        last_enint = _carry_within_groups(is_enint, group_start)
+    else:
+        last_enint = np.maximum.accumulate(np.where(is_enint, np.arange(len(df)), -1))
+
+    ratio = eint_ratio(df)
+    eint = np.where(last_enint >= 0, ratio[np.maximum(last_enint, 0)], 0.0)
+    return pd.Series(np.where(is_out, eint, np.nan), index=df.index, name='EInt')
+
+
+def _carry_within_groups(is_enint, group_start):
+    """Index of the latest IESTCS_EnInt row in the same group, or -1."""
+    positions = np.arange(len(is_enint))
+    # Offsetting each group past the previous one stops the running max leaking across groups
+    group_ids = np.cumsum(group_start) - 1
+    offset = group_ids * (len(is_enint) + 1)
+    marked = np.where(is_enint, positions + offset, offset - 1)
+    carried = np.maximum.accumulate(marked) - offset
+    return np.where(carried >= 0, carried, -1)
+
+
+def calculate_eint(df, sort_cols, group_cols=None):
+    """Sorts df by sort_cols and adds the carried-forward energy intensity as 'EInt'."""
+    with stage('EInt', rows_in=len(df)):
+        df = df.sort_values(by=sort_cols)
+        df['EInt'] = carry_forward_eint(df, group_cols)
+    return df
@@ -0,0 +1,83 @@
+from functools import partial
+from pathlib import Path
+
+from openpyxl import Workbook, load_workbook
+from openpyxl.utils import get_column_letter, quote_sheetname
+from openpyxl.workbook.defined_name import DefinedName
+
+from scheduler import run_modules
+
+# ---------------------------------------------
+# Excel visualisation templates
+# ---------------------------------------------
+# Each template workbook has data sheets that its charts and tables read from.
+# A template is filled by loading it, replacing each data sheet with one of
+# the processed output tables, and saving the result to the output directory
+# under the template's name (the template itself is left unchanged):
+#
+#     {template file: {data sheet: output table}}
+#
+# Data sheets are replaced whole, so charts and formatting belong on other
+# sheets. Rows are appended in bulk rather than written cell by cell, and
+# templates are filled side by side in worker processes. A workbook-level
+# defined name with the same name as an output table is pointed at the rows
+# written, so charts and pivot tables built on it take in every row.
+
+
+def create_stub_template(path, sheets):
+    """Writes a minimal template with the given empty sheets, for trying out or testing the export."""
+    wb = Workbook(write_only=True)
+    for sheet in sheets:
+        wb.create_sheet(sheet)
+    wb.save(path)
+    return Path(path)
+
+
+def write_table(wb, sheet, df, name=None):
+    """Replaces sheet (or adds it, if missing) with df, with its column labels as the header row.
+
+    If the workbook defines name, it is pointed at the range written.
+    """
+    index = None
+    if sheet in wb.sheetnames:
+        index = wb.sheetnames.index(sheet)
+        wb.remove(wb[sheet])
+    ws = wb.create_sheet(sheet, index)
+
+    ws.append(list(df.columns))
+    values = df.astype(object).where(df.notna(), None)
+    for row in values.itertuples(index=False, name=None):
+        ws.append(row)
+
+    if name is not None and name in wb.defined_names:
+        ref = f'{quote_sheetname(sheet)}!$A$1:${get_column_letter(max(len(df.columns), 1))}${len(df) + 1}'
+        wb.defined_names[name] = DefinedName(name, attr_text=ref)
+    return ws
+
+
+def fill_template(template, output, tables):
+    """Fills a copy of template with tables ({sheet: (table name, DataFrame)}) and saves it as output."""
+    template = Path(template)
+    wb = load_workbook(template, keep_vba=template.suffix.lower() == '.xlsm')
+    for sheet, (name, df) in tables.items():
+        write_table(wb, sheet, df, name)
+    wb.save(output)
+    return Path(output)
+
+
+def export_templates(templates, template_path, output_dir, tables, max_workers=None, parallel=True):
+    """Fills each template in templates with the output tables, returning the paths written.
+
+    templates maps a template file in template_path to {sheet: table name},
+    and tables maps table names to DataFrames.
+    """
+    jobs = {}
+    for template, sheets in templates.items():
+        missing = [name for name in sheets.values() if name not in tables]
+        if missing:
+            raise ValueError(f'{template} uses unknown output tables: {", ".join(missing)}')
+        sheet_tables = {sheet: (name, tables[name]) for sheet, name in sheets.items()}
+        jobs[template] = partial(fill_template, Path(template_path) / template, Path(output_dir) / template,
+                                 sheet_tables)
+    written = dict(run_modules(jobs, max_workers=max_workers, parallel=parallel))
+    return {template: written[template] for template in jobs}
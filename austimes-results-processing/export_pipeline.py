@@ -0,0 +1,85 @@
+import queue
+import threading
+import time
+
+from instrumentation import add_records, measure, stage, stage_path
+
+# ---------------------------------------------
+# Export pipeline
+# ---------------------------------------------
+# Output tables are handed to the pipeline as soon as each is ready and
+# written by a background thread, while the remaining modules are still
+# processing (or, with parallel modules, while this process waits on the
+# workers). Once a table is written the pipeline drops it, so a table the
+# caller doesn't keep is freed without waiting for the rest of the run. At
+# most max_pending tables wait to be written; beyond that submit waits, so a
+# slow disk holds back processing rather than piling up tables in memory.
+#
+# stage() can't be used from the writer thread, so each write is measured
+# there and recorded, as 'export <table>' under the stage it was submitted
+# in, when the pipeline is closed.
+
+
+class ExportPipeline:
+    """Writes tables to directory with writer, in a background thread (or, with background=False, as submitted).
+
+    Used as a context manager: leaving the block waits for the queued tables
+    to be written and raises the first error of the writer thread.
+    """
+
+    def __init__(self, writer, directory, background=True, max_pending=2):
+        self.writer = writer
+        self.directory = directory
+        self.background = background
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.errors = []
+        self.records = {}
+        self.thread = None
+        if background:
+            self.thread = threading.Thread(target=self._work, name='export-writer', daemon=True)
+            self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self._stop()
+        add_records(self.records)
+        if exc_type is None and self.errors:
+            raise self.errors[0]
+        return False
+
+    def submit(self, name, df):
+        """Writes df as table name, or queues it to be written, waiting while max_pending tables are queued."""
+        if not self.background:
+            with stage(f'export {name}', rows_in=len(df)):
+                self.writer.write(df, self.directory, name)
+            return
+        if self.errors:
+            raise self.errors[0]
+        self.queue.put((stage_path(f'export {name}'), name, df))
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            if not self.errors:
+                self._write(*item)
+            # Not held while waiting for the next table
+            del item
+
+    def _write(self, path, name, df):
+        try:
+            with measure(rows_in=len(df), cpu_clock=time.thread_time) as record:
+                self.writer.write(df, self.directory, name)
+        except Exception as error:
+            self.errors.append(error)
+            return
+        self.records[path] = record
+
+    def _stop(self):
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
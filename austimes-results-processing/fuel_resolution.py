@@ -0,0 +1,75 @@
+# ---------------------------------------------
+# Fuel resolution
+# ---------------------------------------------
+# Veda reports fuel switching through a second fuel column (fuel_override in
+# most sectors, fuel_switched in residential) that is '-' or blank when no
+# switch happened. Each sector's start_fuel/end_fuel are resolved from the raw
+# columns by an ordered list of rules:
+#
+#     (target, source, fallback)
+#
+# target takes the value of source, or of fallback wherever source is blank.
+# A fallback of None copies source as is. Rules run in order, so a later rule
+# can use a column set by an earlier one.
+
+# Values treated as "no fuel given", in addition to missing values
+BLANK_FUELS = ['-']
+
+FUEL_RULES = {
+    # No switching in transport: end_fuel = start_fuel
+    'transport': [
+        ('start_fuel', 'fuel', None),
+        ('end_fuel', 'fuel', None),
+    ],
+    # Residential reports the fuel switched from; default it to the fuel used
+    'residential': [
+        ('end_fuel', 'fuel', None),
+        ('start_fuel', 'fuel_switched', 'fuel'),
+    ],
+    'commercial': [
+        ('start_fuel', 'fuel', None),
+        ('end_fuel', 'fuel_override', 'fuel'),
+    ],
+    'industry': [
+        ('start_fuel', 'fuel', None),
+        ('end_fuel', 'fuel_override', 'fuel'),
+    ],
+    'power': [
+        ('start_fuel', 'fuel', None),
+        ('end_fuel', 'fuel_override', 'fuel'),
+    ],
+    # Fuel switching summaries: default end_fuel to start_fuel
+    'fuel_switching': [
+        ('end_fuel', 'end_fuel', 'start_fuel'),
+    ],
+    # process_to_sql.py: fuel_type is the fuel used after any switch, with
+    # start_fuel/end_fuel kept raw for the fuel switching output
+    'commercial_fuel_type': [
+        ('fuel_type', 'fuel_override', 'fuel'),
+        ('start_fuel', 'fuel', None),
+        ('end_fuel', 'fuel_override', None),
+    ],
+    'industry_fuel_type': [
+        ('fuel_type', 'end_fuel', 'start_fuel'),
+    ],
+}
+
+
+def is_blank_fuel(series):
+    """True where a fuel column has no fuel given."""
+    return series.isna() | series.isin(BLANK_FUELS)
+
+
+def resolve_fuels(df, rules):
+    """Applies fuel rules to df in place and returns it.
+
+    rules is either a key of FUEL_RULES or a list of (target, source, fallback) rules.
+    """
+    if isinstance(rules, str):
+        rules = FUEL_RULES[rules]
+    for target, source, fallback in rules:
+        values = df[source]
+        if fallback is not None:
+            values = values.mask(is_blank_fuel(values), df[fallback])
+        df[target] = values
+    return df
@@ -0,0 +1,159 @@
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# ---------------------------------------------
+# Gap filling
+# ---------------------------------------------
+# Veda reports results for milestone years only (e.g. 2020, 2025, 2030...).
+# Outputs are published for every year, so the missing years are filled by
+# linear interpolation between the reported years either side.
+
+
+@lru_cache(maxsize=None)
+def year_grid(first_year, last_year):
+    """Every year from first_year to last_year inclusive, as a column index."""
+    return pd.Index(range(first_year, last_year + 1))
+
+
+def year_columns(df):
+    """Returns df with year column labels as int, and its sorted year columns.
+
+    Digit-string labels (e.g. from a CSV header) and NumPy integer labels (e.g.
+    from pivoting an int16 year column) are both converted.
+    """
+    if any(isinstance(col, (str, np.integer)) and str(col).isdigit() for col in df.columns):
+        df = df.rename(columns=lambda col: int(col) if isinstance(col, (str, np.integer)) and str(col).isdigit() else col)
+    years = sorted(col for col in df.columns if isinstance(col, (int, np.integer)))
+    return df, years
+
+
+def interpolate_matrix(values, valid):
+    """Linearly interpolates each row of a float matrix across its invalid cells.
+
+    values is a 2D array on a yearly grid and valid marks the cells to interpolate
+    between. Invalid cells before the first or after the last valid cell of a row
+    take the nearest valid value. Rows with no valid cells are left as they are.
+    """
+    n_cols = values.shape[1]
+    cols = np.arange(n_cols)
+
+    # Nearest valid column to the left and right of every cell
+    prev_col = np.maximum.accumulate(np.where(valid, cols, -1), axis=1)
+    next_col = np.minimum.accumulate(np.where(valid, cols, n_cols)[:, ::-1], axis=1)[:, ::-1]
+    has_prev = prev_col >= 0
+    has_next = next_col < n_cols
+    prev_col = np.where(has_prev, prev_col, next_col)
+    next_col = np.where(has_next, next_col, prev_col)
+
+    rows = np.arange(values.shape[0])[:, None]
+    fill = ~valid & (has_prev | has_next)
+    prev_val = values[rows, np.minimum(prev_col, n_cols - 1)]
+    next_val = values[rows, np.minimum(next_col, n_cols - 1)]
+    years_since = cols - prev_col
+    span = next_col - prev_col
+    with np.errstate(invalid='ignore', divide='ignore'):
+        step = np.where(span > 0, (next_val - prev_val) / span, 0)
+    return np.where(fill, prev_val + step * years_since, values)
+
+
+def gap_fill(df, skipna=True):
+    """Expands df to every year between its first and last year column and interpolates linearly.
+
+    With skipna=True, NaNs in reported years are interpolated over as well as the
+    missing years. With skipna=False only the missing years are filled, from the
+    reported years either side, and NaNs in reported years are kept. Frames that
+    already have a complete run of years with nothing to fill are returned as is.
+    """
+    df, years = year_columns(df)
+    if not years:
+        return df
+
+    # Keep the column axis name (e.g. 'year' from a pivot) for later melts
+    grid = year_grid(years[0], years[-1]).rename(df.columns.name)
+    other_cols = [col for col in df.columns if col not in set(years)]
+    year_values = df[years]
+    if not all(pd.api.types.is_numeric_dtype(dtype) for dtype in year_values.dtypes):
+        year_values = year_values.apply(pd.to_numeric, errors='coerce')
+    values = year_values.to_numpy(dtype=float, na_value=np.nan)
+
+    complete = len(years) == len(grid)
+    if complete and (not skipna or not np.isnan(values).any()):
+        if list(df.columns) == other_cols + list(grid):
+            return df
+        return df[other_cols + list(grid)]
+
+    # Reindex onto the full year grid in one step
+    grid_values = np.full((len(df), len(grid)), np.nan)
+    grid_values[:, np.asarray(years) - years[0]] = values
+    if skipna:
+        valid = ~np.isnan(grid_values)
+    else:
+        valid = np.broadcast_to(grid.isin(years), grid_values.shape)
+    filled = pd.DataFrame(interpolate_matrix(grid_values, valid), index=df.index, columns=grid)
+
+    if other_cols:
+        filled = pd.concat([df[other_cols], filled], axis=1)
+        filled.columns.name = df.columns.name
+    return filled
+
+
+def gap_fill_long(values, fill_value=None):
+    """Long-format gap_fill: expands values to every year between its first and last year and interpolates linearly.
+
+    values is a Series with a MultiIndex of key levels and a 'year' level, and
+    the result is a Series in the same form, sorted by key and year. Years
+    reported for no key are interpolated for every key from the reported years
+    either side. Years missing for some keys only are taken as fill_value.
+    With fill_value=None they stay missing, and the interpolated years that
+    depend on them are left out, as with gap_fill(skipna=False) followed by
+    dropping NaNs. Only the reported years are laid out densely, and keys are
+    handled by their index codes, so the result is built directly in long form.
+    """
+    key_levels = [name for name in values.index.names if name != 'year']
+    if not len(values):
+        # Nothing to fill, e.g. an input with no rows left after filtering
+        return values.reorder_levels(key_levels + ['year']).astype(float)
+    key_ids = values.groupby(level=key_levels, sort=True, observed=True).ngroup().to_numpy()
+    n_keys = int(key_ids.max()) + 1
+    year_values = values.index.get_level_values('year').to_numpy(dtype=int)
+    reported = np.unique(year_values)
+    grid = year_grid(int(reported[0]), int(reported[-1])).to_numpy()
+    missing = grid[~np.isin(grid, reported)]
+
+    # One row per key and one column per reported year
+    dense = np.full((n_keys, len(reported)), np.nan if fill_value is None else fill_value, dtype=float)
+    dense[key_ids, np.searchsorted(reported, year_values)] = values.to_numpy(dtype=float)
+
+    # Interpolate the missing years from the reported years either side
+    next_pos = np.searchsorted(reported, missing)
+    prev_pos = next_pos - 1
+    weight = (missing - reported[prev_pos]) / (reported[next_pos] - reported[prev_pos])
+    filled = dense[:, prev_pos] + (dense[:, next_pos] - dense[:, prev_pos]) * weight
+
+    if fill_value is None:
+        ids = np.concatenate([key_ids, np.repeat(np.arange(n_keys), len(missing))])
+        years = np.concatenate([year_values, np.tile(missing, n_keys)])
+        results = np.concatenate([values.to_numpy(dtype=float), filled.ravel()])
+        keep = ~np.isnan(results)
+        order = np.lexsort((years[keep], ids[keep]))
+        ids, years, results = ids[keep][order], years[keep][order], results[keep][order]
+    else:
+        wide = np.empty((n_keys, len(grid)))
+        wide[:, reported - grid[0]] = dense
+        wide[:, missing - grid[0]] = filled
+        ids = np.repeat(np.arange(n_keys), len(grid))
+        years = np.tile(grid, n_keys)
+        results = wide.ravel()
+
+    # Index codes of each key, from its first row
+    first_rows = np.unique(key_ids, return_index=True)[1]
+    positions = [values.index.names.index(name) for name in key_levels]
+    index = pd.MultiIndex(
+        levels=[values.index.levels[i] for i in positions] + [pd.Index(grid)],
+        codes=[values.index.codes[i][first_rows][ids] for i in positions] + [years - grid[0]],
+        names=key_levels + ['year'],
+        verify_integrity=False,
+    )
+    return pd.Series(results, index=index, name=values.name)
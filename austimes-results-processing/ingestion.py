@@ -0,0 +1,149 @@
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from input_cache import read_cached
+from instrumentation import stage
+
+# ---------------------------------------------
+# Input ingestion
+# ---------------------------------------------
+# Veda exports carry many more columns than the processing uses, and the
+# dimension columns hold a handful of distinct strings repeated on every row.
+# Reading only the needed columns, with dimensions as categoricals and years
+# as int16, cuts parse time and memory considerably on large exports.
+
+# Columns used from each input (by processing.py or process_to_sql.py).
+# Keys match INPUT_FILES in processing.py, plus the EnEff inputs.
+INPUT_SCHEMAS = {
+    'transport': ['scenario', 'study', 'state', 'sector_p', 'enduse', 'fuel', 'unit', 'year', 'val'],
+    'commercial': ['scenario', 'study', 'state', 'sector_p', 'subsector_p', 'enduse', 'buildingtype',
+                   'fuel', 'fuel_override', 'unit', 'varbl', 'year', 'val', 'val~den'],
+    'residential': ['scenario', 'study', 'state', 'sector_p', 'subsector_p', 'enduse',
+                    'fuel', 'fuel_switched', 'unit', 'year', 'val'],
+    'industry': ['scenario', 'study', 'state', 'sector_p', 'subsector_p', 'subsector_c',
+                 'fuel', 'fuel_override', 'unit', 'varbl', 'year', 'val', 'val~den'],
+    'power': ['scenario', 'study', 'state', 'sector_p', 'tech', 'technology0_process',
+              'fuel', 'fuel_override', 'unit', 'year', 'val'],
+    'emissions': ['scenario', 'study', 'state', 'sector_p', 'subsector_p', 'subsector_c', 'subsector_p_cca',
+                  'enduse', 'tech', 'commodity', 'varbl', 'source', 'source_p', 'year', 'val'],
+    'elec_cap_gen': ['scenario', 'study', 'state', 'sector_p', 'tech', 'technology0_process', 'process',
+                     'unit', 'year', 'val'],
+    'h2': ['scenario', 'study', 'state', 'sector_p', 'fuel', 'process', 'unit', 'year', 'val', 'GrandTotal'],
+    'eneff_ind': ['scenario', 'study', 'state', 'subsector_p', 'fuel', 'source', 'ee_category',
+                  'unit', 'year', 'val'],
+    'eneff_bld': ['scenario', 'study', 'state', 'sector_p', 'enduse_c', 'buildingtype', 'fuel', 'ee_category',
+                  'unit', 'year', 'val'],
+}
+
+VALUE_COLUMNS = ['val', 'val~den', 'GrandTotal']
+YEAR_DTYPE = 'int16'
+
+# Fuel columns are compared with each other (fuel switching), so share one set of categories
+FUEL_COLUMNS = ['fuel', 'fuel_override', 'fuel_switched']
+
+
+def column_dtype(column):
+    if column in VALUE_COLUMNS:
+        return 'float64'
+    if column == 'year':
+        return YEAR_DTYPE
+    return 'category'
+
+
+def share_categories(df, columns):
+    """Gives the categorical columns in columns a common set of categories."""
+    columns = [col for col in columns if col in df.columns]
+    if len(columns) > 1:
+        categories = union_categoricals([df[col] for col in columns], sort_categories=True).categories
+        for col in columns:
+            df[col] = df[col].cat.set_categories(categories)
+    return df
+
+
+def read_input(key, path, engine=None, prune=True):
+    """Reads a Veda export with the dtypes for its schema in INPUT_SCHEMAS.
+
+    With prune=True only the schema columns are read. With prune=False every
+    column is kept, for callers that sort on all columns, and columns outside
+    the schema keep their inferred dtypes. engine='pyarrow' uses the pyarrow
+    CSV parser, if installed. Unchanged inputs are loaded from the input cache.
+    """
+    options = {'schema': INPUT_SCHEMAS[key], 'prune': prune, 'year_dtype': YEAR_DTYPE}
+    with stage('read') as record:
+        df = read_cached(path, options, lambda: parse_input(key, path, engine, prune))
+        record['rows_out'] = len(df)
+    return df
+
+
+def parse_input(key, path, engine=None, prune=True):
+    """Parses a Veda export from CSV; see read_input."""
+    columns, dtypes = csv_options(key, path, prune)
+    df = pd.read_csv(path, usecols=columns, dtype=dtypes, engine=engine)
+    return share_categories(df, FUEL_COLUMNS)
+
+
+def csv_options(key, path, prune=True):
+    """Columns to read from the file at path, and their dtypes, for the schema of key."""
+    header = pd.read_csv(path, nrows=0).columns
+    schema = INPUT_SCHEMAS[key]
+    columns = [col for col in header if col in schema or not prune]
+    dtypes = {col: column_dtype(col) for col in columns if col in schema}
+    return columns, dtypes
+
+
+def iter_input(key, path, chunk_rows, prune=True):
+    """Reads a Veda export in chunks of up to chunk_rows rows, with the dtypes of read_input.
+
+    Chunks are parsed with the default pandas parser (pyarrow can't read in
+    chunks) and are not cached. Each chunk has its own categories.
+    """
+    columns, dtypes = csv_options(key, path, prune)
+    with pd.read_csv(path, usecols=columns, dtype=dtypes, chunksize=chunk_rows) as reader:
+        while True:
+            # Only the reading is timed, not the caller's work between chunks
+            with stage('read') as record:
+                chunk = next(reader, None)
+                if chunk is not None:
+                    chunk = share_categories(chunk, FUEL_COLUMNS)
+                    record['rows_out'] = len(chunk)
+            if chunk is None:
+                return
+            yield chunk
+
+
+def iter_input_groups(key, path, column, chunk_rows, prune=True):
+    """Reads a Veda export one group of rows at a time, a group being the rows sharing a value of column.
+
+    Rows are read chunk_rows at a time and yielded once their group is
+    complete, so a group is never split across two frames. Each group's rows
+    must be listed together in the file, as Veda lists scenarios; a group that
+    reappears after other groups raises ValueError.
+    """
+    pending = []  # Chunk pieces of the group still being read
+    seen = set()
+    for chunk in iter_input(key, path, chunk_rows, prune):
+        values = chunk[column].to_numpy()
+        starts = np.flatnonzero(np.r_[True, values[1:] != values[:-1]])
+        for start, end in zip(starts, np.r_[starts[1:], len(chunk)]):
+            value = values[start]
+            if pending and value != pending[0][column].iat[0]:
+                yield concat_chunks(pending)
+                pending = []
+            if not pending:
+                if value in seen:
+                    raise ValueError(f'{path}: rows for {column} {value!r} are not listed together')
+                seen.add(value)
+            pending.append(chunk if end - start == len(chunk) else chunk.iloc[start:end].copy())
+    if pending:
+        yield concat_chunks(pending)
+
+
+def concat_chunks(chunks):
+    """Concatenates chunks read by iter_input, keeping categorical columns categorical."""
+    if len(chunks) == 1:
+        return chunks[0]
+    df = pd.concat(chunks)
+    categorical = [col for col, dtype in chunks[0].dtypes.items() if isinstance(dtype, pd.CategoricalDtype)]
+    df = df.astype({col: 'category' for col in categorical if not isinstance(df[col].dtype, pd.CategoricalDtype)})
+    return share_categories(df, FUEL_COLUMNS)
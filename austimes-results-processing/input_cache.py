@@ -0,0 +1,160 @@
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from directories import Directories
+
+# ---------------------------------------------
+# Input cache
+# ---------------------------------------------
+# Parsing large Veda CSVs dominates repeated runs against the same inputs.
+# Each parsed input is stored in the cache directory as a Feather file with a
+# small JSON record of the source file's size, mtime and content hash. A
+# later read of an unchanged file loads the Feather file instead of
+# reparsing. A changed file (different size, or a different content hash
+# after an mtime change) is reparsed and its entry replaced. The least
+# recently used entries are evicted once the cache exceeds CACHE_MAX_BYTES.
+#
+# Feather needs pyarrow; without it inputs are always read from CSV.
+
+CACHE_PATH = Path(Directories().CACHE_PATH)
+CACHE_MAX_BYTES = 5 * 1024 ** 3
+
+# Bump when parsed inputs change shape, to invalidate existing entries
+CACHE_VERSION = 1
+
+# Set to '0' to bypass the cache. An environment variable (rather than a module
+# setting) so it also reaches worker processes.
+CACHE_ENV_VAR = 'AUSTIMES_INPUT_CACHE'
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+
+def cache_enabled():
+    return HAS_PYARROW and os.environ.get(CACHE_ENV_VAR, '1') != '0'
+
+
+def set_cache_enabled(enabled):
+    os.environ[CACHE_ENV_VAR] = '1' if enabled else '0'
+
+
+def content_hash(path, chunk_size=1024 * 1024):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def entry_name(path, options):
+    """Cache entry name for a source file read with the given (JSON-serialisable) options."""
+    key = json.dumps([CACHE_VERSION, str(Path(path).resolve()), options], sort_keys=True)
+    return hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+
+
+def read_cached(path, options, parse, cache_path=CACHE_PATH, max_bytes=CACHE_MAX_BYTES):
+    """Returns parse() for the file at path, from the cache when the file is unchanged.
+
+    options describes how parse() reads the file (e.g. schema and dtypes), so
+    reading the same file differently gets its own entry.
+    """
+    if not cache_enabled():
+        return parse()
+
+    cache_path = Path(cache_path)
+    name = entry_name(path, options)
+    data_file = cache_path / f'{name}.feather'
+    meta_file = cache_path / f'{name}.json'
+    stat = os.stat(path)
+
+    meta = _load_meta(meta_file)
+    source_hash = None
+    if meta is not None and meta['size'] == stat.st_size:
+        if meta['mtime_ns'] != stat.st_mtime_ns:
+            # Touched or copied files are still reused if their content is unchanged
+            source_hash = content_hash(path)
+            if source_hash != meta['content_hash']:
+                meta = None
+        if meta is not None:
+            try:
+                df = pd.read_feather(data_file)
+            except (OSError, ValueError):
+                # Entry evicted or damaged since the metadata was read
+                meta = None
+            else:
+                meta.update(mtime_ns=stat.st_mtime_ns, last_used=time.time())
+                _write_json(meta_file, meta)
+                return df
+
+    df = parse()
+    cache_path.mkdir(parents=True, exist_ok=True)
+    tmp_file = data_file.with_name(f'{data_file.name}.{os.getpid()}.tmp')
+    try:
+        df.reset_index(drop=True).to_feather(tmp_file)
+    except (TypeError, ValueError):
+        # Columns Arrow can't store (e.g. mixed types) are left uncached
+        tmp_file.unlink(missing_ok=True)
+        return df
+    os.replace(tmp_file, data_file)
+    _write_json(meta_file, {
+        'source': str(Path(path).resolve()),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'content_hash': source_hash or content_hash(path),
+        'bytes': data_file.stat().st_size,
+        'last_used': time.time(),
+    })
+    evict(cache_path, max_bytes)
+    return df
+
+
+def evict(cache_path=CACHE_PATH, max_bytes=CACHE_MAX_BYTES):
+    """Removes least recently used entries until the cache fits in max_bytes."""
+    entries = []
+    for meta_file in Path(cache_path).glob('*.json'):
+        meta = _load_meta(meta_file)
+        if meta is not None:
+            entries.append((meta['last_used'], meta['bytes'], meta_file))
+    total = sum(size for _, size, _ in entries)
+    for _, size, meta_file in sorted(entries):
+        if total <= max_bytes:
+            break
+        _remove_entry(meta_file)
+        total -= size
+
+
+def clear_cache(cache_path=CACHE_PATH):
+    """Removes every cache entry."""
+    for meta_file in Path(cache_path).glob('*.json'):
+        _remove_entry(meta_file)
+
+
+def _remove_entry(meta_file):
+    for file in (meta_file.with_suffix('.feather'), meta_file):
+        try:
+            file.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _load_meta(meta_file):
+    try:
+        with open(meta_file) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(file, data):
+    tmp_file = file.with_name(f'{file.name}.{os.getpid()}.tmp')
+    with open(tmp_file, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_file, file)
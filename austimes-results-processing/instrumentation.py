@@ -0,0 +1,215 @@
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# ---------------------------------------------
+# Run instrumentation
+# ---------------------------------------------
+# Stages of a run (reading an input, mapping a column, EInt, pivoting, gap
+# filling, exporting, loading a SQL table...) are timed with stage():
+#
+#     with stage('read', rows_in=...) as record:
+#         df = ...
+#         record['rows_out'] = len(df)
+#
+# Stages nest, and are recorded under their path (e.g. 'transport/map
+# enduse'). A stage run more than once (e.g. once per chunk) is recorded once,
+# with its calls, times and rows added up. Each record has the wall and CPU
+# time, the rows in and out where given, and the peak RSS of the process so
+# far. Records of stages run in worker processes are returned with the
+# module's result (see run_stage) and added to the parent's.
+#
+# Top-level stages can also be profiled, with cProfile or pyinstrument (if
+# installed), into one file per stage. Like the input cache setting, the
+# profiler is set through environment variables so it reaches worker
+# processes.
+
+PROFILE_ENV_VAR = 'AUSTIMES_PROFILE'
+PROFILE_DIR_ENV_VAR = 'AUSTIMES_PROFILE_DIR'
+PROFILERS = ['cprofile', 'pyinstrument']
+
+# Stage records of this process, by path, the names of the open stages, and
+# the stages opened by start_stage
+_records = {}
+_open = []
+_open_contexts = []
+
+
+def rows(obj):
+    """Rows in a DataFrame or Series, otherwise None."""
+    return len(obj) if isinstance(obj, (pd.DataFrame, pd.Series)) else None
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process so far, in MB, or None where it can't be measured."""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Bytes on macOS, KB elsewhere
+        return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+    if psutil is not None:
+        return psutil.Process().memory_info().peak_wset / 1024 ** 2
+    return None
+
+
+def set_profiling(profiler, directory):
+    """Profiles each top-level stage with profiler (one of PROFILERS, or None to stop) into directory."""
+    if profiler is None:
+        os.environ.pop(PROFILE_ENV_VAR, None)
+        return
+    if profiler not in PROFILERS:
+        raise ValueError(f'Unknown profiler {profiler!r}, expected one of {", ".join(PROFILERS)}')
+    if profiler == 'pyinstrument':
+        import pyinstrument  # noqa: F401 (fail now rather than in the first stage)
+    Path(directory).mkdir(parents=True, exist_ok=True)
+    os.environ[PROFILE_ENV_VAR] = profiler
+    os.environ[PROFILE_DIR_ENV_VAR] = str(directory)
+
+
+@contextmanager
+def profiled(name):
+    """Profiles the enclosed code into PROFILE_DIR_ENV_VAR with the profiler set by set_profiling, if any."""
+    profiler = os.environ.get(PROFILE_ENV_VAR)
+    if not profiler:
+        yield
+        return
+    path = Path(os.environ.get(PROFILE_DIR_ENV_VAR, '.')) / name.replace('/', '_')
+    if profiler == 'pyinstrument':
+        from pyinstrument import Profiler
+        profile = Profiler()
+        profile.start()
+        try:
+            yield
+        finally:
+            profile.stop()
+            path.with_suffix('.html').write_text(profile.output_html(), encoding='utf-8')
+    else:
+        import cProfile
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            profile.dump_stats(path.with_suffix('.prof'))
+
+
+@contextmanager
+def measure(rows_in=None, cpu_clock=time.process_time):
+    """Times the enclosed code into the record it yields, without recording it.
+
+    For code run in another thread, where stage() can't be used: the record
+    can be added with add_records once the block has exited. cpu_clock
+    time.thread_time counts only the calling thread's CPU time.
+    """
+    record = {'started': time.time(), 'calls': 1, 'wall_s': None, 'cpu_s': None, 'rows_in': rows_in,
+              'rows_out': None, 'peak_rss_mb': None}
+    wall, cpu = time.perf_counter(), cpu_clock()
+    try:
+        yield record
+    finally:
+        record['wall_s'] = time.perf_counter() - wall
+        record['cpu_s'] = cpu_clock() - cpu
+        record['peak_rss_mb'] = peak_rss_mb()
+
+
+@contextmanager
+def stage(name, rows_in=None):
+    """Times the enclosed code as stage name, within any open stage. Yields the record to set rows_out on."""
+    path = stage_path(name)
+    _open.append(name)
+    try:
+        with measure(rows_in) as record:
+            if len(_open) == 1:
+                with profiled(name):
+                    yield record
+            else:
+                yield record
+    finally:
+        _open.pop()
+        _add_record(path, record)
+
+
+def stage_path(name):
+    """Path stage name would be recorded under if opened now."""
+    return '/'.join(_open + [name])
+
+
+def start_stage(name, rows_in=None):
+    """Opens stage name until the matching end_stage, for scripts without a function to wrap."""
+    context = stage(name, rows_in)
+    record = context.__enter__()
+    _open_contexts.append((context, record))
+    return record
+
+
+def end_stage(rows_out=None):
+    """Closes the stage opened by the last start_stage, recording rows_out if given."""
+    context, record = _open_contexts.pop()
+    if rows_out is not None:
+        record['rows_out'] = rows_out
+    context.__exit__(None, None, None)
+
+
+def run_stage(name, func):
+    """Runs func as top-level stage name, returning its result and the records made while it ran.
+
+    For module functions run in worker processes, whose records are returned
+    to the parent to add with add_records.
+    """
+    with stage(name) as record:
+        result = func()
+        record['rows_out'] = rows(result)
+    paths = [path for path in _records if path == name or path.startswith(name + '/')]
+    return result, {path: _records.pop(path) for path in paths}
+
+
+def add_records(records):
+    """Adds stage records made in another process (or thread)."""
+    for path, record in records.items():
+        _add_record(path, record)
+
+
+def stage_records(records=None):
+    """Stage records of this run (or records, by path), in the order the stages started."""
+    ordered = sorted((_records if records is None else records).items(), key=lambda item: item[1]['started'])
+    return [{'stage': path, **record, 'started': datetime.fromtimestamp(record['started']).isoformat(timespec='milliseconds')}
+            for path, record in ordered]
+
+
+def write_report(path, records=None, **run_info):
+    """Writes run_info and the stage records of this run (or records) to path as a JSON run report."""
+    report = {**run_info, 'peak_rss_mb': peak_rss_mb(), 'stages': stage_records(records)}
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, default=str)
+    return Path(path)
+
+
+def _add_record(path, record):
+    if path not in _records:
+        _records[path] = dict(record)
+        return
+    total = _records[path]
+    total['calls'] += record['calls']
+    total['wall_s'] += record['wall_s']
+    total['cpu_s'] += record['cpu_s']
+    for key in ['rows_in', 'rows_out']:
+        if record[key] is not None:
+            total[key] = (total[key] or 0) + record[key]
+    if record['peak_rss_mb'] is not None:
+        total['peak_rss_mb'] = max(total['peak_rss_mb'] or 0, record['peak_rss_mb'])
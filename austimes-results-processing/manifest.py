@@ -0,0 +1,89 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import pandas as pd
+
+from input_cache import content_hash
+
+# ---------------------------------------------
+# Incremental reprocessing manifest
+# ---------------------------------------------
+# Records, for each processing module, the files it read (its input and
+# mapping CSVs) and the version of the code that produced its summary. A
+# module whose files and code are unchanged since the last run can reuse its
+# stored summary instead of being recomputed.
+
+
+def code_version(paths):
+    """Hash of the contents of the given source files."""
+    digest = hashlib.blake2b(digest_size=16)
+    for path in sorted(Path(p) for p in paths):
+        digest.update(path.name.encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def file_fingerprint(path, previous=None):
+    """Size, mtime and content hash of a file.
+
+    The content hash is reused from previous when the size and mtime are unchanged.
+    """
+    stat = os.stat(path)
+    if previous and previous['size'] == stat.st_size and previous['mtime_ns'] == stat.st_mtime_ns:
+        return previous
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'hash': content_hash(path)}
+
+
+class Manifest:
+    """Module dependency fingerprints and stored summaries in a directory."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.manifest_file = self.path / 'manifest.json'
+        try:
+            with open(self.manifest_file) as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def fingerprint(self, name, files, code):
+        """Current fingerprint of a module that reads files, run with code version code."""
+        previous = self.entries.get(name, {}).get('files', {})
+        return {
+            'files': {str(f): file_fingerprint(f, previous.get(str(f))) for f in files},
+            'code': code,
+        }
+
+    def is_current(self, name, fingerprint):
+        entry = self.entries.get(name)
+        if entry is None or entry['code'] != fingerprint['code']:
+            return False
+        stored = {f: fp['hash'] for f, fp in entry['files'].items()}
+        current = {f: fp['hash'] for f, fp in fingerprint['files'].items()}
+        return stored == current and (self.path / entry['summary']).exists()
+
+    def load(self, name, fingerprint):
+        """Stored summary for the module if it is still current, otherwise None."""
+        if not self.is_current(name, fingerprint):
+            return None
+        if self.entries[name]['files'] != fingerprint['files']:
+            # Same content with new mtimes; record them to skip rehashing next run
+            self.entries[name].update(fingerprint)
+            self._write()
+        return pd.read_pickle(self.path / self.entries[name]['summary'])
+
+    def save(self, name, fingerprint, summary):
+        """Stores the module's summary along with the fingerprint it was computed from."""
+        self.path.mkdir(parents=True, exist_ok=True)
+        summary_file = f'{name}.pkl'
+        summary.to_pickle(self.path / summary_file)
+        self.entries[name] = {**fingerprint, 'summary': summary_file}
+        self._write()
+
+    def _write(self):
+        tmp_file = self.manifest_file.with_name(f'{self.manifest_file.name}.tmp')
+        with open(tmp_file, 'w') as f:
+            json.dump(self.entries, f, indent=2)
+        os.replace(tmp_file, self.manifest_file)
@@ -0,0 +1,99 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from directories import Directories
+from instrumentation import stage
+
+# ---------------------------------------------
+# Mapping registry
+# ---------------------------------------------
+# Veda labels are translated to output categories through the CSV mapping
+# files in the mapping directory. Each mapping is read once, on first use, into
+# a lookup table indexed by its key column. Columns are mapped by looking up
+# each distinct key once (the categories, for categorical columns) and
+# spreading the results over the rows, rather than searching per row.
+#
+# Keys missing from a mapping map to NaN. They are reported together, once per
+# mapping, instead of failing on the first unknown row.
+
+MAPPING_PATH = Path(Directories().MAPPING_PATH)
+
+# Mapping name: (file, key column, value column)
+MAPPINGS = {
+    'enduse': ('enduse_to_subsector_detail_mapping.csv', 'enduse', 'subsector_detail'),
+    'sd2s': ('subsector_detail_to_subsector_mapping_v2.csv', 'subsector_detail', 'subsector'),
+    'sp2s': ('subsector_p_to_subsector_mapping.csv', 'subsector_p', 'subsector'),
+    'spc2sd': ('subsector_p_cca_to_subsector_detail_mapping.csv', 'subsector_p_cca', 'subsector_detail'),
+    'com2et': ('commodity_to_emission_type_mapping.csv', 'commodity', 'emis_type'),
+    't2tech': ('tech_to_technology_mapping.csv', 'tech', 'technology'),
+    'pc2td': ('process_code_to_tech_detail_mapping.csv', 'process_code', 'tech_detail'),
+    'h2tech': ('h2_mapping.csv', 'process', 'subsector_detail'),
+    'h2sector': ('h2_sector_mapping.csv', 'subsector_detail', 'subsector'),
+    'emis': ('emis_mapping.csv', 'emission_type', 'emis_type'),
+    'emsector': ('emis_sector_mapping.csv', 'sector0_process', 'sector'),
+}
+
+
+class MappingRegistry:
+    """Lookup tables for the mappings in MAPPINGS, loaded from path on first use."""
+
+    def __init__(self, path=MAPPING_PATH):
+        self.path = Path(path)
+        self.tables = {}
+        self.unmapped = {}
+
+    def preload(self):
+        """Reads every mapping now, e.g. before starting worker processes that can then share the tables."""
+        for name in MAPPINGS:
+            self.table(name)
+
+    def file(self, name):
+        return self.path / MAPPINGS[name][0]
+
+    def table(self, name):
+        """Mapping values indexed by key. Where a key is listed twice, the first entry is used."""
+        if name not in self.tables:
+            filename, key_col, val_col = MAPPINGS[name]
+            df = pd.read_csv(self.path / filename, usecols=[key_col, val_col])
+            df = df.drop_duplicates(subset=key_col)
+            self.tables[name] = pd.Series(df[val_col].to_numpy(dtype=object), index=pd.Index(df[key_col]), name=val_col)
+        return self.tables[name]
+
+    def map(self, name, keys, report=True):
+        """Maps a Series of keys through a mapping, returning an object Series aligned with keys.
+
+        NaN keys map to NaN, as do keys missing from the mapping. With
+        report=True missing keys are recorded in unmapped and newly seen ones
+        printed; pass report=False where the caller fills missing keys itself.
+        """
+        with stage(f'map {name}', rows_in=len(keys)):
+            table = self.table(name)
+            if isinstance(keys.dtype, pd.CategoricalDtype):
+                codes, uniques = keys.cat.codes.to_numpy(), keys.cat.categories
+            else:
+                codes, uniques = pd.factorize(keys)
+
+            # Position of each distinct key in the table; -1 (missing) picks the trailing NaN
+            positions = table.index.get_indexer(uniques)
+            unique_values = np.append(table.to_numpy(), np.nan)[positions]
+            values = np.append(unique_values, np.nan)[codes]
+
+        if report:
+            present = np.unique(codes[codes >= 0])
+            new = set(uniques[present[positions[present] < 0]]) - self.unmapped.get(name, set())
+            if new:
+                self.unmapped.setdefault(name, set()).update(new)
+                print(self._describe(name, new))
+        return pd.Series(values, index=keys.index, name=table.name, dtype=object)
+
+    def raise_for_unmapped(self):
+        """Raises ValueError listing every key that was missing from its mapping."""
+        if self.unmapped:
+            lines = [self._describe(name, keys) for name, keys in self.unmapped.items()]
+            raise ValueError('Unmapped keys found:\n' + '\n'.join(lines))
+
+    def _describe(self, name, keys):
+        filename, key_col, _ = MAPPINGS[name]
+        return f'{len(keys)} {key_col} value(s) not in {filename}: {", ".join(sorted(map(str, keys)))}'
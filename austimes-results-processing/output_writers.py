@@ -0,0 +1,104 @@
+import shutil
+from pathlib import Path
+
+import pandas as pd
+
+# ---------------------------------------------
+# Output writers
+# ---------------------------------------------
+# Processed tables are written to the run's output directory by a writer for
+# the chosen output format:
+#
+#     csv      one CSV file per table (the default)
+#     parquet  one Parquet file per table, or a hive-partitioned directory of
+#              files (e.g. energy/scenario=Net zero/state=NSW/...) so readers
+#              can load just the scenarios and states they need
+#     feather  one Feather (Arrow IPC) file per table, for fast local rereads
+#
+# Parquet and Feather store the dimension (text) columns dictionary encoded,
+# so each distinct label is stored once per file rather than once per row, and
+# read back as categoricals. Both need pyarrow.
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+
+def dictionary_encoded(df):
+    """df with its text columns as categoricals and its column labels as strings (e.g. wide year columns)."""
+    text_cols = [col for col in df.columns if df[col].dtype == object or pd.api.types.is_string_dtype(df[col])]
+    df = df.astype({col: 'category' for col in text_cols})
+    return df.rename(columns=str)
+
+
+class CSVWriter:
+    suffix = '.csv'
+
+    def write(self, df, directory, name):
+        path = Path(directory) / f'{name}{self.suffix}'
+        df.to_csv(path, index=False)
+        return path
+
+
+class ParquetWriter:
+    """Writes Parquet files, optionally hive partitioned by partition_cols.
+
+    Partition columns missing from a table (e.g. state, when results are not
+    split by state) are skipped. compression is any codec pyarrow supports
+    (e.g. 'snappy', 'zstd', 'gzip' or None).
+    """
+    suffix = '.parquet'
+
+    def __init__(self, compression='snappy', partition_cols=None):
+        _require_pyarrow('parquet')
+        self.compression = compression
+        self.partition_cols = list(partition_cols or [])
+
+    def write(self, df, directory, name):
+        path = Path(directory) / f'{name}{self.suffix}'
+        partition_cols = [col for col in self.partition_cols if col in df.columns]
+        df = dictionary_encoded(df)
+        if not partition_cols:
+            df.to_parquet(path, index=False, compression=self.compression)
+            return path
+
+        # Replace any earlier output of the same run rather than adding files alongside it
+        if path.exists():
+            shutil.rmtree(path)
+        df.to_parquet(path, index=False, compression=self.compression, partition_cols=partition_cols)
+        return path
+
+
+class FeatherWriter:
+    """Writes Feather files. compression is 'lz4', 'zstd' or 'uncompressed'."""
+    suffix = '.feather'
+
+    def __init__(self, compression='lz4'):
+        _require_pyarrow('feather')
+        self.compression = compression
+
+    def write(self, df, directory, name):
+        path = Path(directory) / f'{name}{self.suffix}'
+        dictionary_encoded(df).reset_index(drop=True).to_feather(path, compression=self.compression)
+        return path
+
+
+OUTPUT_WRITERS = {
+    'csv': CSVWriter,
+    'parquet': ParquetWriter,
+    'feather': FeatherWriter,
+}
+
+
+def output_writer(output_format, **options):
+    """Writer for output_format (a key of OUTPUT_WRITERS), constructed with the format's options."""
+    if output_format not in OUTPUT_WRITERS:
+        raise ValueError(f'Unknown output format {output_format!r}, expected one of {", ".join(OUTPUT_WRITERS)}')
+    return OUTPUT_WRITERS[output_format](**options)
+
+
+def _require_pyarrow(output_format):
+    if not HAS_PYARROW:
+        raise ImportError(f'{output_format} output requires pyarrow (pip install pyarrow)')
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+
+# ---------------------------------------------
+# Process code parsing
+# ---------------------------------------------
+# Veda process names encode the technology in a fixed pattern, e.g.
+# 'EE_CCGT01-NSW' is the CCGT process, and 'H2_elec_PEM_01' a PEM electrolyser.
+# A results file repeats a few hundred process names across every row, so the
+# names are parsed once each, with vectorised string operations over the
+# distinct values, and the results are spread back over the rows.
+
+# Process code: the part after the first '_' (if any), up to the next '_' or '-'
+PROCESS_CODE_PATTERN = r'^(?:[^_]*_)?([^_\-]*)'
+
+# H2 process type: the second and third '_'-separated parts
+H2_PROCESS_PATTERN = r'^[^_]*_([^_]*_[^_]*)'
+
+# H2 process type: (subsector, subsector_detail)
+H2_PROCESS_TYPES = {
+    'SMR_ccs': ('Steam methane reforming', 'Gas-SMR with CCS'),
+    'elec_AE': ('Electrolysis', 'Alkaline water electrolysis'),
+    'elec_PEM': ('Electrolysis', 'Proton exchange membrane electrolysis'),
+}
+
+
+def parse_unique(values, parse):
+    """Applies parse to the distinct values of a Series and spreads the results back over its rows.
+
+    parse takes and returns a Series of the same length. NaN values give NaN.
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes, uniques = values.cat.codes.to_numpy(), values.cat.categories
+    else:
+        codes, uniques = pd.factorize(values)
+    parsed = parse(pd.Series(uniques, dtype=object)).to_numpy(dtype=object)
+    return pd.Series(np.append(parsed, np.nan)[codes], index=values.index, dtype=object)
+
+
+def process_codes(process):
+    """Process code of each process name, with digits removed (e.g. 'EE_CCGT01-NSW' gives 'CCGT')."""
+    def parse(names):
+        return names.str.extract(PROCESS_CODE_PATTERN, expand=False).str.replace(r'\d', '', regex=True)
+    return parse_unique(process, parse)
+
+
+def classify_h2_processes(process):
+    """subsector and subsector_detail of each H2 process name, '-' for types not in H2_PROCESS_TYPES."""
+    def parse(names):
+        return names.str.extract(H2_PROCESS_PATTERN, expand=False)
+    types = parse_unique(process, parse)
+    return pd.DataFrame({
+        'subsector': types.map({t: labels[0] for t, labels in H2_PROCESS_TYPES.items()}).fillna('-'),
+        'subsector_detail': types.map({t: labels[1] for t, labels in H2_PROCESS_TYPES.items()}).fillna('-'),
+    }, index=process.index)
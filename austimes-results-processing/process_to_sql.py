@@ -1,4 +1,5 @@
 ### Library imports
+import argparse
 from datetime import datetime
 import pytz
 import pandas as pd
@@ -7,6 +8,20 @@ from directories import Directories
 from pathlib import Path
 import pyodbc
 from sql_server_details import SQLServerDetails
+from energy_intensity import calculate_eint
+from efficiency_categories import building_sectors, efficiency_categories
+from emissions_rules import classify_emissions
+from gap_filling import gap_fill_long
+from fuel_resolution import resolve_fuels
+from sql_loader import BulkLoader, SQLServerAdapter, input_run_id
+from sql_dimensions import StarLoader
+from sql_writer import ConcurrentWriter
+from output_writers import output_writer
+from ingestion import read_input
+from mappings import MappingRegistry
+from process_codes import classify_h2_processes, process_codes
+from input_cache import clear_cache, set_cache_enabled
+from instrumentation import PROFILERS, end_stage, set_profiling, stage, start_stage, write_report
 
 ### Ignore lexsort warnings
 warnings.simplefilter(action='ignore', category=pd.errors.PerformanceWarning)
@@ -19,6 +34,29 @@ DATABASE = server_details.database
 
 ### Run options
 STATES = "y" #To split results by state, set to "y", otherwise "n". Note for Excel visualisation template export, must select "y"
+CSV_ENGINE = None #CSV parser for inputs: None for the pandas default, or "pyarrow" (faster, requires pyarrow)
+SQL_BATCH_SIZE = 10000 #Number of rows sent to SQL server per batch
+SQL_STAGING = "n" #To load each table through a temporary staging table before inserting into the target, set to "y", otherwise "n"
+SQL_DIMENSIONS = "n" #To load integer-keyed fact tables and shared dimension tables (see sql_dimensions.py) instead of the text tables, set to "y", otherwise "n"
+SQL_WORKERS = 1 #Connections writing tables at once. Above 1, each table is sent to SQL as soon as it is processed, while the rest are processed (not with SQL_DIMENSIONS)
+SQL_LOAD_MODE = "append" #"append" adds this run's rows; "replace" replaces the rows of the same run (study, scenario and run_id), so reruns don't duplicate rows (the text tables need a run_id column, see sql_loader.py)
+OUTPUT_FORMAT = "csv" #Exported file format: "csv", "parquet" or "feather" (parquet and feather require pyarrow)
+OUTPUT_OPTIONS = {} #Writer options, e.g. {"compression": "zstd", "partition_cols": ["scenario", "state"]} for parquet
+
+### Command line options
+parser = argparse.ArgumentParser(description="Process AusTIMES results exported from Veda and write them to SQL server")
+parser.add_argument("--no-cache", action="store_true", help="read inputs from CSV, bypassing the input cache")
+parser.add_argument("--clear-cache", action="store_true", help="remove all cached inputs before processing")
+parser.add_argument("--profile", choices=PROFILERS, help="profile each section into the profiles folder of the outputs")
+parser.add_argument("--run-id", help="run id the rows are loaded under with SQL_LOAD_MODE = \"replace\" (default: a hash of the input files)")
+args = parser.parse_args()
+if args.clear_cache:
+  clear_cache()
+if args.no_cache:
+  set_cache_enabled(False)
+
+### Output writer (created up front so a missing optional dependency fails before processing)
+writer = output_writer(OUTPUT_FORMAT, **OUTPUT_OPTIONS)
 
 ### Define data file names
 INPUT_TRA_FILENAME = "FE_transport.csv"
@@ -29,6 +67,8 @@ INPUT_ELC_FILENAME = "FE_power.csv"
 INPUT_EMIS_FILENAME = "CO2 emissions.csv"
 INPUT_ELCG_FILENAME = "Elec capacity and generation.csv"
 INPUT_H2GC_FILENAME = "H2 capacity and generation.csv"
+INPUT_EnEff_IND_FILENAME = "CORE-EnEff Industry.csv"
+INPUT_EnEff_BLD_FILENAME = "CORE-EnEff Buildings.csv"
 
 
 ###Set directories
@@ -44,800 +84,534 @@ tz_Melbourne = pytz.timezone('Australia/Melbourne')
 datetime_Melbourne = datetime.now(tz_Melbourne)
 dt = datetime_Melbourne.strftime("%Y-%m-%d_%H-%M")
 
+### Profile each section, if asked
+if args.profile:
+  set_profiling(args.profile, Path(OUTPUT_PATH + dt) / "profiles")
+
 ### Read files
-##Mapping files [To Do - create combined mapping file]
-sd_to_s = pd.read_csv(MAPPING_PATH + "subsector_detail_to_subsector_mapping_v2.csv")
-sd_to_s_dict = sd_to_s.to_dict('list')
-com_to_et = pd.read_csv(MAPPING_PATH + "commodity_to_emission_type_mapping.csv")
-com_to_et_dict = com_to_et.to_dict('list')
-eu_to_sd = pd.read_csv(MAPPING_PATH + "enduse_to_subsector_detail_mapping.csv")
-eu_to_sd_dict = eu_to_sd.to_dict('list')
-sp_to_s = pd.read_csv(MAPPING_PATH + "subsector_p_to_subsector_mapping.csv")
-sp_to_s_dict = sp_to_s.to_dict('list')
-t_to_s = pd.read_csv(MAPPING_PATH + "tech_to_technology_mapping.csv")
-t_to_s_dict = t_to_s.to_dict('list')
-tech_to_technology = pd.read_csv(MAPPING_PATH + "tech_to_technology_mapping.csv")
-tech_to_technology_dict = tech_to_technology.to_dict('list')
-pc_to_td =pd.read_csv(MAPPING_PATH + "process_code_to_tech_detail_mapping.csv")
-pc_to_td_dict = pc_to_td.to_dict('list')
+##Mapping files (each is read on first use, see MAPPINGS in mappings.py)
+mappings = MappingRegistry(MAPPING_PATH)
 
 
 
 ##Data files
-energy_tra = pd.read_csv(INPUT_PATH + INPUT_TRA_FILENAME)
-energy_res = pd.read_csv(INPUT_PATH + INPUT_RES_FILENAME)
-energy_com = pd.read_csv(INPUT_PATH + INPUT_COM_FILENAME)
-energy_ind = pd.read_csv(INPUT_PATH + INPUT_IND_FILENAME)
-energy_elc = pd.read_csv(INPUT_PATH + INPUT_ELC_FILENAME)
-elec_cap_gen = pd.read_csv(INPUT_PATH + INPUT_ELCG_FILENAME)
-eneff_ind = pd.read_csv(INPUT_PATH + INPUT_EnEff_IND_FILENAME)
-eneff_bld = pd.read_csv(INPUT_PATH + INPUT_EnEff_BLD_FILENAME)
-H2_gen_cap = pd.read_csv(INPUT_PATH + INPUT_H2GC_FILENAME)
-core_emis_detail = pd.read_csv(INPUT_PATH + INPUT_EMIS_FILENAME)
+start_stage("read inputs")
+energy_tra = read_input('transport', INPUT_PATH + INPUT_TRA_FILENAME, engine=CSV_ENGINE)
+energy_res = read_input('residential', INPUT_PATH + INPUT_RES_FILENAME, engine=CSV_ENGINE)
+energy_com = read_input('commercial', INPUT_PATH + INPUT_COM_FILENAME, engine=CSV_ENGINE, prune=False)
+energy_ind = read_input('industry', INPUT_PATH + INPUT_IND_FILENAME, engine=CSV_ENGINE, prune=False)
+energy_elc = read_input('power', INPUT_PATH + INPUT_ELC_FILENAME, engine=CSV_ENGINE)
+elec_cap_gen = read_input('elec_cap_gen', INPUT_PATH + INPUT_ELCG_FILENAME, engine=CSV_ENGINE)
+eneff_ind = read_input('eneff_ind', INPUT_PATH + INPUT_EnEff_IND_FILENAME, engine=CSV_ENGINE)
+eneff_bld = read_input('eneff_bld', INPUT_PATH + INPUT_EnEff_BLD_FILENAME, engine=CSV_ENGINE)
+H2_gen_cap = read_input('h2', INPUT_PATH + INPUT_H2GC_FILENAME, engine=CSV_ENGINE)
+core_emis_detail = read_input('emissions', INPUT_PATH + INPUT_EMIS_FILENAME, engine=CSV_ENGINE)
+end_stage()
+
+### Run id, for replacing this run's rows in SQL. The same inputs give the same id, so a rerun replaces the last load
+if SQL_LOAD_MODE == "replace":
+  run_id = args.run_id or input_run_id([INPUT_PATH + filename for filename in [
+    INPUT_TRA_FILENAME, INPUT_RES_FILENAME, INPUT_COM_FILENAME, INPUT_IND_FILENAME, INPUT_ELC_FILENAME,
+    INPUT_ELCG_FILENAME, INPUT_EnEff_IND_FILENAME, INPUT_EnEff_BLD_FILENAME, INPUT_H2GC_FILENAME, INPUT_EMIS_FILENAME]])
+  print(f"Loading to SQL as run {run_id}")
+else:
+  run_id = None
+
+### SQL connection. With SQL_WORKERS > 1, tables are staged by a pool of connections as they are processed,
+### and only copied into the SQL tables (all together, in one transaction) once every table is staged
+conn_str = f"driver={DRIVER};server={SERVER};database={DATABASE};trusted_connection=yes;"
+if SQL_WORKERS > 1 and SQL_DIMENSIONS != "y":
+  sql_writer = ConcurrentWriter(lambda: pyodbc.connect(conn_str), SQLServerAdapter, workers=SQL_WORKERS,
+                                batch_size=SQL_BATCH_SIZE, run_id=run_id)
+else:
+  sql_writer = None
+
+## Queue a processed table for SQL, with the concurrent writer (otherwise tables are loaded at the end)
+def submit_sql(table, df):
+  if sql_writer is not None:
+    with stage(f"SQL submit {table}", rows_in=len(df)):
+      labels = [column for column in df.columns if column not in ["value", "year"]]
+      sql_writer.submit(table, df.astype({column: '|S255' for column in labels}).assign(processed_at=dt))
 
 
 ### Common functions [To Do - move into class in separate file]
-## Function to perform gap filling by linear interpolation
-def gap_fill_dataframe(dataframe):
-  # Building a dictionary with years which have data
-  data_years = dataframe.columns.values.tolist()
-  #print(data_years)
-  all_years = [x for x in range(data_years[0],data_years[-1]+1)]
-  #print(all_years)
-  interp_dict = {
-    "year": [],
-    "years_since":  [],
-    "years_to": []
-  }
-  n = 0
-  for year in all_years:
-    interp_dict['year'].append(year)
-    if year in data_years:
-      n = 0
-      interp_dict['years_since'].append(n)
-    else:
-      n += 1
-      interp_dict['years_since'].append(n)
-  m = 0
-  for year in reversed(all_years):
-    if year in data_years:
-      m = 0
-      interp_dict['years_to'].insert(0, m)
-    else:
-      m += 1
-      interp_dict['years_to'].insert(0, m)
-    # Interpolating data in emissions summary sheet
-  for index, row in dataframe.iterrows():
-    n = 0
-    for y in interp_dict['year']:
-      ys = interp_dict['years_since'][n]
-      yt = interp_dict['years_to'][n]
-      current_year = y
-      next_year = y + yt
-      previous_year = y - ys
-      if ys != 0:
-        step = (dataframe.at[index, next_year] - dataframe.at[index, previous_year]) / (ys + yt)
-        dataframe.at[index, current_year] = dataframe.at[index, previous_year] + (step*ys)
-        #dataframe.at[index, current_year] = interp_value
-      else:
-        pass
-      n += 1
-  dataframe = dataframe[all_years]
-  return dataframe
-
-## Function to convert wide to long format
-def wide_to_long(df):
-  columns = df.columns.values.tolist()
-  col_vars = [x for x in columns if isinstance(x, str)]
-  col_vals = [x for x in columns if isinstance(x, int)]
-
-  df = pd.melt(df, id_vars=col_vars, value_vars = col_vals)
-  df = df.dropna(subset=['value'])
-  return df
-
-### Common columns for dataframes
-common_cols = ['scenario','study']
-if STATES == 'y':
-    common_cols.append('state')
-
-
-
-### Energy Processing - Transport
-# Get name of input to label output
-input_trans_filename = INPUT_TRA_FILENAME.split(".")[0]
-
-## Mapping input csv to output sector categories
-#Renaming columns sector_p to sector and enduse to subsector_detail and fuel to fuel_type
-energy_tra = energy_tra.rename(columns={"sector_p": "sector", "fuel": "fuel_type"})
-
-# Defining subsector detail based on enduse
-for index, row in energy_tra.iterrows():
-  i = eu_to_sd_dict['enduse'].index(energy_tra.at[index, "enduse"])
-  o = eu_to_sd_dict['subsector_detail'][i]
-  energy_tra.at[index, "subsector_detail"] = o
-
-# Defining subsector based on subsector detail
-energy_tra["subsector"] = ""
-for index, row in energy_tra.iterrows():
-  i = sd_to_s_dict['subsector_detail'].index(energy_tra.at[index, "subsector_detail"])
-  o = sd_to_s_dict['subsector'][i]
-  energy_tra.at[index, "subsector"] = o
-
-## Sum over years
-cols = common_cols + ['sector','subsector','subsector_detail','fuel_type','unit','year']
-energy_sum_trans = energy_tra.groupby(cols, sort=True)['val'].sum()
-energy_sum_trans_df = energy_sum_trans.to_frame()
-energy_summary_trans = pd.pivot_table(energy_sum_trans_df, values='val',index=cols[:-1], columns='year', aggfunc='sum')
-
-## Gap fill year data using linear interpolation
-energy_summary_trans = gap_fill_dataframe(energy_summary_trans)
-energy_summary_trans = energy_summary_trans.reset_index()
-print("Transport energy results processed")
-
-
-### Energy Processing - Commercial
-## Get name of input to label output
-input_com_filename = INPUT_COM_FILENAME.split(".")[0]
-
-## Mapping input csv to output sector categories
-# Setting sector names
-energy_com["sector"] = "Commercial buildings"
-
-# Setting fuel_type
-for index, row in energy_com.iterrows():
-  if energy_com.at[index, "fuel_override"] == "-":
-    energy_com.at[index, "fuel_type"] = energy_com.at[index, "fuel"]
-  else:
-    energy_com.at[index, "fuel_type"] = energy_com.at[index, "fuel_override"]
-
-# Add start fuel and end fuel for fuel switching processing
-energy_com["start_fuel"] = energy_com["fuel"]
-energy_com["end_fuel"] = energy_com["fuel_override"]
-
-# Mapping subsector
-energy_com["subsector"] = ""
-for index, row in energy_com.iterrows():
-  i = sp_to_s_dict['subsector_p'].index(energy_com.at[index, "buildingtype"])
-  o = sp_to_s_dict['subsector'][i]
-  energy_com.at[index, "subsector"] = o
-
-# Mapping subsector_detail
-energy_com["subsector_detail"] = ""
-for index, row in energy_com.iterrows():
-  i = eu_to_sd_dict['enduse'].index(energy_com.at[index, "enduse"])
-  o = eu_to_sd_dict['subsector_detail'][i]
-  energy_com.at[index, "subsector_detail"] = o
-
-# Set units
-energy_com["unit"] = "PJ"
-
-# Calculate energy demand optimised
-## Sort
-columns = energy_com.columns.values.tolist()
-remove_cols = ['val', 'val~den', 'varbl']
-sort_columns = [x for x in columns if x not in remove_cols]
-energy_com = energy_com.sort_values(by=sort_columns)
-
-
-## Calculate Eint
-value = 0
-for index, row in energy_com.iterrows():
-  if energy_com.at[index, "varbl"] == "IESTCS_EnInt":
-    value = energy_com.at[index, "val"]/energy_com.at[index, "val~den"]
-  elif energy_com.at[index, "varbl"] == "IESTCS_Out":
-    energy_com.at[index, "EInt"] = value
-    pass
-
-# Drop rows where data does not represent energy demand
-energy_com = energy_com.drop(energy_com[energy_com.varbl == "IESTCS_EnInt"].index)
-
-# Calculate energy demand
-energy_com["energy_demand"] = energy_com["val"]*energy_com["EInt"]
-
-# Create another dataframe for fuel switching processing
-energy_com_fs = energy_com
-
-## Sum over years
-cols = common_cols + ['sector','subsector','subsector_detail','fuel_type','unit','year']
-energy_sum_com = energy_com.groupby(cols, sort=True)['energy_demand'].sum()
-energy_sum_com_df = energy_sum_com.to_frame()
-energy_summary_com = pd.pivot_table(energy_sum_com_df, values='energy_demand',index=cols[:-1], columns='year', aggfunc='sum')
-
-
-## Gap fill year data using linear interpolation
-energy_summary_com = gap_fill_dataframe(energy_summary_com)
-energy_summary_com = energy_summary_com.reset_index()
-
-## Creating fuel switching output
-# Remove all rows that do not represent fuel switching
-energy_com_fs = energy_com_fs.drop(energy_com_fs[energy_com_fs.start_fuel == energy_com_fs.end_fuel].index)
-energy_com_fs = energy_com_fs.drop(energy_com_fs[energy_com_fs.end_fuel == "-"].index)
-# Sum over years
-cols = common_cols + ['sector','subsector','subsector_detail','start_fuel','end_fuel','unit','year']
-energy_com_fs = energy_com_fs.groupby(cols, sort=True)['energy_demand'].sum()
-energy_com_fs_df = energy_com_fs.to_frame()
-energy_summary_com_fs = pd.pivot_table(energy_com_fs_df, values='energy_demand',index=cols[:-1], columns='year', aggfunc='sum')
-# Gap fill year data using linear interpolation
-energy_summary_com_fs = gap_fill_dataframe(energy_summary_com_fs)
-energy_summary_com_fs = energy_summary_com_fs.reset_index()
-print("Commercial energy results processed")
-
-
-### Energy Processing - Residential
-## Get name of input to label ouput
-input_res_filename = INPUT_RES_FILENAME.split(".")[0]
-
-## Mapping input csv to output sector categories
-# Setting sector names
-energy_res["sector"] = "Residential buildings"
-
-# Add start fuel and end fuel for fuel switching processing
-energy_res["start_fuel"] = energy_res["fuel_switched"]
-energy_res["end_fuel"] = energy_res["fuel"]
-
-# Rename column fuel to fuel_type
-energy_res = energy_res.rename(columns={"fuel": "fuel_type"})
-
-## Residential
-# Mapping subsector
-energy_res["subsector"] = ""
-for index, row in energy_res.iterrows():
-  i = sp_to_s_dict['subsector_p'].index(energy_res.at[index, "subsector_p"])
-  o = sp_to_s_dict['subsector'][i]
-  energy_res.at[index, "subsector"] = o
-
-# Mapping subsector_detail
-energy_res["subsector_detail"] = ""
-for index, row in energy_res.iterrows():
-  i = eu_to_sd_dict['enduse'].index(energy_res.at[index, "enduse"])
-  o = eu_to_sd_dict['subsector_detail'][i]
-  energy_res.at[index, "subsector_detail"] = o
-
-# Create another dataframe for fuel switching processing
-energy_res_fs = energy_res
-
-## Sum over years
-cols = common_cols + ['sector','subsector','subsector_detail','fuel_type','unit','year']
-energy_sum_res = energy_res.groupby(cols, sort=True)['val'].sum()
-energy_sum_res_df = energy_sum_res.to_frame()
-energy_summary_res = pd.pivot_table(energy_sum_res_df, values='val',index=cols[:-1], columns='year', aggfunc='sum')
-
-## Gap fill year data using linear interpolation
-energy_summary_res = gap_fill_dataframe(energy_summary_res)
-energy_summary_res = energy_summary_res.reset_index()
-
-## Creating fuel switching output
-# Remove all rows that do not represent fuel switching
-energy_res_fs = energy_res_fs.drop(energy_res_fs[energy_res_fs.start_fuel == energy_res_fs.end_fuel].index)
-energy_res_fs = energy_res_fs.drop(energy_res_fs[energy_res_fs.end_fuel == "-"].index)
-energy_res_fs = energy_res_fs.drop(energy_res_fs[energy_res_fs.start_fuel == "-"].index)
-# Sum over years
-cols = common_cols + ['sector','subsector','subsector_detail','start_fuel','end_fuel','unit','year']
-energy_res_fs = energy_res_fs.groupby(cols, sort=True)['val'].sum()
-energy_res_fs_df = energy_res_fs.to_frame()
-energy_summary_res_fs = pd.pivot_table(energy_res_fs_df, values='val',index=cols[:-1], columns='year', aggfunc='sum')
-
-# Gap fill year data using linear interpolation
-energy_summary_res_fs = gap_fill_dataframe(energy_summary_res_fs)
-energy_summary_res_fs = energy_summary_res_fs.reset_index()
-print("Residential energy results processed")
-
-
-### Energy Processing - Industry
-## Get name of input to label output
-input_ind_filename = INPUT_IND_FILENAME.split(".")[0]
-
-## Mapping input csv to ouput sector categories
-# Setting sector names
-energy_ind["sector"] = "Industry"
-
-# Setting subsector detail
-energy_ind = energy_ind.rename(columns={'fuel': 'start_fuel', 'fuel_override': 'end_fuel', 'subsector_c': 'subsector_detail'})
-
-# Setting subsector
-for index, row in energy_ind.iterrows():
-  i = sd_to_s_dict['subsector_detail'].index(energy_ind.at[index, "subsector_detail"])
-  o = sd_to_s_dict['subsector'][i]
-  energy_ind.at[index, "subsector"] = o
-
-# Setting fuel_type for energy processing
-for index, row in energy_ind.iterrows():
-  if (energy_ind.at[index, "end_fuel"] == "-"):
-    energy_ind.at[index, "fuel_type"] = energy_ind.at[index, "start_fuel"]
-  else:
-    energy_ind.at[index, "fuel_type"] = energy_ind.at[index, "end_fuel"]
-
-# Set units
-energy_ind["unit"] = "PJ"
-
-# Calculate energy demand optimised
-## Sort
-columns = energy_ind.columns.values.tolist()
-remove_cols = ['val', 'val~den', 'varbl']
-sort_columns = [x for x in columns if x not in remove_cols]
-energy_ind = energy_ind.sort_values(by=sort_columns)
-
-## Calculate Eint
-value = 0
-for index, row in energy_ind.iterrows():
-  if energy_ind.at[index, "varbl"] == "IESTCS_EnInt":
-    value = energy_ind.at[index, "val"]/energy_ind.at[index, "val~den"]
-  elif energy_ind.at[index, "varbl"] == "IESTCS_Out":
-    energy_ind.at[index, "EInt"] = value
-    pass
-
-# Drop rows where data does not represent energy demand
-energy_ind = energy_ind.drop(energy_ind[energy_ind.varbl == "IESTCS_EnInt"].index)
-
-# Calculate energy demand
-energy_ind["energy_demand"] = energy_ind["val"]*energy_ind["EInt"]
-
-# Create another dataframe for fuel switching processing
-energy_ind_fs = energy_ind
-
-## Sum over years
-cols = common_cols + ['sector','subsector','subsector_detail','fuel_type','unit','year']
-energy_sum_ind = energy_ind.groupby(cols, sort=True)['energy_demand'].sum()
-energy_sum_ind_df = energy_sum_ind.to_frame()
-energy_summary_ind = pd.pivot_table(energy_sum_ind_df, values='energy_demand',index=cols[:-1], columns='year', aggfunc='sum')
-
-## Gap fill year data using linear interpolation
-energy_summary_ind = gap_fill_dataframe(energy_summary_ind)
-energy_summary_ind = energy_summary_ind.reset_index()
-
-## Creating fuel switching output
-# Remove all rows that do not represent fuel switching
-energy_ind_fs = energy_ind_fs.drop(energy_ind_fs[energy_ind_fs.start_fuel == energy_ind_fs.end_fuel].index)
-energy_ind_fs = energy_ind_fs.drop(energy_ind_fs[energy_ind_fs.end_fuel == "-"].index)
-# Sum over years
-cols = common_cols + ['sector','subsector','subsector_detail','start_fuel','end_fuel','unit','year']
-energy_ind_fs = energy_ind_fs.groupby(cols, sort=True)['energy_demand'].sum()
-energy_ind_fs_df = energy_ind_fs.to_frame()
-energy_summary_ind_fs = pd.pivot_table(energy_ind_fs_df, values='energy_demand',index=cols[:-1], columns='year', aggfunc='sum')
-# Gap fill year data using linear interpolation
-energy_summary_ind_fs = gap_fill_dataframe(energy_summary_ind_fs)
-energy_summary_ind_fs = energy_summary_ind_fs.reset_index()
-print("Industry energy results processed")
-
-
-### Energy processing - Electricity
-## Get name of input to label ouput
-input_elc_filename = INPUT_ELC_FILENAME.split(".")[0]
-
-## Set sector names
-energy_elc['sector'] = "Power"
-
-## Drop rows that do not represent input fuels (i.e. renewables and storage)
-energy_elc = energy_elc.drop(energy_elc[energy_elc.fuel == "Electricity"].index)
-energy_elc = energy_elc.drop(energy_elc[energy_elc.fuel == "Renewable"].index)
-energy_elc = energy_elc.drop(energy_elc[energy_elc.fuel == "Solar"].index)
-energy_elc = energy_elc.drop(energy_elc[energy_elc.fuel == "Wind"].index)
-
-## Set subsector names
-for index, row in energy_elc.iterrows():
-  i = t_to_s_dict['tech'].index(energy_elc.at[index, "tech"])
-  o = t_to_s_dict['technology'][i]
-  energy_elc.at[index, "subsector"] = o
-
-## Rename fuel to fuel_type
-energy_elc = energy_elc.rename(columns={"fuel": "fuel_type"})
-energy_elc['subsector_detail']=""
-
-## Calculate energy demand in PJ and rename `units`
-energy_elc['energy_demand'] = energy_elc['val']*3.6
-energy_elc['unit'] = 'PJ'
-
-## Sum over years
-cols = common_cols + ['sector','subsector','subsector_detail','fuel_type','unit','year']
-energy_sum_elc = energy_elc.groupby(cols, sort=True)['energy_demand'].sum()
-energy_sum_elc_df = energy_sum_elc.to_frame()
-energy_summary_elc = pd.pivot_table(energy_sum_elc_df, values='energy_demand',index=cols[:-1], columns='year', aggfunc='sum')
-
-## Gap fill year data using linear interpolation
-energy_summary_elc = gap_fill_dataframe(energy_summary_elc)
-energy_summary_elc = energy_summary_elc.reset_index()
-print("Electricity energy results processed")
-
-
-### Emissions
-## Get name of input to label ouput
-input_filename = INPUT_EMIS_FILENAME.split(".")[0]
-
-## Reading input files
-# Read veda report file
-core_emis_detail["sector"] = ""
-core_emis_detail["subsector"] = ""
-core_emis_detail["subsector_detail"] = ""
-core_emis_detail["emis_type"] = ""
-
-## Mapping input csv to ouput sector categories
-#Setting sector values
-for index, row in core_emis_detail.iterrows():
-  if row['sector_p'] == "LU_CO2seq" or row['sector_p'] == "DAC":
-    core_emis_detail.at[index, "sector"] = "Carbon dioxide removal"
-  elif row['sector_p'] == "Residential":
-    core_emis_detail.at[index, "sector"] = "Residential buildings"
-  elif row['sector_p'] == "Commercial":
-    core_emis_detail.at[index, "sector"] = "Commercial buildings"
-  else:
-    core_emis_detail.at[index, "sector"] = core_emis_detail.at[index, "sector_p"]
-
-# Setting subsector detail values
-for index, row in core_emis_detail.iterrows():
-  if row['sector'] == "Industry":
-    if row['subsector_p'] == "-" and row['subsector_c'] == "-":
-      if row['commodity'] == "UC_Bld_LU_CO2seq-":
-        core_emis_detail.at[index, "subsector_detail"] = "UC_Bld_LU_CO2seq-"
-      else:
-        core_emis_detail.at[index, "subsector_detail"] = "Unassigned energy emissions"
-    elif row['subsector_p'] == "-" and row['subsector_c'] != "-":
-      core_emis_detail.at[index, "subsector_detail"] = core_emis_detail.at[index, "subsector_c"]
-    else:
-      core_emis_detail.at[index, "subsector_detail"] = core_emis_detail.at[index, "subsector_p"]
-  elif row['sector'] == "Transport" or row['sector'] == "Residential buildings" or row['sector'] == "Commercial buildings":
-    i = eu_to_sd_dict['enduse'].index(core_emis_detail.at[index, "enduse"])
-    o = eu_to_sd_dict['subsector_detail'][i]
-    core_emis_detail.at[index, "subsector_detail"] = o
-  elif row['sector'] == "Carbon dioxide removal":
-    if row['sector_p'] == "LU_CO2seq":
-      core_emis_detail.at[index, "subsector_detail"] = "Land use sequestration"
-    elif row['sector_p'] == "DAC":
-      core_emis_detail.at[index, "subsector_detail"] = "Direct air capture"
-    else:
-      core_emis_detail.at[index, "subsector_detail"] = "-"
-  else:
-    core_emis_detail.at[index, "subsector_detail"] = "-"
-
-# Setting subsector values
-for index, row in core_emis_detail.iterrows():
-  if row['sector'] == "Residential buildings" or  row['sector'] == "Commercial buildings":
-    i = sp_to_s_dict['subsector_p'].index(core_emis_detail.at[index, "subsector_p"])
-    o = sp_to_s_dict['subsector'][i]
-    core_emis_detail.at[index, "subsector"] = o
-  elif row['sector'] == "Hydrogen":
-    core_emis_detail.at[index, "subsector"] = core_emis_detail.at[index, "tech"]
-  elif row['sector'] == "Carbon dioxide removal":
-    if row['subsector_detail'] == "Land use sequestration":
-      core_emis_detail.at[index, "subsector"] = "Land"
-    elif row['subsector_detail'] == "Direct air capture":
-      core_emis_detail.at[index, "subsector"] = "Engineered"
-    else:
-      core_emis_detail.at[index, "subsector"] = "-"
-  elif row['sector'] == "Power":
-    core_emis_detail.at[index, "subsector"] = core_emis_detail.at[index, "tech"]
-  elif row['sector'] == "Transport" or row['sector'] == "Industry":
-    i = sd_to_s_dict['subsector_detail'].index(core_emis_detail.at[index, "subsector_detail"])
-    o = sd_to_s_dict['subsector'][i]
-    core_emis_detail.at[index, "subsector"] = o
-  elif row['sector'] == "Carbon dioxide removal" and row['sector_p'] == "DAC":
-    core_emis_detail.at[index, "subsector"] = "Direct air capture"
-  else:
-    core_emis_detail.at[index, "subsector"] = "-"
-
-# Setting emission types
-for index, row in core_emis_detail.iterrows():
-  if row['sector'] == "Industry":
-    if row['varbl'] == "Emi_CO2":
-      if row['commodity'] == "INDCO2N":
-        core_emis_detail.at[index, "emis_type"] = "Energy"
-      elif row['commodity'] == "INDCO2P":
-        core_emis_detail.at[index, "emis_type"] = "Process"
-      else:
-        pass
-    elif row['varbl'] == "Cap_CO2":
-      core_emis_detail.at[index, "emis_type"] = "Capture"
-    elif row['varbl'] == "Emi_IndCO2_energy":
-      core_emis_detail.at[index, "emis_type"] = "Energy"
-  else:
-    i = com_to_et_dict['commodity'].index(core_emis_detail.at[index, "commodity"])
-    o = com_to_et_dict['emis_type'][i]
-    core_emis_detail.at[index, "emis_type"] = o
-
-# Drop Unassigned industry energy emissions as these represent duplicate
-core_emis_detail = core_emis_detail.drop(core_emis_detail[core_emis_detail.subsector_detail == "Unassigned energy emissions"].index)
-
-##Industry reclassifications
-# Reclassifying mineral carbonation and forestry and logging as carbon dioxide removal subsectors
-for index, row in core_emis_detail.iterrows():
-  if (row['sector'] == "Industry") and (row['source'] == "Process Negative Emissions"):
-    core_emis_detail.at[index, 'sector'] = "Carbon dioxide removal"
-    core_emis_detail.at[index, 'subsector'] = "Engineered"
-    core_emis_detail.at[index, 'subsector_detail'] = "Mineral carbonation"
-  elif (row['sector'] == "Industry") and (row['subsector'] == "Forestry and logging") and (row['emis_type'] == "Process"):
-    core_emis_detail.at[index, 'sector'] = "Carbon dioxide removal"
-    core_emis_detail.at[index, 'subsector'] = "Land"
-    core_emis_detail.at[index, 'subsector_detail'] = "Forestry and logging"
-    core_emis_detail.at[index, 'emis_type'] = 'Sequestration'
-
-core_emis_detail['unit'] = "ktCO2e"
-
-## Sum over years
-cols = common_cols + ['sector','subsector','subsector_detail','emis_type','unit','year']
-e_sum = core_emis_detail.groupby(cols, sort=True)['val'].sum()
-e_sum_df = e_sum.to_frame()
-emis_summary = pd.pivot_table(e_sum_df, values='val',index=cols[:-1], columns='year', aggfunc='sum')
-
-emis_summary = gap_fill_dataframe(emis_summary)
-emis_summary = emis_summary.reset_index()
-print("Emissions results processed")
-
-
-
-### Electricity generation and capacity
-# Get name of input to label ouput
-input_filename = INPUT_ELCG_FILENAME.split(".")[0]
-
-# Rename sector_p column to sector (all results in csv are for power)
-elec_cap_gen = elec_cap_gen.rename(columns={"sector_p": "sector"})
-
-# Mapping tech
-for index, row in elec_cap_gen.iterrows():
-  i = tech_to_technology_dict['tech'].index(elec_cap_gen.at[index, "tech"])
-  o = tech_to_technology_dict['technology'][i]
-  elec_cap_gen.at[index, "technology"] = o
-
-# Mapping tech detail
-for index, row in elec_cap_gen.iterrows():
-  process = elec_cap_gen.at[index, "process"]
-  process_code = ""
-  if "_" in process:
-    process = process.split("_")[1] # Remove prefix
-  else:
-    pass
-  if "-" in process:
-    process = process.split("-")[0] # Remove anything after dash
-  else:
-    pass
-  for char in process: # Strip process of digits
-    if (char.isdigit() == True):
-      pass
-    else:
-      process_code += char
+## Function to perform gap filling by linear interpolation, in long format
+# Only years reported for no key are filled, from the reported years either side;
+# keys missing a reported year are left out of the years interpolated from it
+def gap_fill_summary(sums):
+  with stage("gap fill", rows_in=len(sums)) as record:
+    summary = gap_fill_long(sums).rename("value").reset_index()
+    record["rows_out"] = len(summary)
+  return summary
 
-  if process_code in pc_to_td_dict['process_code']:
-    i = pc_to_td_dict['process_code'].index(process_code)
-    o = pc_to_td_dict['tech_detail'][i]
-    elec_cap_gen.at[index, "technology_detail"] = o
-  else:
-    elec_cap_gen.at[index, "technology_detail"] = "-"
-  elec_cap_gen.at[index, "process_code"] = process_code
-
-## Sum over years
-cols = common_cols + ['sector','technology','technology_detail','unit','year']
-elec_sum_cap_gen = elec_cap_gen.groupby(cols, sort=True)['val'].sum()
-elec_sum_cap_gen_df = elec_sum_cap_gen.to_frame()
-elec_summary_cap_gen = pd.pivot_table(elec_sum_cap_gen_df, values='val',index=cols[:-1], columns='year', aggfunc='sum')
-
-## Gap fill year data using linear interpolation
-elec_summary_cap_gen = gap_fill_dataframe(elec_summary_cap_gen)
-elec_summary_cap_gen = elec_summary_cap_gen.reset_index()
-print("Electricity gen/cap results processed")
-
-
-### Energy efficiency processing
-## Get name of input to label ouput
-input_ind_filename = INPUT_EnEff_IND_FILENAME.split(".")[0]
-input_bld_filename = INPUT_EnEff_BLD_FILENAME.split(".")[0]
-
-## Mapping input csv to ouput sector categories
-# Mapping sectors
-eneff_ind["sector"] = "Industry" #All entries in core eneff ind are industry (may want to split out ag as own sector in future)
-
-for index, row in eneff_bld.iterrows():
-  if eneff_bld.at[index, "sector_p"] == "Commercial":
-    eneff_bld.at[index, "sector"] = "Commercial buildings"
-  elif eneff_bld.at[index, "sector_p"] == "Residential":
-    eneff_bld.at[index, "sector"] = "Residential buildings"
-  else:
-    eneff_bld.at[index, "sector"] = "-"
-
-
-# Mapping subsector detail
-eneff_ind = eneff_ind.rename(columns={"subsector_p": "subsector_detail"})
-
-for index, row in eneff_bld.iterrows():
-  #print(eneff_bld.at[index, "enduse_c"])
-  i = eu_to_sd_dict['enduse'].index(eneff_bld.at[index, "enduse_c"])
-  o = eu_to_sd_dict['subsector_detail'][i]
-  eneff_bld.at[index, "subsector_detail"] = o
-
-# Mapping subsector
-for index, row in eneff_ind.iterrows():
-  i = sd_to_s_dict['subsector_detail'].index(eneff_ind.at[index, "subsector_detail"])
-  o = sd_to_s_dict['subsector'][i]
-  eneff_ind.at[index, "subsector"] = o
-
-for index, row in eneff_bld.iterrows():
-  i = sp_to_s_dict['subsector_p'].index(eneff_bld.at[index, "buildingtype"])
-  o = sp_to_s_dict['subsector'][i]
-  eneff_bld.at[index, "subsector"] = o
-
-# Mapping fuel
-eneff_ind = eneff_ind.rename(columns={"fuel": "fuel_type"})
-eneff_bld = eneff_bld.rename(columns={"fuel": "fuel_type"})
-
-# Mapping efficiency type
-eneff_ind = eneff_ind.rename(columns={"source": "efficiency_type"})
-eneff_bld['efficiency_type'] = "-" # No efficiency type provided in Core EnEff buildings
-
-# Mapping efficiency type
-for index, row in eneff_bld.iterrows():
-  if eneff_bld.at[index, "ee_category"] == "EE":
-    eneff_bld.at[index, "efficiency_category"] = "Commercial general"
-  elif eneff_bld.at[index, "ee_category"] == "EE new":
-    eneff_bld.at[index, "efficiency_category"] = "Residential new"
-  elif eneff_bld.at[index, "ee_category"] == "EE existing":
-    eneff_bld.at[index, "efficiency_category"] = "Residential existing"
-  else:
-    eneff_bld.at[index, "efficiency_category"] = "-"
-
-for index, row in eneff_ind.iterrows():
-  if eneff_ind.at[index, "ee_category"] == "Frontier levers":
-    eneff_ind.at[index, "efficiency_category"] = "Frontier levers"
-  elif eneff_ind.at[index, "ee_category"] == "EE 1":
-    eneff_ind.at[index, "efficiency_category"] = "Process improvements"
-  elif eneff_ind.at[index, "ee_category"] == "EE 2":
-    eneff_ind.at[index, "efficiency_category"] = "Small equipment upgrades"
-  elif eneff_ind.at[index, "ee_category"] == "EE 3":
-    eneff_ind.at[index, "efficiency_category"] = "Major equipment upgrades"
-  elif eneff_ind.at[index, "ee_category"] == "ETI":
-    eneff_ind.at[index, "efficiency_category"] = "ETI upgrade"
-  else:
-    eneff_ind.at[index, "efficiency_category"] = "-"
-
-## Sum over years
-cols = common_cols + ['sector','subsector','subsector_detail','fuel_type','efficiency_category','efficiency_type','unit','year']
-eneff_sum_ind = eneff_ind.groupby(cols, sort=True)['val'].sum()
-energy_sum_ind_df = eneff_sum_ind.to_frame()
-eneff_summary_ind = pd.pivot_table(energy_sum_ind_df, values='val',index=cols[:-1], columns='year', aggfunc='sum')
-
-eneff_sum_bld = eneff_bld.groupby(cols, sort=True)['val'].sum()
-energy_sum_bld_df = eneff_sum_bld.to_frame()
-eneff_summary_bld = pd.pivot_table(energy_sum_bld_df, values='val',index=cols[:-1], columns='year', aggfunc='sum')
-
-# Combine dataframes
-eneff_summary = pd.concat([eneff_summary_ind, eneff_summary_bld], axis=0)
-
-
-## Gap fill year data using linear interpolation
-eneff_summary = gap_fill_dataframe(eneff_summary)
-eneff_summary = eneff_summary.reset_index()
-print("Energy efficiency results processed")
-
-
-
-### H2 generation and capacity
-## Get name of input to label output
-input_filename = INPUT_H2GC_FILENAME.split(".")[0]
-
-## Mapping input csv to output sector categories
-# Mapping sectors
-H2_gen_cap["sector"] = H2_gen_cap["sector_p"]
-
-# Mapping subsector and subsector detail
-H2_gen_cap['subsector'] = ""
-H2_gen_cap['subsector_detail'] = ""
-for index, row in H2_gen_cap.iterrows():
-  p = row['process'].split("_")[1] + "_" + row['process'].split("_")[2]
-  #print(p)
-  if p == "SMR_ccs":
-    H2_gen_cap.at[index, "subsector"] = "Steam methane reforming"
-    H2_gen_cap.at[index, "subsector_detail"] = "Gas-SMR with CCS"
-  elif p == "elec_AE":
-    H2_gen_cap.at[index, "subsector"] = "Electrolysis"
-    H2_gen_cap.at[index, "subsector_detail"] = "Alkaline water electrolysis"
-  elif p == "elec_PEM":
-    H2_gen_cap.at[index, "subsector"] = "Electrolysis"
-    H2_gen_cap.at[index, "subsector_detail"] = "Proton exchange membrane electrolysis"
-  else:
-    H2_gen_cap.at[index, "subsector"] = "-"
-    H2_gen_cap.at[index, "subsector_detail"] = "-"
+### Processing and export. If anything fails, the concurrent writer's workers, connections and staging tables
+### are cleared up, also on Ctrl+C (the SQL tables are only written once every table is staged)
+try:
+  ### Common columns for dataframes
+  common_cols = ['scenario','study']
+  if STATES == 'y':
+      common_cols.append('state')
 
-## Rename value column
-H2_gen_cap = H2_gen_cap.rename(columns={"GrandTotal": "val"})
 
-## Sum over years
-cols = common_cols + ['sector','subsector','subsector_detail','unit','year']
-H2_gen_cap_sum = H2_gen_cap.groupby(by=cols, as_index=False, sort=True)['val'].sum()
-H2_gen_cap_summary = pd.pivot_table(H2_gen_cap_sum, values='val',index=cols[:-1], columns='year', aggfunc='sum')
-## Gap fill data
-H2_gen_cap_summary = gap_fill_dataframe(H2_gen_cap_summary)
-H2_gen_cap_summary = H2_gen_cap_summary.reset_index()
-print("Hydrogen gen/cap results processed")
 
+  ### Energy Processing - Transport
+  start_stage("transport")
+  # Get name of input to label output
+  input_trans_filename = INPUT_TRA_FILENAME.split(".")[0]
 
-## Combine energy and fuel switching dataframes
-combined_energy = pd.concat([energy_summary_trans, energy_summary_com, energy_summary_res, energy_summary_ind, energy_summary_elc], axis=0)
-combined_fuelswitch = pd.concat([energy_summary_com_fs, energy_summary_res_fs, energy_summary_ind_fs])
+  ## Mapping input csv to output sector categories
+  #Renaming columns sector_p to sector and enduse to subsector_detail and fuel to fuel_type
+  energy_tra = energy_tra.rename(columns={"sector_p": "sector", "fuel": "fuel_type"})
 
-## Convert to long format
-combined_energy = wide_to_long(combined_energy)
-combined_fuelswitch = wide_to_long(combined_fuelswitch)
-emis_summary = wide_to_long(emis_summary)
-elec_summary_cap_gen = wide_to_long(elec_summary_cap_gen)
-eneff_summary = wide_to_long(eneff_summary)
-H2_gen_cap_summary = wide_to_long(H2_gen_cap_summary)
+  # Defining subsector detail based on enduse
+  energy_tra["subsector_detail"] = mappings.map("enduse", energy_tra["enduse"])
 
+  # Defining subsector based on subsector detail
+  energy_tra["subsector"] = mappings.map("sd2s", energy_tra["subsector_detail"])
 
-### Exporting data files
-# Specify the nested directory structure
-nested_directory_path = Path("outputs/" + dt)
+  ## Sum over years
+  cols = common_cols + ['sector','subsector','subsector_detail','fuel_type','unit','year']
+  energy_sum_trans = energy_tra.groupby(cols, sort=True, observed=True)['val'].sum()
 
-# Create nested directories
-nested_directory_path.mkdir(parents=True, exist_ok=True)
-print(f"Files will be exported to '{nested_directory_path}'.")
+  ## Gap fill year data using linear interpolation
+  energy_summary_trans = gap_fill_summary(energy_sum_trans)
+  end_stage(rows_out=len(energy_summary_trans))
+  print("Transport energy results processed")
 
-output_path = OUTPUT_PATH + nested_directory_path.name + "/"
 
+  ### Energy Processing - Commercial
+  start_stage("commercial")
+  ## Get name of input to label output
+  input_com_filename = INPUT_COM_FILENAME.split(".")[0]
+
+  ## Mapping input csv to output sector categories
+  # Setting sector names
+  energy_com["sector"] = "Commercial buildings"
+
+  # Setting fuel_type, and start fuel and end fuel for fuel switching processing
+  energy_com = resolve_fuels(energy_com, 'commercial_fuel_type')
+
+  # Mapping subsector
+  energy_com["subsector"] = mappings.map("sp2s", energy_com["buildingtype"])
+
+  # Mapping subsector_detail
+  energy_com["subsector_detail"] = mappings.map("enduse", energy_com["enduse"])
 
+  # Set units
+  energy_com["unit"] = "PJ"
 
-#Export csvs
-combined_energy.to_csv(output_path +  "energy" + ".csv", index=False)
-combined_fuelswitch.to_csv(output_path +  "fuel-switch" + ".csv", index=False)
-emis_summary.to_csv(output_path +  "emissions" + ".csv", index=False)
-elec_summary_cap_gen.to_csv(output_path +  "electricity-gen-cap" + ".csv", index=False)
-eneff_summary.to_csv(output_path +  "energy-efficiency" + ".csv", index=False)
-H2_gen_cap_summary.to_csv(output_path +  "hydrogen-generation-capacity" + ".csv", index=False)
-print("csv files exported")
+  # Calculate energy demand optimised
+  ## Sort
+  columns = energy_com.columns.values.tolist()
+  remove_cols = ['val', 'val~den', 'varbl']
+  sort_columns = [x for x in columns if x not in remove_cols]
 
+  ## Calculate Eint
+  energy_com = calculate_eint(energy_com, sort_columns)
 
-### Add data to SQL server
-#Convert datatypes
-print("Writing files to SQL database")
-dfs = [combined_energy, combined_fuelswitch, emis_summary, elec_summary_cap_gen, eneff_summary, H2_gen_cap_summary]
-for df in dfs:
-  columns = list(df.columns.values)
-  for column in columns:
-    if column != 'value' and column != 'year':
-      df[column] = df[column].astype('|S255')
-  #print(combined_energy.dtypes)
+  # Drop rows where data does not represent energy demand
+  energy_com = energy_com.drop(energy_com[energy_com.varbl == "IESTCS_EnInt"].index)
+
+  # Calculate energy demand
+  energy_com["energy_demand"] = energy_com["val"]*energy_com["EInt"]
+
+  # Create another dataframe for fuel switching processing
+  energy_com_fs = energy_com
+
+  ## Sum over years
+  cols = common_cols + ['sector','subsector','subsector_detail','fuel_type','unit','year']
+  energy_sum_com = energy_com.groupby(cols, sort=True, observed=True)['energy_demand'].sum()
+
+  ## Gap fill year data using linear interpolation
+  energy_summary_com = gap_fill_summary(energy_sum_com)
+
+  ## Creating fuel switching output
+  # Remove all rows that do not represent fuel switching
+  energy_com_fs = energy_com_fs.drop(energy_com_fs[energy_com_fs.start_fuel == energy_com_fs.end_fuel].index)
+  energy_com_fs = energy_com_fs.drop(energy_com_fs[energy_com_fs.end_fuel == "-"].index)
+  # Sum over years
+  cols = common_cols + ['sector','subsector','subsector_detail','start_fuel','end_fuel','unit','year']
+  energy_com_fs = energy_com_fs.groupby(cols, sort=True, observed=True)['energy_demand'].sum()
+  # Gap fill year data using linear interpolation
+  energy_summary_com_fs = gap_fill_summary(energy_com_fs)
+  end_stage(rows_out=len(energy_summary_com) + len(energy_summary_com_fs))
+  print("Commercial energy results processed")
+
+
+  ### Energy Processing - Residential
+  start_stage("residential")
+  ## Get name of input to label ouput
+  input_res_filename = INPUT_RES_FILENAME.split(".")[0]
+
+  ## Mapping input csv to output sector categories
+  # Setting sector names
+  energy_res["sector"] = "Residential buildings"
+
+  # Add start fuel and end fuel for fuel switching processing
+  energy_res["start_fuel"] = energy_res["fuel_switched"]
+  energy_res["end_fuel"] = energy_res["fuel"]
+
+  # Rename column fuel to fuel_type
+  energy_res = energy_res.rename(columns={"fuel": "fuel_type"})
+
+  ## Residential
+  # Mapping subsector
+  energy_res["subsector"] = mappings.map("sp2s", energy_res["subsector_p"])
+
+  # Mapping subsector_detail
+  energy_res["subsector_detail"] = mappings.map("enduse", energy_res["enduse"])
+
+  # Create another dataframe for fuel switching processing
+  energy_res_fs = energy_res
+
+  ## Sum over years
+  cols = common_cols + ['sector','subsector','subsector_detail','fuel_type','unit','year']
+  energy_sum_res = energy_res.groupby(cols, sort=True, observed=True)['val'].sum()
+
+  ## Gap fill year data using linear interpolation
+  energy_summary_res = gap_fill_summary(energy_sum_res)
+
+  ## Creating fuel switching output
+  # Remove all rows that do not represent fuel switching
+  energy_res_fs = energy_res_fs.drop(energy_res_fs[energy_res_fs.start_fuel == energy_res_fs.end_fuel].index)
+  energy_res_fs = energy_res_fs.drop(energy_res_fs[energy_res_fs.end_fuel == "-"].index)
+  energy_res_fs = energy_res_fs.drop(energy_res_fs[energy_res_fs.start_fuel == "-"].index)
+  # Sum over years
+  cols = common_cols + ['sector','subsector','subsector_detail','start_fuel','end_fuel','unit','year']
+  energy_res_fs = energy_res_fs.groupby(cols, sort=True, observed=True)['val'].sum()
+  # Gap fill year data using linear interpolation
+  energy_summary_res_fs = gap_fill_summary(energy_res_fs)
+  end_stage(rows_out=len(energy_summary_res) + len(energy_summary_res_fs))
+  print("Residential energy results processed")
+
+
+  ### Energy Processing - Industry
+  start_stage("industry")
+  ## Get name of input to label output
+  input_ind_filename = INPUT_IND_FILENAME.split(".")[0]
+
+  ## Mapping input csv to ouput sector categories
+  # Setting sector names
+  energy_ind["sector"] = "Industry"
+
+  # Setting subsector detail
+  energy_ind = energy_ind.rename(columns={'fuel': 'start_fuel', 'fuel_override': 'end_fuel', 'subsector_c': 'subsector_detail'})
+
+  # Setting subsector
+  energy_ind["subsector"] = mappings.map("sd2s", energy_ind["subsector_detail"])
+
+  # Setting fuel_type for energy processing
+  energy_ind = resolve_fuels(energy_ind, 'industry_fuel_type')
+
+  # Set units
+  energy_ind["unit"] = "PJ"
+
+  # Calculate energy demand optimised
+  ## Sort
+  columns = energy_ind.columns.values.tolist()
+  remove_cols = ['val', 'val~den', 'varbl']
+  sort_columns = [x for x in columns if x not in remove_cols]
+
+  ## Calculate Eint
+  energy_ind = calculate_eint(energy_ind, sort_columns)
+
+  # Drop rows where data does not represent energy demand
+  energy_ind = energy_ind.drop(energy_ind[energy_ind.varbl == "IESTCS_EnInt"].index)
+
+  # Calculate energy demand
+  energy_ind["energy_demand"] = energy_ind["val"]*energy_ind["EInt"]
+
+  # Create another dataframe for fuel switching processing
+  energy_ind_fs = energy_ind
+
+  ## Sum over years
+  cols = common_cols + ['sector','subsector','subsector_detail','fuel_type','unit','year']
+  energy_sum_ind = energy_ind.groupby(cols, sort=True, observed=True)['energy_demand'].sum()
+
+  ## Gap fill year data using linear interpolation
+  energy_summary_ind = gap_fill_summary(energy_sum_ind)
+
+  ## Creating fuel switching output
+  # Remove all rows that do not represent fuel switching
+  energy_ind_fs = energy_ind_fs.drop(energy_ind_fs[energy_ind_fs.start_fuel == energy_ind_fs.end_fuel].index)
+  energy_ind_fs = energy_ind_fs.drop(energy_ind_fs[energy_ind_fs.end_fuel == "-"].index)
+  # Sum over years
+  cols = common_cols + ['sector','subsector','subsector_detail','start_fuel','end_fuel','unit','year']
+  energy_ind_fs = energy_ind_fs.groupby(cols, sort=True, observed=True)['energy_demand'].sum()
+  # Gap fill year data using linear interpolation
+  energy_summary_ind_fs = gap_fill_summary(energy_ind_fs)
+  end_stage(rows_out=len(energy_summary_ind) + len(energy_summary_ind_fs))
+  print("Industry energy results processed")
+
+
+  ### Energy processing - Electricity
+  start_stage("electricity")
+  ## Get name of input to label ouput
+  input_elc_filename = INPUT_ELC_FILENAME.split(".")[0]
+
+  ## Set sector names
+  energy_elc['sector'] = "Power"
+
+  ## Drop rows that do not represent input fuels (i.e. renewables and storage)
+  energy_elc = energy_elc.drop(energy_elc[energy_elc.fuel == "Electricity"].index)
+  energy_elc = energy_elc.drop(energy_elc[energy_elc.fuel == "Renewable"].index)
+  energy_elc = energy_elc.drop(energy_elc[energy_elc.fuel == "Solar"].index)
+  energy_elc = energy_elc.drop(energy_elc[energy_elc.fuel == "Wind"].index)
+
+  ## Set subsector names
+  energy_elc["subsector"] = mappings.map("t2tech", energy_elc["tech"])
+
+  ## Rename fuel to fuel_type
+  energy_elc = energy_elc.rename(columns={"fuel": "fuel_type"})
+  energy_elc['subsector_detail']=""
+
+  ## Calculate energy demand in PJ and rename `units`
+  energy_elc['energy_demand'] = energy_elc['val']*3.6
+  energy_elc['unit'] = 'PJ'
+
+  ## Sum over years
+  cols = common_cols + ['sector','subsector','subsector_detail','fuel_type','unit','year']
+  energy_sum_elc = energy_elc.groupby(cols, sort=True, observed=True)['energy_demand'].sum()
+
+  ## Gap fill year data using linear interpolation
+  energy_summary_elc = gap_fill_summary(energy_sum_elc)
+  end_stage(rows_out=len(energy_summary_elc))
+  print("Electricity energy results processed")
+
+
+  ### Emissions
+  start_stage("emissions")
+  ## Get name of input to label ouput
+  input_filename = INPUT_EMIS_FILENAME.split(".")[0]
+
+  ## Mapping input csv to ouput sector categories
+  # Setting sector, subsector, subsector detail and emission type values, including
+  # the industry reclassifications of mineral carbonation and forestry and logging
+  # as carbon dioxide removal (rules in emissions_rules.py)
+  emis_rule_counts = classify_emissions(core_emis_detail, "sql", mappings)
+  print("Emissions rows classified by each rule:\n" + emis_rule_counts.to_string())
+
+  # Drop Unassigned industry energy emissions as these represent duplicate
+  core_emis_detail = core_emis_detail.drop(core_emis_detail[core_emis_detail.subsector_detail == "Unassigned energy emissions"].index)
+
+  core_emis_detail['unit'] = "ktCO2e"
+
+  ## Sum over years
+  cols = common_cols + ['sector','subsector','subsector_detail','emis_type','unit','year']
+  e_sum = core_emis_detail.groupby(cols, sort=True, observed=True)['val'].sum()
+  emis_summary = gap_fill_summary(e_sum)
+  end_stage(rows_out=len(emis_summary))
+  print("Emissions results processed")
+  submit_sql("Emissions", emis_summary)
+
+
+
+  ### Electricity generation and capacity
+  start_stage("electricity gen/cap")
+  # Get name of input to label ouput
+  input_filename = INPUT_ELCG_FILENAME.split(".")[0]
+
+  # Rename sector_p column to sector (all results in csv are for power)
+  elec_cap_gen = elec_cap_gen.rename(columns={"sector_p": "sector"})
+
+  # Mapping tech
+  elec_cap_gen["technology"] = mappings.map("t2tech", elec_cap_gen["tech"])
+
+  # Mapping tech detail from the process code (process name without prefix, suffix and digits)
+  # Process codes without a tech detail mapping are labelled "-"
+  elec_cap_gen["process_code"] = process_codes(elec_cap_gen["process"])
+  elec_cap_gen["technology_detail"] = mappings.map("pc2td", elec_cap_gen["process_code"], report=False).fillna("-")
+
+  ## Sum over years
+  cols = common_cols + ['sector','technology','technology_detail','unit','year']
+  elec_sum_cap_gen = elec_cap_gen.groupby(cols, sort=True, observed=True)['val'].sum()
+
+  ## Gap fill year data using linear interpolation
+  elec_summary_cap_gen = gap_fill_summary(elec_sum_cap_gen)
+  end_stage(rows_out=len(elec_summary_cap_gen))
+  print("Electricity gen/cap results processed")
+  submit_sql("ElectricityGenCap", elec_summary_cap_gen)
+
+
+  ### Energy efficiency processing
+  start_stage("energy efficiency")
+  ## Get name of input to label ouput
+  input_ind_filename = INPUT_EnEff_IND_FILENAME.split(".")[0]
+  input_bld_filename = INPUT_EnEff_BLD_FILENAME.split(".")[0]
+
+  ## Mapping input csv to ouput sector categories
+  # Mapping sectors
+  eneff_ind["sector"] = "Industry" #All entries in core eneff ind are industry (may want to split out ag as own sector in future)
+
+  eneff_bld["sector"] = building_sectors(eneff_bld["sector_p"])
+
+  # Mapping subsector detail
+  eneff_ind = eneff_ind.rename(columns={"subsector_p": "subsector_detail"})
+
+  eneff_bld["subsector_detail"] = mappings.map("enduse", eneff_bld["enduse_c"])
+
+  # Mapping subsector
+  eneff_ind["subsector"] = mappings.map("sd2s", eneff_ind["subsector_detail"])
+  eneff_bld["subsector"] = mappings.map("sp2s", eneff_bld["buildingtype"])
+
+  # Mapping fuel
+  eneff_ind = eneff_ind.rename(columns={"fuel": "fuel_type"})
+  eneff_bld = eneff_bld.rename(columns={"fuel": "fuel_type"})
+
+  # Mapping efficiency type
+  eneff_ind = eneff_ind.rename(columns={"source": "efficiency_type"})
+  eneff_bld['efficiency_type'] = "-" # No efficiency type provided in Core EnEff buildings
+
+  # Mapping efficiency category (see efficiency_categories.py)
+  eneff_bld["efficiency_category"] = efficiency_categories(eneff_bld["ee_category"], "eneff_bld")
+  eneff_ind["efficiency_category"] = efficiency_categories(eneff_ind["ee_category"], "eneff_ind")
+
+  ## Sum over years
+  cols = common_cols + ['sector','subsector','subsector_detail','fuel_type','efficiency_category','efficiency_type','unit','year']
+  eneff_sum_ind = eneff_ind.groupby(cols, sort=True, observed=True)['val'].sum()
+  eneff_sum_bld = eneff_bld.groupby(cols, sort=True, observed=True)['val'].sum()
+
+  # Combine dataframes
+  eneff_sum = pd.concat([eneff_sum_ind, eneff_sum_bld], axis=0)
+
+  ## Gap fill year data using linear interpolation
+  eneff_summary = gap_fill_summary(eneff_sum)
+  end_stage(rows_out=len(eneff_summary))
+  print("Energy efficiency results processed")
+  submit_sql("EnergyEfficiency", eneff_summary)
+
+
+
+  ### H2 generation and capacity
+  start_stage("hydrogen gen/cap")
+  ## Get name of input to label output
+  input_filename = INPUT_H2GC_FILENAME.split(".")[0]
+
+  ## Mapping input csv to output sector categories
+  # Mapping sectors
+  H2_gen_cap["sector"] = H2_gen_cap["sector_p"]
+
+  # Mapping subsector and subsector detail from the process type (see H2_PROCESS_TYPES)
+  H2_gen_cap[["subsector", "subsector_detail"]] = classify_h2_processes(H2_gen_cap["process"])
+
+  ## Rename value column (GrandTotal is used where an export has both GrandTotal and val)
+  H2_gen_cap = H2_gen_cap.drop(columns="val", errors="ignore").rename(columns={"GrandTotal": "val"})
+
+  ## Sum over years
+  cols = common_cols + ['sector','subsector','subsector_detail','unit','year']
+  H2_gen_cap_sum = H2_gen_cap.groupby(by=cols, sort=True, observed=True)['val'].sum()
+  ## Gap fill data
+  H2_gen_cap_summary = gap_fill_summary(H2_gen_cap_sum)
+  end_stage(rows_out=len(H2_gen_cap_summary))
+  print("Hydrogen gen/cap results processed")
+  submit_sql("HydrogenGenCap", H2_gen_cap_summary)
+
+  ## Stop before exporting if any keys were missing from the mapping files
+  mappings.raise_for_unmapped()
+
+
+  ## Combine energy and fuel switching dataframes
+  combined_energy = pd.concat([energy_summary_trans, energy_summary_com, energy_summary_res, energy_summary_ind, energy_summary_elc], axis=0, ignore_index=True)
+  combined_fuelswitch = pd.concat([energy_summary_com_fs, energy_summary_res_fs, energy_summary_ind_fs], axis=0, ignore_index=True)
+  submit_sql("FuelSwitch", combined_fuelswitch)
+  submit_sql("Energy", combined_energy)
+
+
+  ### Exporting data files
+  # Specify the nested directory structure
+  nested_directory_path = Path("outputs/" + dt)
+
+  # Create nested directories
+  nested_directory_path.mkdir(parents=True, exist_ok=True)
+  print(f"Files will be exported to '{nested_directory_path}'.")
+
+  output_path = OUTPUT_PATH + nested_directory_path.name + "/"
+
+
+
+  #Export files
+  start_stage("export")
+  writer.write(combined_energy, output_path, "energy")
+  writer.write(combined_fuelswitch, output_path, "fuel-switch")
+  writer.write(emis_summary, output_path, "emissions")
+  writer.write(elec_summary_cap_gen, output_path, "electricity-gen-cap")
+  writer.write(eneff_summary, output_path, "energy-efficiency")
+  writer.write(H2_gen_cap_summary, output_path, "hydrogen-generation-capacity")
+  end_stage()
+  print(f"{OUTPUT_FORMAT} files exported")
+
+
+  ### Add data to SQL server
+  #Convert datatypes
+  print("Writing files to SQL database")
+  start_stage("SQL load")
+  #(Dimension tables take the labels as text, and fact tables only their integer keys)
+  if SQL_DIMENSIONS != "y" and sql_writer is None:
+    dfs = [combined_energy, combined_fuelswitch, emis_summary, elec_summary_cap_gen, eneff_summary, H2_gen_cap_summary]
+    for df in dfs:
+      columns = list(df.columns.values)
+      for column in columns:
+        if column != 'value' and column != 'year':
+          df[column] = df[column].astype('|S255')
+      #print(combined_energy.dtypes)
+
+  # Copy the staged tables into the SQL tables, or load them one after another
+  if sql_writer is not None:
+    sql_writer.finish()
+    print("All tables written to SQL database")
+  else:
+    # Connect to database
+    connection = pyodbc.connect(conn_str)
+
+    # Write tables in batches, committing once all tables are loaded (replacing the run's earlier rows with a run id)
+    if SQL_DIMENSIONS == "y":
+      loader = StarLoader(SQLServerAdapter(connection), run_id=run_id or dt, processed_at=dt, batch_size=SQL_BATCH_SIZE,
+                          replace=run_id is not None)
+    else:
+      loader = BulkLoader(SQLServerAdapter(connection), batch_size=SQL_BATCH_SIZE, staging=SQL_STAGING == "y", run_id=run_id)
+
+    #Fuelswitch
+    loader.load("FuelSwitch", combined_fuelswitch.assign(processed_at=dt))
+    print("FuelSwitch table data written to SQL database")
+
+    #Energy
+    loader.load("Energy", combined_energy.assign(processed_at=dt))
+    print("Energy table data written to SQL database")
+
+    #Emissions
+    loader.load("Emissions", emis_summary.assign(processed_at=dt))
+    print("Emissions data written to SQL database")
+
+    #ElecGenCap
+    loader.load("ElectricityGenCap", elec_summary_cap_gen.assign(processed_at=dt))
+    print("Electricty Generation and Capacity data written to SQL database")
+
+    #EnergyEfficiency
+    loader.load("EnergyEfficiency", eneff_summary.assign(processed_at=dt))
+    print("Energy efficiency data written to SQL database")
+
+    #H2GenCap
+    loader.load("HydrogenGenCap", H2_gen_cap_summary.assign(processed_at=dt))
+    print("Hydrogen Generation and Capacity data written to SQL database")
+
+    connection.commit()
+    connection.close()
+  end_stage()
+except BaseException:
+  if sql_writer is not None:
+    sql_writer.abort()
+  raise
 
-# Connect to database
-conn_str = f"driver={DRIVER};server={SERVER};database={DATABASE};trusted_connection=yes;"
-connection = pyodbc.connect(conn_str)
-cursor = connection.cursor()
-
-#Fuelswitch
-for index, row in combined_fuelswitch.iterrows():
-    cursor.execute("INSERT INTO DevAusTIMES.dbo.FuelSwitch (study,scenario,_state,sector,subsector,subsector_detail,start_fuel,end_fuel,unit,_year,_value,processed_at) values(?,?,?,?,?,?,?,?,?,?,?,?)",
-                   row.study,row.scenario, row.state, row.sector,row.subsector,row.subsector_detail,row.start_fuel,row.end_fuel,row.unit,row.year,row.value,dt)
-print("FuelSwitch table data written to SQL database")
-
-#Energy
-for index, row in combined_energy.iterrows():
-    cursor.execute("INSERT INTO DevAusTIMES.dbo.Energy (study,scenario,_state,sector,subsector,subsector_detail,fuel_type,unit,_year,_value,processed_at) values(?,?,?,?,?,?,?,?,?,?,?)",
-                   row.study,row.scenario, row.state, row.sector,row.subsector,row.subsector_detail,row.fuel_type,row.unit,row.year,row.value,dt)
-print("Energy table data written to SQL database")
-
-#Emissions
-for index, row in emis_summary.iterrows():
-    cursor.execute("INSERT INTO DevAusTIMES.dbo.Emissions (study,scenario,_state,sector,subsector,subsector_detail,emis_type,unit,_year,_value,processed_at) values(?,?,?,?,?,?,?,?,?,?,?)",
-                   row.study,row.scenario, row.state, row.sector,row.subsector,row.subsector_detail,row.emis_type,row.unit,row.year,row.value,dt)
-print("Emissions data written to SQL database")
-
-#ElecGenCap
-for index, row in elec_summary_cap_gen.iterrows():
-    cursor.execute("INSERT INTO DevAusTIMES.dbo.ElectricityGenCap (study,scenario,_state,sector,technology,technology_detail,unit,_year,_value,processed_at) values(?,?,?,?,?,?,?,?,?,?)",
-                   row.study,row.scenario, row.state, row.sector,row.technology,row.technology_detail,row.unit,row.year,row.value,dt)
-print("Electricty Generation and Capacity data written to SQL database")
-
-#EnergyEfficiency
-for index, row in eneff_summary.iterrows():
-    cursor.execute("INSERT INTO DevAusTIMES.dbo.EnergyEfficiency (study,scenario,_state,sector,subsector,subsector_detail,fuel_type,efficiency_type,unit,_year,_value,processed_at) values(?,?,?,?,?,?,?,?,?,?,?,?)",
-                   row.study,row.scenario, row.state, row.sector,row.subsector,row.subsector_detail,row.fuel_type,row.efficiency_type,row.unit,row.year,row.value,dt)
-print("Energy efficiency data written to SQL database")
-
-#H2GenCap
-for index, row in H2_gen_cap_summary.iterrows():
-    cursor.execute("INSERT INTO DevAusTIMES.dbo.HydrogenGenCap (study,scenario,_state,sector,subsector,subsector_detail,unit,_year,_value,processed_at) values(?,?,?,?,?,?,?,?,?,?)",
-                   row.study,row.scenario, row.state, row.sector,row.subsector,row.subsector_detail,row.unit,row.year,row.value,dt)
-print("Hydrogen Generation and Capacity data written to SQL database")
-
-connection.commit()
-cursor.close()
 print("Writing data to SQL database complete")
 print("Processing complete")
 
 now = datetime.now()
 run_time =  datetime.now(tz_Melbourne) - datetime_Melbourne
 print(f"Script ran in: {run_time}")
+
+### Times, rows and memory of each section
+report = write_report(output_path + "run_report.json", script="process_to_sql.py", timestamp=dt,
+                      run_time_s=run_time.total_seconds(), options={"STATES": STATES, "SQL_BATCH_SIZE": SQL_BATCH_SIZE,
+                      "SQL_STAGING": SQL_STAGING, "SQL_DIMENSIONS": SQL_DIMENSIONS, "SQL_LOAD_MODE": SQL_LOAD_MODE, "OUTPUT_FORMAT": OUTPUT_FORMAT},
+                      run_id=run_id)
+print(f"Run report written to {report}")
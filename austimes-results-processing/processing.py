@@ -1,18 +1,45 @@
+import argparse
+import glob
 import warnings
 from datetime import datetime
+from functools import partial
+from itertools import chain
 from pathlib import Path
 
 import pandas as pd
 import pytz
 from directories import Directories
-from openpyxl import load_workbook
-import shutil
+from efficiency_categories import building_sectors, efficiency_categories
+from emissions_rules import classify_emissions
+from energy_intensity import calculate_eint
+from excel_export import export_templates
+from export_pipeline import ExportPipeline
+from fuel_resolution import resolve_fuels
+from gap_filling import gap_fill, gap_fill_long
+from input_cache import clear_cache, set_cache_enabled
+from instrumentation import PROFILERS, add_records, run_stage, set_profiling, stage, write_report
+from manifest import Manifest, code_version
+from output_writers import output_writer
+from mappings import MappingRegistry
+from process_codes import process_codes
+from ingestion import iter_input, iter_input_groups, read_input
+from scheduler import run_modules
 
 # ---------------------------------------------
 # Configuration
 # ---------------------------------------------
 STATES = True           # Split results by state?
 WIDE_FORMAT = True      # True for wide ("w"), False for long ("l")
+PARALLEL = True         # Run modules in parallel worker processes? (False runs them in serial, for debugging)
+MAX_WORKERS = None      # Worker processes when PARALLEL (None = one per CPU)
+CSV_ENGINE = None       # CSV parser for inputs: None for the pandas default, or 'pyarrow' (faster, requires pyarrow)
+INCREMENTAL = True      # Reuse stored module summaries when a module's inputs, mappings and code are unchanged?
+STREAMING = False       # Read inputs in chunks, aggregating each before reading the next? (for inputs larger than memory)
+CHUNK_ROWS = 1_000_000  # Rows read at a time when STREAMING
+OUTPUT_FORMAT = 'csv'   # Output file format: 'csv', 'parquet' or 'feather' (parquet and feather require pyarrow)
+OUTPUT_OPTIONS = {}     # Writer options, e.g. {'compression': 'zstd', 'partition_cols': ['scenario', 'state']} for parquet
+EXPORT_THREAD = True    # Write each output table in a background thread as soon as it is ready? (False writes them in turn)
+EXCEL_TEMPLATES = {}    # Excel visualisation templates in TEMPLATE_PATH to fill: {template file: {sheet: output table}}
 
 # Input filenames
 INPUT_FILES = {
@@ -23,7 +50,9 @@ INPUT_FILES = {
     'power': 'FE_power.csv',
     'emissions': 'CO2 emissions.csv',
     'elec_cap_gen': 'Elec capacity and generation.csv',
-    'h2': 'H2 capacity and generation.csv'
+    'h2': 'H2 capacity and generation.csv',
+    'eneff_ind': 'CORE-EnEff Industry.csv',
+    'eneff_bld': 'CORE-EnEff Buildings.csv',
 }
 
 # Directories
@@ -31,6 +60,8 @@ dirs = Directories()
 INPUT_PATH = Path(dirs.INPUT_PATH)
 OUTPUT_PATH = Path(dirs.OUTPUT_PATH)
 MAPPING_PATH = Path(dirs.MAPPING_PATH)
+SUMMARY_PATH = Path(dirs.CACHE_PATH) / 'summaries'
+TEMPLATE_PATH = Path(dirs.TEMPLATE_PATH)
 
 # Timestamp
 melb_tz = pytz.timezone('Australia/Melbourne')
@@ -43,47 +74,84 @@ warnings.simplefilter('ignore', category=pd.errors.PerformanceWarning)
 # Helper Functions
 # ---------------------------------------------
 
-def read_mapping(filename, key_col, val_col):
-    df = pd.read_csv(MAPPING_PATH / filename)
-    return dict(zip(df[key_col], df[val_col]))
-
-# Linear gap-fill of columns (assumes numeric year columns)
-def gap_fill(df):
-    """Expands df with missing years and interpolates linearly."""
-    df = df.copy()
-
-    # Only include columns that are integers (i.e., years)
-    year_cols = [col for col in df.columns if isinstance(col, int)]
-
-    if not year_cols:
-        # Check if any column names look like years (string but numeric)
-        str_years = [col for col in df.columns if str(col).isdigit()]
-        df.columns = [int(col) if str(col).isdigit() else col for col in df.columns]
-        year_cols = [col for col in df.columns if isinstance(col, int)]
-
-    if not year_cols:
-        return df  # Still nothing, exit safely
-
-    year_cols = sorted(year_cols)
-    full_years = list(range(year_cols[0], year_cols[-1] + 1))
-
-    for year in full_years:
-        if year not in df.columns:
-            df[year] = pd.NA
-
-    df = df.sort_index(axis=1)
-    df[full_years] = df[full_years].apply(pd.to_numeric, errors='coerce')
-    df[full_years] = df[full_years].interpolate(axis=1, limit_direction='both')
-    return df
-
-# Convert wide DataFrame (with year columns) to long format
-def wide_to_long(df, id_vars):
-    return df.reset_index().melt(id_vars=id_vars, var_name='year', value_name='value').dropna()
-
-# Summarize by grouping and pivot
-def summarize(df, group_cols, val_col):
-    pivot = pd.pivot_table(df, values=val_col, index=group_cols, columns='year', aggfunc='sum', fill_value=0)
-    return gap_fill(pivot)
+# Sum val_col by group and year
+def group_sums(df, group_cols, val_col):
+    return df.groupby(group_cols + ['year'], observed=True)[val_col].sum()
+
+# Add up group sums with the same group columns (e.g. from chunks of an input, or several modules)
+def combine_sums(sums):
+    combined = pd.concat(sums)
+    return combined.groupby(level=list(range(combined.index.nlevels)), observed=True).sum()
+
+# Gap fill group sums, pivoted to one column per year with WIDE_FORMAT, otherwise as (year, value) rows.
+# A group with no sum for a year that other groups report is 0 that year. With by (e.g. 'sector'), only
+# groups with the same by labels count, and years they do not report are interpolated from their own
+# years either side, as if each were summarized on its own
+def summarize(sums, by=None):
+    if WIDE_FORMAT:
+        with stage('pivot', rows_in=len(sums)) as record:
+            wide = sums.unstack('year')
+            record['rows_out'] = len(wide)
+        with stage('gap fill', rows_in=len(wide)) as record:
+            reported = wide.notna()
+            if by is None:
+                reported = reported | reported.any()
+            else:
+                reported = reported.groupby(level=by, observed=True).transform('any')
+            filled = gap_fill(wide.mask(reported, wide.fillna(0)))
+            # Years before or after all those reported by the group are 0 rather than the nearest value
+            reported = reported.reindex(columns=filled.columns, fill_value=False)
+            inside = reported.cummax(axis=1) & reported.iloc[:, ::-1].cummax(axis=1).iloc[:, ::-1]
+            summary = filled.where(inside, 0).reset_index()
+            record['rows_out'] = len(summary)
+        return summary
+    with stage('gap fill', rows_in=len(sums)) as record:
+        if by is None or not len(sums):
+            filled = gap_fill_long(sums, fill_value=0)
+        else:
+            filled = pd.concat([gap_fill_long(group, fill_value=0)
+                                for _, group in sums.groupby(level=by, observed=True, sort=False)]).sort_index()
+        summary = filled.rename('value').reset_index()
+        record['rows_out'] = len(summary)
+    return summary
+
+# Read a module's input, prepare it and sum it by group and year
+def input_sums(key, prepare, group_cols, val_col, by_scenario=False):
+    """Group sums of val_col over the input INPUT_FILES[key], after applying prepare to its rows.
+
+    With STREAMING the input is read CHUNK_ROWS rows at a time and each chunk is
+    prepared and reduced to group sums before the next is read, so memory use
+    is bounded by the chunk size rather than the file size. by_scenario keeps
+    each scenario's rows in one chunk, for modules where rows depend on other
+    rows of the same scenario (e.g. EInt carried between sorted rows). The
+    input must then list each scenario's rows together. EInt is not carried
+    from one scenario into the next, as the whole-file sort can do where a
+    scenario's first IESTCS_Out rows have no IESTCS_EnInt row above them.
+    """
+    path = INPUT_PATH / INPUT_FILES[key]
+    if not STREAMING:
+        return prepared_sums(read_input(key, path, engine=CSV_ENGINE), prepare, group_cols, val_col)
+
+    if by_scenario:
+        chunks = iter_input_groups(key, path, 'scenario', CHUNK_ROWS)
+    else:
+        chunks = iter_input(key, path, CHUNK_ROWS)
+    total = None
+    for chunk in chunks:
+        sums = prepared_sums(chunk, prepare, group_cols, val_col)
+        with stage('combine chunks'):
+            total = sums if total is None else combine_sums([total, sums])
+    return total
+
+# Prepare rows read from an input and sum them by group and year
+def prepared_sums(df, prepare, group_cols, val_col):
+    with stage('prepare', rows_in=len(df)) as record:
+        df = prepare(df)
+        record['rows_out'] = len(df)
+    with stage('group sums', rows_in=len(df)) as record:
+        sums = group_sums(df, group_cols, val_col)
+        record['rows_out'] = len(sums)
+    return sums
 
 # Create fuel switching summary DataFrame
 def summarize_fuel_switching(df, group_cols, value_col):
@@ -96,10 +164,7 @@ def summarize_fuel_switching(df, group_cols, value_col):
         switching_df['end_fuel'] = switching_df['fuel_override']
 
     # Default to start_fuel where end_fuel is blank or '-'
-    switching_df['end_fuel'] = switching_df.apply(
-        lambda row: row['start_fuel'] if pd.isna(row['end_fuel']) or row['end_fuel'] == '-' else row['end_fuel'],
-        axis=1
-    )
+    switching_df = resolve_fuels(switching_df, 'fuel_switching')
 
     # Always keep all rows regardless of whether switching occurred
     switching_group_cols = group_cols + ['start_fuel', 'end_fuel']
@@ -109,24 +174,16 @@ def summarize_fuel_switching(df, group_cols, value_col):
         index=switching_group_cols,
         columns='year',
         aggfunc='sum',
-        fill_value=0
+        fill_value=0,
+        observed=True
     )
     return gap_fill(pivot).reset_index()
 
 # ---------------------------------------------
-# Load Mapping Dictionaries
+# Mappings
 # ---------------------------------------------
-map_enduse = read_mapping('enduse_to_subsector_detail_mapping.csv', 'enduse', 'subsector_detail')
-map_sd2s = read_mapping('subsector_detail_to_subsector_mapping_v2.csv', 'subsector_detail', 'subsector')
-map_sp2s = read_mapping('subsector_p_to_subsector_mapping.csv', 'subsector_p', 'subsector')
-map_spc2sd = read_mapping('subsector_p_cca_to_subsector_detail_mapping.csv','subsector_p_cca','subsector_detail')
-map_com2et = read_mapping('commodity_to_emission_type_mapping.csv', 'commodity', 'emis_type')
-map_t2tech = read_mapping('tech_to_technology_mapping.csv', 'tech', 'technology')
-map_pc2td = read_mapping('process_code_to_tech_detail_mapping.csv', 'process_code', 'tech_detail')
-map_h2tech = read_mapping('h2_mapping.csv','process','subsector_detail')
-map_h2sector = read_mapping('h2_sector_mapping.csv','subsector_detail','subsector')
-map_emis = read_mapping('emis_mapping.csv','emission_type','emis_type')
-map_emsector = read_mapping('emis_sector_mapping.csv','sector0_process','sector')
+# Each mapping file is read on first use (see MAPPINGS in mappings.py)
+mappings = MappingRegistry(MAPPING_PATH)
 
 # Common grouping columns
 common_cols = ['scenario'] + (['state'] if STATES else [])
@@ -136,299 +193,418 @@ common_cols = ['scenario'] + (['state'] if STATES else [])
 # ---------------------------------------------
 
 #Transport
-def process_energy_transport():
-    df = pd.read_csv(INPUT_PATH / INPUT_FILES['transport'])
-    df = df.rename(columns={'sector_p': 'sector', 'fuel': 'start_fuel'})
+def prepare_transport(df):
+    df = df.rename(columns={'sector_p': 'sector'})
     # For Transport, no switching: end_fuel = start_fuel
-    df['end_fuel'] = df['start_fuel']
-    df['subsector_detail'] = df['enduse'].map(map_enduse)
-    df['subsector'] = df['subsector_detail'].map(map_sd2s)
+    df = resolve_fuels(df, 'transport')
+    df['subsector_detail'] = mappings.map('enduse', df['enduse'])
+    df['subsector'] = mappings.map('sd2s', df['subsector_detail'])
+    return df
 
+def process_energy_transport():
     group_cols = common_cols + ['sector', 'subsector', 'subsector_detail', 'start_fuel', 'end_fuel', 'unit']
-    df_summary = summarize(df, group_cols, 'val')
-    df_summary = gap_fill(df_summary).reset_index()
-
-    return df_summary
+    return input_sums('transport', prepare_transport, group_cols, 'val')
 
 #Residential
-def process_energy_residential():
-    df = pd.read_csv(INPUT_PATH / INPUT_FILES['residential'])
-    df = df.rename(columns={'sector_p': 'sector', 'fuel_switched': 'start_fuel', 'fuel': 'end_fuel'})
+def prepare_residential(df):
+    df = df.rename(columns={'sector_p': 'sector'})
 
     # Default to end_fuel if start_fuel is missing
-    df['start_fuel'] = df.apply(
-        lambda row: row['end_fuel'] if pd.isna(row['start_fuel']) or row['start_fuel'] == '-' else row['start_fuel'],
-        axis=1
-    )
-    df['subsector_detail'] = df['enduse'].map(map_enduse)
-    df['subsector'] = df['subsector_p'].map(map_sp2s)
+    df = resolve_fuels(df, 'residential')
+    df['subsector_detail'] = mappings.map('enduse', df['enduse'])
+    df['subsector'] = mappings.map('sp2s', df['subsector_p'])
+    return df
 
+def process_energy_residential():
     group_cols = common_cols + ['sector', 'subsector', 'subsector_detail', 'start_fuel', 'end_fuel', 'unit']
-    df_summary = summarize(df, group_cols, 'val')
-    df_summary = gap_fill(df_summary).reset_index()
-
-    return df_summary
+    return input_sums('residential', prepare_residential, group_cols, 'val')
 
 #Power
-def process_energy_power():
-    df = pd.read_csv(INPUT_PATH / INPUT_FILES['power'])
-    df = df.rename(columns={'sector_p': 'sector', 'fuel': 'start_fuel', 'fuel_override': 'end_fuel'})
+def prepare_power(df):
+    df = df.rename(columns={'sector_p': 'sector'})
+
+    # Set default end_fuel = start_fuel if not overridden
+    df = resolve_fuels(df, 'power')
 
     # Omit records where fuel is Renewable, Solar, Wind, or Electricity
     fuels_to_exclude = ['Renewable', 'Solar', 'Wind', 'Electricity']
     df = df[~df['start_fuel'].isin(fuels_to_exclude)]
 
-    # Set default end_fuel = start_fuel if not overridden
-    df['end_fuel'] = df.apply(
-        lambda row: row['start_fuel'] if pd.isna(row['end_fuel']) or row['end_fuel'] == '-' else row['end_fuel'],
-        axis=1
-    )
-
     df['subsector'] = df['technology0_process']
-    df['subsector_detail'] = df['tech'].map(map_t2tech)
+    df['subsector_detail'] = mappings.map('t2tech', df['tech'])
+    return df
 
+def process_energy_power():
     group_cols = common_cols + ['sector', 'subsector', 'subsector_detail', 'start_fuel', 'end_fuel', 'unit']
-    df_summary = summarize(df, group_cols, 'val')
-    df_summary = gap_fill(df_summary).reset_index()
-
-    return df_summary
+    return input_sums('power', prepare_power, group_cols, 'val')
 
 #Commercial
-def process_energy_commercial():
-    df = pd.read_csv(INPUT_PATH / INPUT_FILES['commercial'])
-    df = df.rename(columns={'sector_p': 'sector', 'fuel': 'start_fuel', 'fuel_override': 'end_fuel'})
+def prepare_commercial(df):
+    df = df.rename(columns={'sector_p': 'sector'})
     # Set default end_fuel if blank
-    df['end_fuel'] = df.apply(
-        lambda row: row['start_fuel'] if pd.isna(row['end_fuel']) or row['end_fuel'] == '-' else row['end_fuel'],
-        axis=1
-    )
+    df = resolve_fuels(df, 'commercial')
     # Calculate energy intensity (EInt) and energy demand
-    df = df.sort_values(by=['scenario', 'state', 'sector', 'subsector_p', 'enduse', 'start_fuel', 'end_fuel', 'unit', 'year'])
-    value = 0
-    eint_list = []
-    for _, row in df.iterrows():
-        if row['varbl'] == 'IESTCS_EnInt':
-            value = row['val'] / row['val~den'] if row['val~den'] != 0 else 0
-            eint_list.append(None)
-        elif row['varbl'] == 'IESTCS_Out':
-            eint_list.append(value)
-        else:
-            eint_list.append(None)
-    df['EInt'] = eint_list
+    df = calculate_eint(df, ['scenario', 'state', 'sector', 'subsector_p', 'enduse', 'start_fuel', 'end_fuel', 'unit', 'year'])
     df = df[df['varbl'] == 'IESTCS_Out']
     df['energy_demand'] = df['val'] * df['EInt']
     # Map subsector and detail
-    df['subsector_detail'] = df['enduse'].map(map_enduse)
-    df['subsector'] = df['buildingtype'].map(map_sp2s)
+    df['subsector_detail'] = mappings.map('enduse', df['enduse'])
+    df['subsector'] = mappings.map('sp2s', df['buildingtype'])
+    return df
+
+def process_energy_commercial():
     # Group by start_fuel and end_fuel as per updated schema
     group_cols = common_cols + ['sector', 'subsector', 'subsector_detail', 'start_fuel', 'end_fuel', 'unit']
-    df_summary = summarize(df, group_cols, 'energy_demand')
-    df_summary = gap_fill(df_summary).reset_index()
-    return df_summary
+    return input_sums('commercial', prepare_commercial, group_cols, 'energy_demand', by_scenario=True)
 
 #Industry
-def process_energy_industry():
-    df = pd.read_csv(INPUT_PATH / INPUT_FILES['industry'])
-    df = df.rename(columns={'sector_p': 'sector', 'fuel': 'start_fuel', 'fuel_override': 'end_fuel'})
+def prepare_industry(df):
+    df = df.rename(columns={'sector_p': 'sector'})
     # Set default end_fuel if blank
-    df['end_fuel'] = df.apply(
-        lambda row: row['start_fuel'] if pd.isna(row['end_fuel']) or row['end_fuel'] == '-' else row['end_fuel'],
-        axis=1
-    )
+    df = resolve_fuels(df, 'industry')
     # Calculate energy intensity (EInt) and energy demand
-    df = df.sort_values(by=['scenario', 'state', 'sector', 'subsector_p', 'subsector_c', 'start_fuel', 'end_fuel', 'unit', 'year'])
-    value = 0
-    eint_list = []
-    for _, row in df.iterrows():
-        if row['varbl'] == 'IESTCS_EnInt':
-            value = row['val'] / row['val~den'] if row['val~den'] != 0 else 0
-            eint_list.append(None)
-        elif row['varbl'] == 'IESTCS_Out':
-            eint_list.append(value)
-        else:
-            eint_list.append(None)
-    df['EInt'] = eint_list
+    df = calculate_eint(df, ['scenario', 'state', 'sector', 'subsector_p', 'subsector_c', 'start_fuel', 'end_fuel', 'unit', 'year'])
     df = df[df['varbl'] == 'IESTCS_Out']
     df['energy_demand'] = df['val'] * df['EInt']
     # Map subsector and detail
     df['subsector_detail'] = df['subsector_c']
-    df['subsector'] = df['subsector_c'].map(map_sd2s)
+    df['subsector'] = mappings.map('sd2s', df['subsector_c'])
+    return df
+
+def process_energy_industry():
     # Group by start_fuel and end_fuel as per updated schema
     group_cols = common_cols + ['sector', 'subsector', 'subsector_detail', 'start_fuel', 'end_fuel', 'unit']
-    df_summary = summarize(df, group_cols, 'energy_demand')
-    df_summary = gap_fill(df_summary).reset_index()
-    return df_summary
+    return input_sums('industry', prepare_industry, group_cols, 'energy_demand', by_scenario=True)
 
 # ----------------------------------------------
 # Generation Modules
 # ----------------------------------------------
 
 #Elec capacity and generation
-def process_elec_cap_gen():
-    df = pd.read_csv(INPUT_PATH / INPUT_FILES['elec_cap_gen'])
+def prepare_elec_cap_gen(df):
     df = df.rename(columns={'sector_p':'sector'})
-    df['subsector_detail'] = df['tech'].map(map_t2tech)
+    df['subsector_detail'] = mappings.map('t2tech', df['tech'])
     df['subsector'] = df['technology0_process']
-    group_cols = common_cols + ['sector', 'subsector', 'subsector_detail', 'unit']
-    df_summary = summarize(df, group_cols, 'val')
-    df_summary = gap_fill(df_summary).reset_index()
+    # Tech detail from the process code; codes without a mapping are labelled '-'
+    df['technology_detail'] = mappings.map('pc2td', process_codes(df['process']), report=False).fillna('-')
+    return df
 
-    return df_summary
+def process_elec_cap_gen():
+    group_cols = common_cols + ['sector', 'subsector', 'subsector_detail', 'technology_detail', 'unit']
+    return summarize(input_sums('elec_cap_gen', prepare_elec_cap_gen, group_cols, 'val'))
 
 #H2 capacity and generation
-def process_h2():
-    df = pd.read_csv(INPUT_PATH / INPUT_FILES['h2'])
+def prepare_h2(df):
     df = df.rename(columns={'fuel': 'sector'})
-    df['subsector_detail'] = df['process'].map(map_h2tech)
-    df['subsector'] = df['subsector_detail'].map(map_h2sector)
+    df['subsector_detail'] = mappings.map('h2tech', df['process'])
+    df['subsector'] = mappings.map('h2sector', df['subsector_detail'])
+    return df
 
+def process_h2():
     group_cols = common_cols + ['sector', 'subsector', 'subsector_detail', 'unit']
-    df_summary = summarize(df, group_cols, 'val')
-    df_summary = gap_fill(df_summary).reset_index()
-    return df_summary
+    return summarize(input_sums('h2', prepare_h2, group_cols, 'val'))
 
 
 # ----------------------------------------------
 # Emissions Module
 # ----------------------------------------------
-def process_emis():
-    # 1. Load raw data
-    df = pd.read_csv(INPUT_PATH / INPUT_FILES['emissions'])
+# Rows each emissions rule applied to, for each frame classified in this process
+emission_rule_counts = []
 
-    # 2. Top-level sector mapping
-    df['sector'] = df['sector_p'].map(map_emsector)
+def prepare_emis(df):
+    # 1. Classify sector, subsector, subsector_detail and emis_type (rules in emissions_rules.py)
+    with stage('classify', rows_in=len(df)):
+        emission_rule_counts.append(classify_emissions(df, 'processing', mappings))
 
-    # 3. subsector_detail for Industry
-    mask_ind = df['sector']=='Industry'
+    # 2. Units
+    df['unit'] = 'ktCO2e'
 
-    # 3a. Try subsector_c
-    df.loc[mask_ind, 'subsector_detail'] = df.loc[mask_ind, 'subsector_c']
+    # 3. Ensure no NaNs in grouping keys
+    all_cols = common_cols + ['sector','subsector','subsector_detail','emis_type','unit']
+    df[all_cols] = df[all_cols].astype(object).fillna('-')
+    return df
 
-    # 3b. Fallback to subsector_p_cca via your mapping file
-    missing = mask_ind & df['subsector_detail'].isin(['-', None, pd.NA])
-    df.loc[missing, 'subsector_detail'] = (
-    df.loc[missing, 'subsector_p_cca']
-      .map(map_spc2sd)                             # use mapping to change name
-      .fillna(df.loc[missing, 'subsector_p_cca'])  # if not in mapping, retain name from VEDA
-    )
+def process_emis():
+    # 4. Pivot & gap-fill the classified rows
+    emission_rule_counts.clear()
+    group_cols = common_cols + ['sector','subsector','subsector_detail','emis_type','unit']
+    emis_summary = summarize(input_sums('emissions', prepare_emis, group_cols, 'val'))
+    rule_counts = pd.concat(emission_rule_counts, axis=1).sum(axis=1)
+    print('Emissions rows classified by each rule:\n' + rule_counts.to_string())
+    return emis_summary
 
-    # 3c. Final fallback label
-    still_blank = mask_ind & df['subsector_detail'].isin(['-', None, pd.NA])
-    df.loc[still_blank, 'subsector_detail'] = 'Unassigned emissions'
+# ----------------------------------------------
+# Energy Efficiency Module
+# ----------------------------------------------
+# Efficiency categories and building sectors are shared with process_to_sql.py (see efficiency_categories.py)
+def prepare_eneff_industry(df):
+    df = df.rename(columns={'subsector_p': 'subsector_detail', 'fuel': 'fuel_type', 'source': 'efficiency_type'})
+    # All Core EnEff Industry entries are industry (agriculture may be split out as its own sector in future)
+    df['sector'] = 'Industry'
+    df['subsector'] = mappings.map('sd2s', df['subsector_detail'])
+    df['efficiency_category'] = efficiency_categories(df['ee_category'], 'eneff_ind')
+    return df
 
-    # 4. subsector for Industry
-    df.loc[mask_ind, 'subsector'] = (
-    df.loc[mask_ind, 'subsector_detail']
-      .map(map_sd2s)
-      .fillna('Unassigned emissions')
-    )
-    
-    # 5. Transport & Buildings
-    mask_bt = df['sector'].isin(['Transport','Residential buildings','Commercial buildings'])
-    df.loc[mask_bt, 'subsector_detail'] = df.loc[mask_bt, 'enduse'].map(map_enduse)
-    df.loc[mask_bt, 'subsector']        = df.loc[mask_bt, 'subsector_p'].map(map_sp2s)
-
-    # 6. Carbon removal
-    mask_cdr = df['sector']=='Carbon dioxide removal'
-    df.loc[mask_cdr & (df['sector_p']=='LU_CO2seq'),
-           'subsector_detail'] = 'Land use sequestration'
-    df.loc[mask_cdr & (df['sector_p']=='DAC'),
-           'subsector_detail'] = 'Direct air capture'
-    df.loc[mask_cdr & (df['subsector_detail']=='Land use sequestration'),
-           'subsector'] = 'Land'
-    df.loc[mask_cdr & (df['subsector_detail']=='Direct air capture'),
-           'subsector'] = 'Engineered'
-    df.loc[mask_cdr & ~df['subsector_detail'].isin(['Land use sequestration','Direct air capture']),
-           'subsector'] = '-'
-
-    # 7. Power & Hydrogen
-    df.loc[df['sector']=='Power',    'subsector'] = df['tech']
-    df.loc[df['sector']=='Hydrogen', 'subsector'] = df['tech']
-
-    # 8. Emission types
-    df['emis_type'] = df['commodity'].map(map_com2et).fillna('-')
-    ind = df['sector']=='Industry'
-    df.loc[ind & (df['varbl']=='Emi_CO2') & (df['commodity']=='INDCO2N'),
-           'emis_type'] = 'Energy'
-    df.loc[ind & (df['varbl']=='Emi_CO2') & (df['commodity']=='INDCO2P'),
-           'emis_type'] = 'Process'
-    df.loc[ind & (df['varbl']=='Cap_CO2'),
-           'emis_type'] = 'Capture'
-    df.loc[ind & (df['varbl']=='Emi_IndCO2_energy'),
-           'emis_type'] = 'Energy'
-
-    # 9. Industry negative/process removals
-    proc_neg = (df['sector']=='Industry') & (df['source_p']=='Process Negative Emissions')
-    df.loc[proc_neg, ['sector','subsector','subsector_detail','emis_type']] = [
-        'Carbon dioxide removal','Engineered','Mineral carbonation','Sequestration'
-    ]
-    forest_proc = (
-        (df['sector']=='Industry') &
-        (df['subsector']=='Forestry and logging') &
-        (df['emis_type']=='Process')
-    )
-    df.loc[forest_proc, ['sector','subsector','subsector_detail','emis_type']] = [
-        'Carbon dioxide removal','Land','Forestry and logging','Sequestration'
-    ]
+def prepare_eneff_buildings(df):
+    df = df.rename(columns={'fuel': 'fuel_type'})
+    df['sector'] = building_sectors(df['sector_p'])
+    df['subsector_detail'] = mappings.map('enduse', df['enduse_c'])
+    df['subsector'] = mappings.map('sp2s', df['buildingtype'])
+    # No efficiency type is given in Core EnEff Buildings
+    df['efficiency_type'] = '-'
+    df['efficiency_category'] = efficiency_categories(df['ee_category'], 'eneff_bld')
+    return df
 
-    # 10. Units
-    df['unit'] = 'ktCO2e'
+def process_energy_efficiency():
+    group_cols = common_cols + ['sector', 'subsector', 'subsector_detail', 'fuel_type', 'efficiency_category',
+                                'efficiency_type', 'unit']
+    with stage('combine sums'):
+        sums = combine_sums([input_sums('eneff_ind', prepare_eneff_industry, group_cols, 'val'),
+                             input_sums('eneff_bld', prepare_eneff_buildings, group_cols, 'val')])
+    return summarize(sums)
 
-    # 11. Ensure no NaNs in grouping keys
-    all_cols = common_cols + ['sector','subsector','subsector_detail','emis_type','unit']
-    df[all_cols] = df[all_cols].fillna('-')
+# ---------------------------------------------
+# Module Registry
+# ---------------------------------------------
+# Modules are independent of each other; results are combined in this order
+MODULES = {
+    'transport': process_energy_transport,
+    'commercial': process_energy_commercial,
+    'residential': process_energy_residential,
+    'industry': process_energy_industry,
+    'power': process_energy_power,
+    'emissions': process_emis,
+    'h2': process_h2,
+    'elec_cap_gen': process_elec_cap_gen,
+    'energy_efficiency': process_energy_efficiency,
+}
+ENERGY_MODULES = ['transport', 'commercial', 'residential', 'industry', 'power']
+# Output table of each other module, and the order of the output tables
+MODULE_OUTPUTS = {'emissions': 'emissions', 'h2': 'h2_gen', 'elec_cap_gen': 'elec_gen',
+                  'energy_efficiency': 'energy_efficiency'}
+OUTPUT_TABLES = ['energy_all_sectors', 'elec_gen', 'h2_gen', 'emissions', 'energy_efficiency']
+
+# Inputs read by each module, where not just INPUT_FILES[name]
+MODULE_INPUTS = {'energy_efficiency': ['eneff_ind', 'eneff_bld']}
+
+# Mappings used by each module
+MODULE_MAPPINGS = {
+    'transport': ['enduse', 'sd2s'],
+    'commercial': ['enduse', 'sp2s'],
+    'residential': ['enduse', 'sp2s'],
+    'industry': ['sd2s'],
+    'power': ['t2tech'],
+    'emissions': ['emsector', 'spc2sd', 'sd2s', 'enduse', 'sp2s', 'com2et'],
+    'h2': ['h2tech', 'h2sector'],
+    'elec_cap_gen': ['t2tech', 'pc2td'],
+    'energy_efficiency': ['sd2s', 'enduse', 'sp2s'],
+}
 
-     # 12. Pivot & gap-fill
-    emis_pivot = pd.pivot_table(
-        df, values='val',
-        index=common_cols + ['sector','subsector','subsector_detail','emis_type','unit'],
-        columns='year',
-        aggfunc='sum',
-        fill_value=0
-    )
-    emis_summary = gap_fill(emis_pivot).reset_index()   
-    return emis_summary
+def module_files(name):
+    """Input and mapping files a module depends on."""
+    inputs = MODULE_INPUTS.get(name, [name])
+    return [INPUT_PATH / INPUT_FILES[key] for key in inputs] + [mappings.file(m) for m in MODULE_MAPPINGS[name]]
 
 # ---------------------------------------------
 # Processing and generating outputs
 # ---------------------------------------------
+def run_options():
+    """Run options recorded in run reports."""
+    return {'STATES': STATES, 'WIDE_FORMAT': WIDE_FORMAT, 'PARALLEL': PARALLEL, 'STREAMING': STREAMING,
+            'OUTPUT_FORMAT': OUTPUT_FORMAT, 'EXPORT_THREAD': EXPORT_THREAD}
+
+def reused_results(reused):
+    """Yields (name, summary) for each reused summary, removing it from reused so it can be freed once used."""
+    while reused:
+        name = next(iter(reused))
+        yield name, reused.pop(name)
+
+def module_results(stale, manifest, fingerprints, parallel=PARALLEL):
+    """Runs the stale modules, yielding (name, summary) as each finishes and storing its summary."""
+    # Each module's stages are recorded in whichever process it runs
+    modules = {name: partial(run_stage, name, MODULES[name]) for name in stale}
+    for name, (result, records) in run_modules(modules, max_workers=MAX_WORKERS, parallel=parallel):
+        add_records(records)
+        manifest.save(name, fingerprints[name], result)
+        print(f'{name} processed')
+        yield name, result
+        # Not held while waiting for the next module
+        del result
+
+def process_inputs(output_dir, writer, full=False, parallel=PARALLEL, summary_path=SUMMARY_PATH, keep_tables=True):
+    """Processes the inputs in INPUT_PATH into output tables written to output_dir by writer.
+
+    Each table is exported as soon as it is ready, while later modules are
+    still processing. Returns the output tables (None unless keep_tables, so
+    each is freed once written) and the names of the modules whose stored
+    summaries were reused.
+    """
+    # Reuse stored summaries of modules whose inputs, mappings and code are unchanged
+    manifest = Manifest(summary_path)
+    code = code_version(Path(__file__).parent.glob('*.py'))
+    fingerprints = {name: manifest.fingerprint(name, module_files(name), code) for name in MODULES}
+    reused = {}
+    if INCREMENTAL and not full:
+        for name in MODULES:
+            summary = manifest.load(name, fingerprints[name])
+            if summary is not None:
+                reused[name] = summary
+                print(f'{name} unchanged, reusing stored summary')
+
+    # Process each remaining module, exporting each output table once its modules are done
+    stale = [name for name in MODULES if name not in reused]
+    reused_names = list(reused)
+    results = chain(reused_results(reused), module_results(stale, manifest, fingerprints, parallel))
+    keep = keep_tables or bool(EXCEL_TEMPLATES)
+    tables = {}
+    energy_sums = {}
+    with ExportPipeline(writer, output_dir, background=EXPORT_THREAD) as exports:
+        for name, result in results:
+            if name in ENERGY_MODULES:
+                ### Energy Use Modules ###
+                # Energy modules return group sums, which are gap filled together (each sector on its own years)
+                energy_sums[name] = result
+                if len(energy_sums) < len(ENERGY_MODULES):
+                    continue
+                with stage('energy'):
+                    with stage('combine sums'):
+                        combined = combine_sums([energy_sums.pop(module) for module in ENERGY_MODULES])
+                    name, result = 'energy_all_sectors', summarize(combined, by='sector')
+                    del combined
+                print('All energy use data processed')
+            else:
+                ### Emissions, generation and energy efficiency modules ###
+                name = MODULE_OUTPUTS[name]
+            exports.submit(name, result)
+            if keep:
+                tables[name] = result
+            # Not held while waiting for the next module, so the export pipeline can free it once written
+            del result
+    tables = {name: tables[name] for name in OUTPUT_TABLES if name in tables}
+
+    print('All sector energy data combined and exported')
+
+    # Fill the Excel visualisation templates with the output tables
+    if EXCEL_TEMPLATES:
+        with stage('excel templates'):
+            for template in export_templates(EXCEL_TEMPLATES, TEMPLATE_PATH, output_dir, tables,
+                                             max_workers=MAX_WORKERS, parallel=parallel):
+                print(f'{template} exported')
+    return (tables if keep_tables else None), reused_names
+
+# ---------------------------------------------
+# Batch mode
+# ---------------------------------------------
+# A batch processes several input directories (e.g. the export sets of a
+# scenario study) in one invocation, each into its own folder of the batch's
+# output folder, named after the input directory. Mappings are read once, before
+# the worker processes start, and the runs are spread over the workers, each
+# running its modules one after another. Stored module summaries are kept per
+# run. With merge, each output table is also written for the whole batch, with
+# a leading run column naming the input directory each row came from.
+
+def batch_input_dirs(patterns):
+    """Input directories given as paths or glob patterns, in order, checking their names are unique."""
+    input_dirs = []
+    for pattern in patterns:
+        matches = [Path(match) for match in sorted(glob.glob(pattern)) if Path(match).is_dir()]
+        if not matches:
+            raise ValueError(f'No input directories match {pattern}')
+        input_dirs += [match for match in matches if match not in input_dirs]
+    names = [input_dir.name for input_dir in input_dirs]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f'Input directories must have distinct names, found several called: {", ".join(duplicates)}')
+    return input_dirs
+
+def process_batch_run(name, input_path, output_dir, writer, full=False, merge=False):
+    """Processes the inputs in input_path into output_dir as stage name, for one run of a batch.
+
+    Returns the output tables (with merge, otherwise None, to save keeping
+    them and sending them back from the worker) and the run's stage records.
+    """
+    global INPUT_PATH
+    INPUT_PATH = Path(input_path)
+    mappings.unmapped.clear()
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    (tables, reused), records = run_stage(name, partial(process_inputs, output_dir, writer, full, parallel=False,
+                                                        summary_path=SUMMARY_PATH / 'batch' / name, keep_tables=merge))
+    write_report(output_dir / 'run_report.json', records, script='processing.py', timestamp=TIMESTAMP,
+                 input_path=str(input_path), reused_modules=reused, options=run_options())
+    return tables, records
+
+def merge_runs(run_tables):
+    """Each output table of the runs ({run: {table name: DataFrame}}) stacked, with a leading run column."""
+    names = next(iter(run_tables.values()))
+    merged = {}
+    for name in names:
+        with stage(f'stack {name}'):
+            table = pd.concat({run: tables[name] for run, tables in run_tables.items()}, names=['run'])
+            merged[name] = table.reset_index(level='run').reset_index(drop=True)
+    return merged
+
+def process_batch(input_dirs, output_dir, writer, full=False, merge=False):
+    """Processes each input directory into a folder of output_dir, returning the merged tables (with merge)."""
+    # Read here so forked workers share the tables; spawned workers read them on first use, once per worker
+    mappings.preload()
+    runs = {input_dir.name: partial(process_batch_run, input_dir.name, input_dir, output_dir / input_dir.name,
+                                    writer, full, merge)
+            for input_dir in input_dirs}
+    run_tables = {}
+    for name, (tables, records) in run_modules(runs, max_workers=MAX_WORKERS, parallel=PARALLEL):
+        run_tables[name] = tables
+        add_records(records)
+        print(f'Run {name} processed')
+    if not merge:
+        return None
+    run_tables = {input_dir.name: run_tables[input_dir.name] for input_dir in input_dirs}
+
+    with stage('merge'):
+        merged = merge_runs(run_tables)
+        for name, table in merged.items():
+            with stage(f'export {name}', rows_in=len(table)):
+                writer.write(table, output_dir, name)
+    print('Merged outputs exported')
+    return merged
+
 if __name__ == '__main__':
-    # Process each module
-
-    ### Energy Use Modules ###
-    transport = process_energy_transport()
-    print('Transport energy processed')
-    commercial = process_energy_commercial()
-    print('Commercial energy processed')
-    residential = process_energy_residential()
-    print('Residential energy processed')
-    industry = process_energy_industry()
-    print('Industry energy processed')  
-    power = process_energy_power()
-    print('Power energy processed')
-    all_energy = pd.concat([transport, commercial, residential, industry, power], ignore_index=True)
-    
-    print('All energy use data processed')
-
-    ### Emissions Module ###
-    
-    emissions = process_emis()
-    print('Emissions data processed')
-
-    ### Generation modules ###
-    
-    h2 = process_h2()
-    elec_cap = process_elec_cap_gen()
-    print('All generation data processed')
-  
-    # Combine and export
+    parser = argparse.ArgumentParser(description='Process AusTIMES results exported from Veda')
+    parser.add_argument('--no-cache', action='store_true', help='read inputs from CSV, bypassing the input cache')
+    parser.add_argument('--clear-cache', action='store_true', help='remove all cached inputs before processing')
+    parser.add_argument('--full', action='store_true', help='recompute every module, ignoring stored summaries')
+    parser.add_argument('--profile', choices=PROFILERS, help='profile each module (each run, with --batch) into the profiles folder of the outputs')
+    parser.add_argument('--batch', nargs='+', metavar='DIR',
+                        help='process each input directory (or glob of directories) into its own output folder')
+    parser.add_argument('--merge', action='store_true',
+                        help='with --batch, also write each output table for all runs, tagged by run')
+    args = parser.parse_args()
+    if args.merge and not args.batch:
+        parser.error('--merge requires --batch')
+    input_dirs = batch_input_dirs(args.batch) if args.batch else None
+    if args.clear_cache:
+        clear_cache()
+    if args.no_cache:
+        set_cache_enabled(False)
+
     output_dir = OUTPUT_PATH / f'{TIMESTAMP}'
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    all_energy.to_csv(output_dir / 'energy_all_sectors.csv', index=False)
-    elec_cap.to_csv(output_dir / 'elec_gen.csv', index=False)
-    h2.to_csv(output_dir / 'h2_gen.csv', index=False)
-    emissions.to_csv(output_dir / 'emissions.csv', index=False)
+    if args.profile:
+        set_profiling(args.profile, output_dir / 'profiles')
 
-    print('All sector energy data combined and exported')
+    # Created up front so a missing optional dependency fails before processing
+    writer = output_writer(OUTPUT_FORMAT, **OUTPUT_OPTIONS)
+
+    if input_dirs:
+        process_batch(input_dirs, output_dir, writer, args.full, args.merge)
+        run_info = {'runs': {input_dir.name: str(input_dir) for input_dir in input_dirs}, 'merged': args.merge}
+    else:
+        _, reused = process_inputs(output_dir, writer, args.full, keep_tables=False)
+        run_info = {'reused_modules': reused}
+
+    # Times, rows and memory of each stage
+    report = write_report(output_dir / 'run_report.json', script='processing.py', timestamp=TIMESTAMP,
+                          **run_info, options=run_options())
+    print(f'Run report written to {report}')
     print('Processing complete')
@@ -0,0 +1,40 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# ---------------------------------------------
+# Module scheduler
+# ---------------------------------------------
+# The processing modules each read their own input and share no state, so
+# they can run side by side in separate processes. Results come back as each
+# module finishes, so callers can use a result without waiting for modules
+# given before it; callers needing the given order reorder by name.
+
+
+def worker_count(max_workers, n_modules):
+    """Number of worker processes to use for n_modules."""
+    return max(1, min(max_workers or os.cpu_count() or 1, n_modules))
+
+
+def run_modules(modules, max_workers=None, parallel=True):
+    """Runs each module function and yields (name, result) as each finishes.
+
+    modules maps a name to a function taking no arguments. Functions must be
+    defined at module level so worker processes can import them. With
+    parallel=False, or a single worker, the modules run one after another in
+    this process, which is easier to debug, and results come in the order of
+    modules.
+    """
+    workers = worker_count(max_workers, len(modules))
+    if not parallel or workers == 1:
+        for name, func in modules.items():
+            yield name, func()
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(func): name for name, func in modules.items()}
+        # Futures and results are let go once yielded, so a result isn't held until every module is done
+        for future in as_completed(futures):
+            name, result = futures.pop(future), future.result()
+            del future
+            yield name, result
+            del result
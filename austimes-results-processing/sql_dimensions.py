@@ -0,0 +1,193 @@
+import pandas as pd
+
+from instrumentation import stage
+from sql_loader import DEFAULT_BATCH_SIZE, BulkLoader, iter_batches, sql_columns
+
+# ---------------------------------------------
+# Dimension tables and integer-keyed fact tables
+# ---------------------------------------------
+# An alternative to loading the text tables of SQL_TABLES. Each distinct
+# label combination (a scenario of a study, a sector/subsector/subsector
+# detail, a fuel...) is stored once in a dimension table under an integer
+# surrogate key, and the output tables are loaded as fact tables of those
+# keys plus year and value. Rows are then a few integers wide rather than
+# several labels wide, which cuts the data sent and stored per row.
+#
+# Dimension tables are shared by every fact table and every run: members
+# already in the database keep their keys, and new members are added with the
+# next free keys in the load's transaction. Keys are assigned by the loader,
+# so only one load should write to the tables at a time. Each load is a member
+# of DimRun (run id and load time). With replace=True, the facts of earlier
+# loads of the same run id, for the scenarios loaded, are replaced (as with
+# BulkLoader's run_id, see sql_loader.py). Missing tables are created on first
+# use. Labels missing from a row are stored as '-'.
+
+# Dimension table: (surrogate key column, natural key columns)
+DIMENSIONS = {
+    'DimRun': ('run_key', ['run_id', 'processed_at']),
+    'DimScenario': ('scenario_key', ['study', 'scenario']),
+    'DimState': ('state_key', ['state']),
+    'DimSector': ('sector_key', ['sector', 'subsector', 'subsector_detail']),
+    'DimFuel': ('fuel_key', ['fuel']),
+    'DimTechnology': ('technology_key', ['technology', 'technology_detail']),
+    'DimEmissionType': ('emis_type_key', ['emis_type']),
+    'DimEfficiencyType': ('efficiency_type_key', ['efficiency_type']),
+    'DimUnit': ('unit_key', ['unit']),
+}
+
+SCENARIO = ('DimScenario', {'study': 'study', 'scenario': 'scenario'})
+STATE = ('DimState', {'state': 'state'})
+SECTOR = ('DimSector', {'sector': 'sector', 'subsector': 'subsector', 'subsector_detail': 'subsector_detail'})
+UNIT = ('DimUnit', {'unit': 'unit'})
+
+# Fact table for each output table of SQL_TABLES, with its key columns:
+# {key column: (dimension, {output column: dimension column})}. Each fact
+# table also has run_key, year and value columns.
+FACT_TABLES = {
+    'FuelSwitch': ('FactFuelSwitch', {
+        'scenario_key': SCENARIO, 'state_key': STATE, 'sector_key': SECTOR,
+        'start_fuel_key': ('DimFuel', {'start_fuel': 'fuel'}), 'end_fuel_key': ('DimFuel', {'end_fuel': 'fuel'}),
+        'unit_key': UNIT}),
+    'Energy': ('FactEnergy', {
+        'scenario_key': SCENARIO, 'state_key': STATE, 'sector_key': SECTOR,
+        'fuel_key': ('DimFuel', {'fuel_type': 'fuel'}), 'unit_key': UNIT}),
+    'Emissions': ('FactEmissions', {
+        'scenario_key': SCENARIO, 'state_key': STATE, 'sector_key': SECTOR,
+        'emis_type_key': ('DimEmissionType', {'emis_type': 'emis_type'}), 'unit_key': UNIT}),
+    'ElectricityGenCap': ('FactElectricityGenCap', {
+        'scenario_key': SCENARIO, 'state_key': STATE, 'sector_key': ('DimSector', {'sector': 'sector'}),
+        'technology_key': ('DimTechnology', {'technology': 'technology', 'technology_detail': 'technology_detail'}),
+        'unit_key': UNIT}),
+    'EnergyEfficiency': ('FactEnergyEfficiency', {
+        'scenario_key': SCENARIO, 'state_key': STATE, 'sector_key': SECTOR,
+        'fuel_key': ('DimFuel', {'fuel_type': 'fuel'}),
+        'efficiency_type_key': ('DimEfficiencyType', {'efficiency_type': 'efficiency_type'}), 'unit_key': UNIT}),
+    'HydrogenGenCap': ('FactHydrogenGenCap', {
+        'scenario_key': SCENARIO, 'state_key': STATE, 'sector_key': SECTOR, 'unit_key': UNIT}),
+}
+
+MISSING_LABEL = '-'
+
+
+def dimension_ddl(adapter, dimension):
+    key, columns = DIMENSIONS[dimension]
+    column_defs = [f'{key} int NOT NULL PRIMARY KEY'] + [f'{col} varchar(255) NOT NULL' for col in sql_columns(columns)]
+    return f"CREATE TABLE {adapter.table_name(dimension)} ({', '.join(column_defs)})"
+
+
+def fact_ddl(adapter, table):
+    fact, keys = FACT_TABLES[table]
+    column_defs = ([f'{key} int NOT NULL' for key in list(keys) + ['run_key']]
+                   + [f'{col} int NOT NULL' for col in sql_columns(['year'])]
+                   + [f'{col} float NULL' for col in sql_columns(['value'])])
+    return f"CREATE TABLE {adapter.table_name(fact)} ({', '.join(column_defs)})"
+
+
+class DimensionKeys:
+    """Surrogate keys of dimension members, read from the dimension tables and added to them as new members appear."""
+
+    def __init__(self, adapter):
+        self.adapter = adapter
+        self.members = {}
+
+    def read(self, cursor, dimension):
+        """Members of dimension already in the database, with their keys."""
+        if dimension not in self.members:
+            key, columns = DIMENSIONS[dimension]
+            cursor.execute(f"SELECT {key}, {', '.join(sql_columns(columns))} FROM {self.adapter.table_name(dimension)}")
+            self.members[dimension] = pd.DataFrame.from_records(cursor.fetchall(), columns=[key] + columns)
+        return self.members[dimension]
+
+    def keys(self, cursor, dimension, values):
+        """Key of each row of values (a DataFrame of the dimension's columns), adding new members to the table."""
+        key, columns = DIMENSIONS[dimension]
+        values = values[columns].astype(object).fillna(MISSING_LABEL)
+        # Each distinct member is looked up once, and its key spread over its rows
+        codes = values.groupby(columns, sort=False).ngroup().to_numpy()
+        distinct = values.drop_duplicates().reset_index(drop=True)
+
+        members = self.read(cursor, dimension)
+        found = distinct.merge(members, on=columns, how='left')[key]
+        new = distinct[found.isna().to_numpy()]
+        if len(new):
+            next_key = int(members[key].max()) + 1 if len(members) else 1
+            new = new.assign(**{key: range(next_key, next_key + len(new))})[[key] + columns]
+            insert_sql = (f"INSERT INTO {self.adapter.table_name(dimension)} "
+                          f"({', '.join([key] + sql_columns(columns))}) VALUES ({', '.join('?' for _ in new.columns)})")
+            for batch in iter_batches(new, DEFAULT_BATCH_SIZE):
+                cursor.executemany(insert_sql, batch)
+            self.members[dimension] = members = pd.concat([members, new], ignore_index=True)
+            found = distinct.merge(members, on=columns, how='left')[key]
+        return found.to_numpy(dtype='int64')[codes]
+
+
+class StarLoader:
+    """Loads output tables as fact tables of dimension keys (see FACT_TABLES), through a BulkLoader.
+
+    load(table, df) takes the same tables as BulkLoader.load. The load is one
+    member of DimRun: run_id (e.g. the input hash of sql_loader.input_run_id)
+    loaded at processed_at. Nothing is committed here.
+    """
+
+    def __init__(self, adapter, run_id, processed_at, batch_size=DEFAULT_BATCH_SIZE, replace=False):
+        self.adapter = adapter
+        self.loader = BulkLoader(adapter, batch_size=batch_size, staging=True)
+        self.dimensions = DimensionKeys(adapter)
+        self.run_id = run_id
+        self.processed_at = processed_at
+        self.replace = replace
+        self.run_key = None
+        self.stats = self.loader.stats
+
+    def create_tables(self, cursor):
+        """Creates any missing dimension and fact tables."""
+        for dimension in DIMENSIONS:
+            if not self.adapter.table_exists(cursor, dimension):
+                cursor.execute(dimension_ddl(self.adapter, dimension))
+        for table, (fact, _) in FACT_TABLES.items():
+            if not self.adapter.table_exists(cursor, fact):
+                cursor.execute(fact_ddl(self.adapter, table))
+
+    def facts(self, cursor, table, df):
+        """df as its fact table: a key column per dimension role, then run_key, year and value."""
+        _, keys = FACT_TABLES[table]
+        facts = {}
+        for key, (dimension, roles) in keys.items():
+            _, columns = DIMENSIONS[dimension]
+            values = pd.DataFrame({dim_col: df[col] if col in df.columns else MISSING_LABEL
+                                   for col, dim_col in roles.items()}, index=df.index)
+            facts[key] = self.dimensions.keys(cursor, dimension, values.reindex(columns=columns))
+        facts['run_key'] = self.run_key
+        facts['year'] = df['year'].to_numpy()
+        facts['value'] = df['value'].to_numpy()
+        return pd.DataFrame(facts)
+
+    def delete_run(self, cursor, table, scenario_keys):
+        """Deletes the facts of earlier loads of this run id for the given scenarios, returning how many."""
+        fact, _ = FACT_TABLES[table]
+        sql = (f"DELETE FROM {self.adapter.table_name(fact)} WHERE scenario_key = ? AND run_key IN "
+               f"(SELECT run_key FROM {self.adapter.table_name('DimRun')} WHERE run_id = ?)")
+        deleted = 0
+        for scenario_key in scenario_keys:
+            cursor.execute(sql, [int(scenario_key), self.run_id])
+            deleted += max(cursor.rowcount, 0)
+        return deleted
+
+    def load(self, table, df):
+        """Loads df into table's fact table, adding any new dimension members, and returns the rows written."""
+        fact, keys = FACT_TABLES[table]
+        cursor = self.adapter.cursor()
+        if self.run_key is None:
+            self.create_tables(cursor)
+            run = pd.DataFrame({'run_id': [self.run_id], 'processed_at': [self.processed_at]})
+            self.run_key = int(self.dimensions.keys(cursor, 'DimRun', run)[0])
+
+        with stage(f'SQL keys {table}', rows_in=len(df)):
+            facts = self.facts(cursor, table, df)
+        if self.replace:
+            replaced = self.delete_run(cursor, table, facts['scenario_key'].unique())
+            if replaced:
+                print(f'{fact}: replacing {replaced} rows of earlier loads of run {self.run_id}')
+        cursor.close()
+
+        return self.loader.load(fact, facts, columns=list(keys) + ['run_key', 'year', 'value'])
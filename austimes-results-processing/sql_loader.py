@@ -0,0 +1,225 @@
+import hashlib
+import time
+
+import pandas as pd
+
+from input_cache import content_hash
+from instrumentation import stage
+
+# ---------------------------------------------
+# Bulk SQL loading
+# ---------------------------------------------
+# Writes the processed long-format tables in batches with executemany rather
+# than one cursor.execute per row. Nothing is committed here: the caller
+# commits once after every table has loaded, so a run is all-or-nothing.
+#
+# Loads either append rows, or replace a run: each row is tagged with the
+# run's id (RUN_COLUMN), loaded into a staging table, and the target's rows
+# for the same (study, scenario, run id) partitions are deleted and the staged
+# rows inserted with set-based statements in the caller's transaction. Loading
+# the same run again then replaces its rows rather than adding to them, and
+# readers see the old rows until the commit. Target tables need a RUN_COLUMN
+# column for this (ideally indexed with study and scenario), e.g.
+#
+#     ALTER TABLE DevAusTIMES.dbo.Energy ADD run_id varchar(32) NULL
+
+# Output tables and the DataFrame columns loaded into each, in SQL column order
+SQL_TABLES = {
+    'FuelSwitch': ['study', 'scenario', 'state', 'sector', 'subsector', 'subsector_detail',
+                   'start_fuel', 'end_fuel', 'unit', 'year', 'value', 'processed_at'],
+    'Energy': ['study', 'scenario', 'state', 'sector', 'subsector', 'subsector_detail',
+               'fuel_type', 'unit', 'year', 'value', 'processed_at'],
+    'Emissions': ['study', 'scenario', 'state', 'sector', 'subsector', 'subsector_detail',
+                  'emis_type', 'unit', 'year', 'value', 'processed_at'],
+    'ElectricityGenCap': ['study', 'scenario', 'state', 'sector', 'technology', 'technology_detail',
+                          'unit', 'year', 'value', 'processed_at'],
+    'EnergyEfficiency': ['study', 'scenario', 'state', 'sector', 'subsector', 'subsector_detail',
+                         'fuel_type', 'efficiency_type', 'unit', 'year', 'value', 'processed_at'],
+    'HydrogenGenCap': ['study', 'scenario', 'state', 'sector', 'subsector', 'subsector_detail',
+                       'unit', 'year', 'value', 'processed_at'],
+}
+
+# DataFrame columns whose SQL names differ (reserved words in SQL Server)
+SQL_COLUMN_NAMES = {'state': '_state', 'year': '_year', 'value': '_value'}
+
+DEFAULT_BATCH_SIZE = 10000
+
+# Column holding the run id, and the columns that, with it, identify the rows a run replaces
+RUN_COLUMN = 'run_id'
+RUN_PARTITION = ['study', 'scenario']
+
+
+def sql_columns(columns):
+    return [SQL_COLUMN_NAMES.get(col, col) for col in columns]
+
+
+def input_run_id(paths):
+    """Run id from the contents of the input files, so the same inputs always load as the same run."""
+    digest = hashlib.blake2b(digest_size=8)
+    for path in sorted(paths):
+        digest.update(content_hash(path).encode())
+    return digest.hexdigest()
+
+
+class SQLServerAdapter:
+    """pyodbc connection to SQL Server, using fast_executemany for batched inserts."""
+
+    def __init__(self, connection, schema='DevAusTIMES.dbo'):
+        self.connection = connection
+        self.schema = schema
+
+    def cursor(self):
+        cursor = self.connection.cursor()
+        cursor.fast_executemany = True
+        return cursor
+
+    def table_name(self, table):
+        return f'{self.schema}.{table}'
+
+    def staging_name(self, table):
+        return f'#{table}_staging'
+
+    def table_exists(self, cursor, table):
+        cursor.execute("SELECT OBJECT_ID(?, 'U')", [self.table_name(table)])
+        return cursor.fetchone()[0] is not None
+
+    def create_staging(self, cursor, table, columns):
+        # Empty copy of the target columns, dropped with the session
+        cursor.execute(f"SELECT TOP 0 {', '.join(columns)} INTO {self.staging_name(table)} "
+                       f"FROM {self.table_name(table)}")
+
+    def drop_staging(self, cursor, table):
+        cursor.execute(f'DROP TABLE {self.staging_name(table)}')
+
+    def shared_staging_name(self, table, token):
+        # Global temporary table, visible to other connections while the creating one is open
+        return f'##{table}_staging_{token}'
+
+    def create_shared_staging(self, cursor, table, columns, token):
+        cursor.execute(f"SELECT TOP 0 {', '.join(columns)} INTO {self.shared_staging_name(table, token)} "
+                       f"FROM {self.table_name(table)}")
+
+    def drop_shared_staging(self, cursor, table, token):
+        cursor.execute(f'DROP TABLE {self.shared_staging_name(table, token)}')
+
+
+class SQLiteAdapter:
+    """sqlite3 connection standing in for SQL Server, e.g. for local testing."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def cursor(self):
+        return self.connection.cursor()
+
+    def table_name(self, table):
+        return table
+
+    def staging_name(self, table):
+        return f'{table}_staging'
+
+    def table_exists(self, cursor, table):
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?", [self.table_name(table)])
+        return cursor.fetchone() is not None
+
+    def create_staging(self, cursor, table, columns):
+        cursor.execute(f"CREATE TEMP TABLE {self.staging_name(table)} AS "
+                       f"SELECT {', '.join(columns)} FROM {self.table_name(table)} WHERE 0")
+
+    def drop_staging(self, cursor, table):
+        cursor.execute(f'DROP TABLE temp.{self.staging_name(table)}')
+
+    def shared_staging_name(self, table, token):
+        # Temporary tables are private to a connection, so other connections write to a regular table
+        return f'{table}_staging_{token}'
+
+    def create_shared_staging(self, cursor, table, columns, token):
+        cursor.execute(f"CREATE TABLE {self.shared_staging_name(table, token)} AS "
+                       f"SELECT {', '.join(columns)} FROM {self.table_name(table)} WHERE 0")
+
+    def drop_shared_staging(self, cursor, table, token):
+        cursor.execute(f'DROP TABLE {self.shared_staging_name(table, token)}')
+
+
+class BulkLoader:
+    """Loads DataFrames into SQL tables in batches through an adapter.
+
+    With staging=True each table is first loaded into a temporary staging table
+    and then copied into the target with a single set-based INSERT ... SELECT.
+    With a run_id, each table's rows replace those of the same run (see above),
+    always through a staging table.
+    """
+
+    def __init__(self, adapter, batch_size=DEFAULT_BATCH_SIZE, staging=False, run_id=None):
+        self.adapter = adapter
+        self.batch_size = batch_size
+        self.staging = staging or run_id is not None
+        self.run_id = run_id
+        self.stats = []
+
+    def load(self, table, df, columns=None):
+        """Inserts df into table (replacing the run's earlier rows, with a run_id) and returns the rows written."""
+        columns = columns or SQL_TABLES[table]
+        if self.run_id is not None:
+            df = df.assign(**{RUN_COLUMN: self.run_id})
+            columns = columns + [RUN_COLUMN]
+        target_columns = sql_columns(columns)
+        start = time.perf_counter()
+        replaced = 0
+
+        with stage(f'SQL insert {table}', rows_in=len(df)) as record:
+            cursor = self.adapter.cursor()
+            if self.run_id is not None:
+                self.check_run_column(cursor, table)
+            if self.staging:
+                self.adapter.create_staging(cursor, table, target_columns)
+                insert_into = self.adapter.staging_name(table)
+            else:
+                insert_into = self.adapter.table_name(table)
+
+            insert_sql = (f"INSERT INTO {insert_into} ({', '.join(target_columns)}) "
+                          f"VALUES ({', '.join('?' for _ in columns)})")
+            for batch in iter_batches(df[columns], self.batch_size):
+                cursor.executemany(insert_sql, batch)
+
+            if self.run_id is not None:
+                replaced = self.delete_run(cursor, table, df)
+            if self.staging:
+                cursor.execute(f"INSERT INTO {self.adapter.table_name(table)} ({', '.join(target_columns)}) "
+                               f"SELECT {', '.join(target_columns)} FROM {insert_into}")
+                self.adapter.drop_staging(cursor, table)
+            cursor.close()
+            record['rows_out'] = len(df)
+
+        seconds = time.perf_counter() - start
+        self.stats.append({'table': table, 'rows': len(df), 'rows_replaced': replaced, 'seconds': seconds,
+                           'rows_per_sec': len(df) / seconds if seconds else 0.0})
+        print(f'{table}: {len(df)} rows written in {seconds:.1f}s ({self.stats[-1]["rows_per_sec"]:.0f} rows/s)'
+              + (f', replacing {replaced} rows of run {self.run_id}' if replaced else ''))
+        return len(df)
+
+    def check_run_column(self, cursor, table):
+        """Raises ValueError if table has no RUN_COLUMN to replace runs by."""
+        cursor.execute(f'SELECT * FROM {self.adapter.table_name(table)} WHERE 1 = 0')
+        if RUN_COLUMN not in [column[0] for column in cursor.description]:
+            raise ValueError(f'{self.adapter.table_name(table)} has no {RUN_COLUMN} column to replace runs by; '
+                             f'add one (e.g. ALTER TABLE {self.adapter.table_name(table)} ADD {RUN_COLUMN} '
+                             f'varchar(32) NULL) or load without a run id')
+
+    def delete_run(self, cursor, table, df):
+        """Deletes the rows of table in the (study, scenario) partitions of df for this run, returning how many."""
+        partitions = df[RUN_PARTITION].drop_duplicates().to_numpy(dtype=object)
+        where = ' AND '.join(f'{column} = ?' for column in sql_columns(RUN_PARTITION + [RUN_COLUMN]))
+        deleted = 0
+        for partition in partitions.tolist():
+            cursor.execute(f'DELETE FROM {self.adapter.table_name(table)} WHERE {where}', partition + [self.run_id])
+            deleted += max(cursor.rowcount, 0)
+        return deleted
+
+
+def iter_batches(df, batch_size):
+    """Yields lists of row tuples of at most batch_size rows, with NaN as None."""
+    for start in range(0, len(df), batch_size):
+        values = df.iloc[start:start + batch_size].to_numpy(dtype=object)
+        values[pd.isna(values)] = None
+        yield [tuple(row) for row in values.tolist()]
@@ -0,0 +1,188 @@
+import queue
+import threading
+import time
+import uuid
+
+from sql_loader import DEFAULT_BATCH_SIZE, RUN_COLUMN, RUN_PARTITION, SQL_TABLES, BulkLoader, iter_batches, sql_columns
+
+# ---------------------------------------------
+# Concurrent SQL writer
+# ---------------------------------------------
+# Writes several tables at once over a small pool of connections, while the
+# caller carries on processing. Each table submitted is cut into row batches
+# that are put on a bounded queue; worker threads, each with its own
+# connection, take batches off the queue and insert them into a staging table
+# for their table. When the queue is full, submit waits for the workers to
+# catch up, so memory held in batches stays bounded.
+#
+# The targets are only written in finish(): once every batch is staged, the
+# main connection copies each staging table into its target (replacing the
+# run's earlier rows, with a run_id) in a single transaction, so a run is
+# still all-or-nothing. If a worker fails, nothing is copied and the error is
+# raised from submit or finish.
+#
+# Metrics: rows and seconds per table, how long submit waited on a full queue
+# (the workers are the bottleneck) and how long workers waited on an empty one
+# (processing is), and the deepest the queue got.
+
+
+class ConcurrentWriter:
+    """Loads tables through worker threads, each with a connection from connect, wrapped in adapter_type.
+
+    connect is a function returning a new connection. queue_batches bounds
+    the batches waiting to be written (default: two per worker).
+    """
+
+    def __init__(self, connect, adapter_type, workers=3, batch_size=DEFAULT_BATCH_SIZE, queue_batches=None,
+                 run_id=None):
+        self.connect = connect
+        self.adapter_type = adapter_type
+        self.adapter = adapter_type(connect())
+        self.loader = BulkLoader(self.adapter, batch_size=batch_size, run_id=run_id)
+        self.batch_size = batch_size
+        self.run_id = run_id
+        self.token = uuid.uuid4().hex[:8]
+        self.queue = queue.Queue(maxsize=queue_batches or 2 * workers)
+        self.lock = threading.Lock()
+        self.errors = []
+        self.tables = {}
+        self.metrics = {'submit_wait_s': 0.0, 'worker_wait_s': 0.0, 'max_queue': 0}
+        self.workers = [threading.Thread(target=self._work, name=f'sql-writer-{i}', daemon=True) for i in range(workers)]
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, table, df, columns=None):
+        """Stages df for table, returning once its last batch is queued (waiting while the queue is full)."""
+        self._raise_worker_error()
+        columns = columns or SQL_TABLES[table]
+        if self.run_id is not None:
+            df = df.assign(**{RUN_COLUMN: self.run_id})
+            columns = columns + [RUN_COLUMN]
+        target_columns = sql_columns(columns)
+
+        cursor = self.adapter.cursor()
+        if self.run_id is not None:
+            self.loader.check_run_column(cursor, table)
+        self.adapter.create_shared_staging(cursor, table, target_columns, self.token)
+        cursor.close()
+        # Committed so the workers' connections can write to the staging table
+        self.adapter.connection.commit()
+
+        insert_sql = (f"INSERT INTO {self.adapter.shared_staging_name(table, self.token)} "
+                      f"({', '.join(target_columns)}) VALUES ({', '.join('?' for _ in columns)})")
+        batches = -(-len(df) // self.batch_size)
+        self.tables[table] = {'columns': target_columns, 'partitions': df[RUN_PARTITION].drop_duplicates(),
+                              'rows': len(df), 'batches': batches, 'batches_written': 0, 'rows_written': 0,
+                              'submitted': time.perf_counter(), 'seconds': None}
+        for batch in iter_batches(df[columns], self.batch_size):
+            start = time.perf_counter()
+            self.queue.put((table, insert_sql, batch))
+            self.metrics['submit_wait_s'] += time.perf_counter() - start
+            self.metrics['max_queue'] = max(self.metrics['max_queue'], self.queue.qsize())
+            self._raise_worker_error()
+        if not batches:
+            self.tables[table]['seconds'] = 0.0
+
+    def finish(self):
+        """Waits for the staged rows, then copies them into their targets and commits, all-or-nothing."""
+        self._stop_workers()
+        self._raise_worker_error()
+        cursor = self.adapter.cursor()
+        try:
+            for table, info in self.tables.items():
+                if self.run_id is not None:
+                    replaced = self.loader.delete_run(cursor, table, info['partitions'])
+                    if replaced:
+                        print(f'{table}: replacing {replaced} rows of run {self.run_id}')
+                columns = ', '.join(info['columns'])
+                cursor.execute(f"INSERT INTO {self.adapter.table_name(table)} ({columns}) "
+                               f"SELECT {columns} FROM {self.adapter.shared_staging_name(table, self.token)}")
+            self.adapter.connection.commit()
+        except Exception:
+            self.adapter.connection.rollback()
+            raise
+        finally:
+            cursor.close()
+            self._drop_staging()
+        print(f'Queue: submit waited {self.metrics["submit_wait_s"]:.1f}s on a full queue, workers waited '
+              f'{self.metrics["worker_wait_s"]:.1f}s on an empty one, at most {self.metrics["max_queue"]} batches queued')
+        return self.stats()
+
+    def abort(self):
+        """Stops the workers and drops the staging tables, leaving the targets unchanged."""
+        self._stop_workers()
+        self._drop_staging()
+
+    def stats(self):
+        """Rows, batches and seconds from submission to the last batch written, per table."""
+        return [{'table': table, 'rows': info['rows'], 'batches': info['batches'], 'seconds': info['seconds']}
+                for table, info in self.tables.items()]
+
+    def _work(self):
+        adapter = None
+        try:
+            adapter = self.adapter_type(self.connect())
+            cursor = adapter.cursor()
+        except Exception as error:
+            self._fail(error)
+        while True:
+            start = time.perf_counter()
+            item = self.queue.get()
+            with self.lock:
+                self.metrics['worker_wait_s'] += time.perf_counter() - start
+            if item is None:
+                break
+            if self.errors:
+                # Keep draining so submit never waits on a queue nobody takes from
+                continue
+            table, insert_sql, batch = item
+            try:
+                cursor.executemany(insert_sql, batch)
+                adapter.connection.commit()
+            except Exception as error:
+                self._fail(error)
+                continue
+            self._written(table, len(batch))
+        if adapter is not None:
+            adapter.connection.close()
+
+    def _written(self, table, rows):
+        with self.lock:
+            info = self.tables[table]
+            info['batches_written'] += 1
+            info['rows_written'] += rows
+            done = info['batches_written'] == info['batches']
+            if done:
+                info['seconds'] = time.perf_counter() - info['submitted']
+        if done:
+            print(f'{table}: {info["rows_written"]} rows staged in {info["seconds"]:.1f}s '
+                  f'({info["rows_written"] / info["seconds"] if info["seconds"] else 0:.0f} rows/s)')
+
+    def _fail(self, error):
+        with self.lock:
+            self.errors.append(error)
+
+    def _raise_worker_error(self):
+        if self.errors:
+            self.abort()
+            raise self.errors[0]
+
+    def _stop_workers(self):
+        # Counted before any stop is queued: a worker taking an earlier one
+        # could otherwise exit before its own check, leaving another waiting
+        alive = sum(worker.is_alive() for worker in self.workers)
+        for _ in range(alive):
+            self.queue.put(None)
+        for worker in self.workers:
+            worker.join()
+
+    def _drop_staging(self):
+        if self.adapter is None:
+            return
+        cursor = self.adapter.cursor()
+        for table in self.tables:
+            self.adapter.drop_shared_staging(cursor, table, self.token)
+        cursor.close()
+        self.adapter.connection.commit()
+        self.adapter.connection.close()
+        self.adapter = None
@@ -0,0 +1,58 @@
+"""Checks of compare_outputs.py.
+
+Run from the austimes-results-processing directory:
+    python -m unittest discover tests
+"""
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from compare_outputs import compare_outputs  # noqa: E402
+
+
+class CompareOutputsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.old, self.new, self.report = (Path(self.tmp.name) / name for name in ['old', 'new', 'report'])
+        self.old.mkdir()
+        self.new.mkdir()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, directory, name, rows, columns):
+        pd.DataFrame(rows, columns=columns).to_csv(directory / f'{name}.csv', index=False)
+
+    def test_changed_cells(self):
+        columns = ['scenario', 'state', '2020', '2021']
+        self.write(self.old, 'emissions', [['A', 'NSW', 1.0, 2.0], ['A', 'VIC', 3.0, 4.0]], columns)
+        self.write(self.new, 'emissions', [['A', 'NSW', 1.0, 2.5], ['A', 'QLD', 5.0, 6.0]], columns)
+        for buckets in [1, 3]:
+            summary = compare_outputs(self.old, self.new, self.report, buckets=buckets).iloc[0]
+            self.assertEqual((summary['keys_added'], summary['keys_removed']), (1, 1))
+            # NSW 2021, and both years of VIC and QLD
+            self.assertEqual(summary['cells_changed'], 5)
+            self.assertEqual(summary['key_columns_added'], '')
+
+    def test_key_columns_changed(self):
+        # elec_gen gains a technology_detail breakdown, and the other tables are still compared
+        self.write(self.old, 'elec_gen', [['A', 'Wind', 3.0, 4.0]], ['scenario', 'technology', '2020', '2021'])
+        self.write(self.new, 'elec_gen', [['A', 'Wind', 'Onshore', 1.0, 1.5], ['A', 'Wind', 'Offshore', 2.0, 3.0]],
+                   ['scenario', 'technology', 'technology_detail', '2020', '2021'])
+        self.write(self.old, 'h2_gen', [['A', 1.0]], ['scenario', '2020'])
+        self.write(self.new, 'h2_gen', [['A', 2.0]], ['scenario', '2020'])
+        for buckets in [1, 3]:
+            summary = compare_outputs(self.old, self.new, self.report, buckets=buckets).set_index('table')
+            self.assertEqual(summary.loc['elec_gen', 'key_columns_added'], 'technology_detail')
+            self.assertEqual(summary.loc['elec_gen', 'key_columns_removed'], '')
+            # Summed over technology_detail, only 2021 changed (4.0 to 4.5)
+            self.assertEqual(summary.loc['elec_gen', 'cells_changed'], 1)
+            self.assertEqual(summary.loc['h2_gen', 'cells_changed'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+"""Checks of gap_filling.py.
+
+Run from the austimes-results-processing directory:
+    python -m unittest discover tests
+"""
+import sys
+import unittest
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from gap_filling import gap_fill, gap_fill_long  # noqa: E402
+
+
+def sums(rows):
+    """Group sums indexed by scenario, sector and year, from (scenario, sector, year, value) rows."""
+    df = pd.DataFrame(rows, columns=['scenario', 'sector', 'year', 'value'])
+    return df.set_index(['scenario', 'sector', 'year'])['value']
+
+
+class GapFillLongTest(unittest.TestCase):
+    def test_interpolates_missing_years(self):
+        filled = gap_fill_long(sums([('A', 'Power', 2020, 0.0), ('A', 'Power', 2025, 10.0)]))
+        self.assertEqual(list(filled.index.get_level_values('year')), list(range(2020, 2026)))
+        np.testing.assert_allclose(filled.to_numpy(), [0, 2, 4, 6, 8, 10])
+
+    def test_key_missing_a_reported_year(self):
+        values = sums([('A', 'Power', 2020, 0.0), ('A', 'Power', 2030, 10.0), ('A', 'Gas', 2020, 4.0)])
+        # Without a fill value, the years interpolated from the missing year are left out
+        self.assertEqual(len(gap_fill_long(values).loc[('A', 'Gas')]), 1)
+        gas = gap_fill_long(values, fill_value=0).loc[('A', 'Gas')]
+        np.testing.assert_allclose(gas.to_numpy(), np.linspace(4, 0, 11))
+
+    def test_empty_input(self):
+        values = sums([]).reorder_levels(['year', 'scenario', 'sector'])
+        for fill_value in [None, 0]:
+            filled = gap_fill_long(values, fill_value=fill_value)
+            self.assertEqual(len(filled), 0)
+            self.assertEqual(list(filled.index.names), ['scenario', 'sector', 'year'])
+            self.assertEqual(filled.rename('value').reset_index().columns.tolist(),
+                             ['scenario', 'sector', 'year', 'value'])
+
+    def test_matches_wide_gap_fill(self):
+        values = sums([('A', 'Power', 2020, 1.0), ('A', 'Power', 2030, 3.0),
+                       ('B', 'Power', 2020, 5.0), ('B', 'Power', 2025, 2.0), ('B', 'Power', 2030, 7.0)])
+        wide = gap_fill(values.unstack('year', fill_value=0))
+        long = gap_fill_long(values, fill_value=0).unstack('year')
+        np.testing.assert_allclose(long.to_numpy(), wide.to_numpy())
+
+
+if __name__ == '__main__':
+    unittest.main()
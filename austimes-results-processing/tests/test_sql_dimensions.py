@@ -0,0 +1,120 @@
+"""Regression checks for sql_dimensions.py against an in-memory SQLite database.
+
+Run from the austimes-results-processing directory:
+    python -m unittest discover tests
+"""
+import sqlite3
+import sys
+import unittest
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from sql_dimensions import DIMENSIONS, FACT_TABLES, MISSING_LABEL, StarLoader  # noqa: E402
+from sql_loader import SQL_TABLES, SQLiteAdapter, sql_columns  # noqa: E402
+
+
+def table_rows(table, scenario, value, years=range(2020, 2025)):
+    """Rows of a table for one scenario of a study over two states, with the same value every year.
+
+    Every other label is named after its column, except the last, which is missing.
+    """
+    columns = [col for col in SQL_TABLES[table] if col not in ('study', 'scenario', 'state', 'year', 'value',
+                                                                 'processed_at')]
+    rows = [{'study': 'Study', 'scenario': scenario, 'state': state, 'year': year, 'value': value,
+             **{col: f'{col} {state}' for col in columns}}
+            for state in ['NSW', 'VIC'] for year in years]
+    df = pd.DataFrame(rows, columns=SQL_TABLES[table][:-1])
+    df[columns[-1]] = np.nan
+    return df
+
+
+def flat_query(table, run_id):
+    """SQL joining table's fact table back to its dimensions, as the columns of the output table, for one run."""
+    fact, keys = FACT_TABLES[table]
+    selects, joins = [], []
+    for key, (dimension, roles) in keys.items():
+        dim_key, _ = DIMENSIONS[dimension]
+        joins.append(f"JOIN {dimension} {key}_dim ON {key}_dim.{dim_key} = f.{key}")
+        selects += [f"{key}_dim.{dim_col} AS {col}" for col, dim_col in zip(roles, sql_columns(roles.values()))]
+    year, value = sql_columns(['year', 'value'])
+    return (f"SELECT {', '.join(selects)}, f.{year} AS year, f.{value} AS value FROM {fact} f {' '.join(joins)} "
+            f"JOIN DimRun r ON r.run_key = f.run_key WHERE r.run_id = '{run_id}'")
+
+
+class StarLoaderTest(unittest.TestCase):
+    def setUp(self):
+        self.connection = sqlite3.connect(':memory:')
+
+    def tearDown(self):
+        self.connection.close()
+
+    def load(self, run_id, tables, replace=False, processed_at='2026-01-01_00-00'):
+        loader = StarLoader(SQLiteAdapter(self.connection), run_id, processed_at, batch_size=3, replace=replace)
+        for table, df in tables.items():
+            loader.load(table, df)
+        self.connection.commit()
+        return loader
+
+    def members(self, dimension):
+        key, columns = DIMENSIONS[dimension]
+        cursor = self.connection.execute(f"SELECT {key}, {', '.join(sql_columns(columns))} FROM {dimension} "
+                                         f"ORDER BY {key}")
+        return cursor.fetchall()
+
+    def energy(self, run_id):
+        scenario, value = sql_columns(['scenario', 'value'])
+        cursor = self.connection.execute(f"SELECT s.{scenario}, COUNT(*), SUM(f.{value}) FROM FactEnergy f "
+                                         f"JOIN DimScenario s ON s.scenario_key = f.scenario_key "
+                                         f"JOIN DimRun r ON r.run_key = f.run_key WHERE r.run_id = ? "
+                                         f"GROUP BY s.{scenario} ORDER BY s.{scenario}", [run_id])
+        return cursor.fetchall()
+
+    def test_keys_reused_across_loads(self):
+        self.load('run1', {'Energy': table_rows('Energy', 'A', 1.0)})
+        states = self.members('DimState')
+        sectors = self.members('DimSector')
+        self.load('run2', {'Energy': pd.concat([table_rows('Energy', 'A', 1.0), table_rows('Energy', 'B', 1.0)]),
+                           'Emissions': table_rows('Emissions', 'A', 1.0)}, processed_at='2026-01-02_00-00')
+        # Members already stored keep their keys, and only new ones are added
+        self.assertEqual(self.members('DimScenario'), [(1, 'Study', 'A'), (2, 'Study', 'B')])
+        self.assertEqual(self.members('DimState'), states)
+        self.assertEqual(self.members('DimSector'), sectors)
+        self.assertEqual(self.members('DimRun'), [(1, 'run1', '2026-01-01_00-00'), (2, 'run2', '2026-01-02_00-00')])
+        self.assertEqual(self.members('DimFuel'), [(1, 'fuel_type NSW'), (2, 'fuel_type VIC')])
+        self.assertEqual(self.members('DimUnit'), [(1, MISSING_LABEL)])
+        self.assertEqual(self.members('DimEmissionType'), [(1, 'emis_type NSW'), (2, 'emis_type VIC')])
+
+    def test_replace_deletes_only_the_runs_rows(self):
+        self.load('run1', {'Energy': pd.concat([table_rows('Energy', 'A', 1.0), table_rows('Energy', 'B', 1.0)])})
+        self.load('run2', {'Energy': table_rows('Energy', 'A', 3.0)})
+        # Reloading a subset of run1 (scenario A) replaces just those rows
+        self.load('run1', {'Energy': table_rows('Energy', 'A', 2.0)}, replace=True)
+        self.assertEqual(self.energy('run1'), [('A', 10, 20.0), ('B', 10, 10.0)])
+        self.assertEqual(self.energy('run2'), [('A', 10, 30.0)])
+
+    def test_without_replace_loads_are_kept(self):
+        self.load('run1', {'Energy': table_rows('Energy', 'A', 1.0)})
+        self.load('run1', {'Energy': table_rows('Energy', 'A', 2.0)})
+        self.assertEqual(self.energy('run1'), [('A', 20, 30.0)])
+
+    def test_facts_join_back_to_the_flat_table(self):
+        tables = {table: pd.concat([table_rows(table, 'A', 1.0), table_rows(table, 'B', 2.0)], ignore_index=True)
+                  for table in FACT_TABLES}
+        self.load('run1', tables)
+        self.load('run2', {table: df.assign(value=5.0) for table, df in tables.items()})
+        for table, df in tables.items():
+            with self.subTest(table=table):
+                flat = pd.read_sql(flat_query(table, 'run1'), self.connection)
+                self.assertEqual(sorted(flat.columns), sorted(df.columns))
+                expected = df.fillna(MISSING_LABEL)[list(flat.columns)]
+                labels = [col for col in flat.columns if col != 'value']
+                pd.testing.assert_frame_equal(flat.sort_values(labels).reset_index(drop=True),
+                                              expected.sort_values(labels).reset_index(drop=True),
+                                              check_dtype=False)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+"""Regression checks for sql_loader.py against an in-memory SQLite database.
+
+Run from the austimes-results-processing directory:
+    python -m unittest discover tests
+"""
+import sqlite3
+import sys
+import unittest
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from sql_loader import RUN_COLUMN, SQL_TABLES, BulkLoader, SQLiteAdapter, sql_columns  # noqa: E402
+
+
+def energy_rows(scenario, value, years=range(2020, 2030)):
+    """Rows of the Energy table for one scenario of a study, with the same value every year."""
+    df = pd.DataFrame({column: '-' for column in SQL_TABLES['Energy']}, index=range(len(years)))
+    df['study'] = 'Study'
+    df['scenario'] = scenario
+    df['year'] = list(years)
+    df['value'] = value
+    return df
+
+
+class AppendTest(unittest.TestCase):
+    def setUp(self):
+        self.connection = sqlite3.connect(':memory:')
+        self.connection.execute(f"CREATE TABLE Energy ({', '.join(sql_columns(SQL_TABLES['Energy']))})")
+
+    def tearDown(self):
+        self.connection.close()
+
+    def rows(self):
+        scenario, year, value = sql_columns(['scenario', 'year', 'value'])
+        cursor = self.connection.execute(f"SELECT {scenario}, COUNT(*), COUNT({value}), SUM({value}), "
+                                         f"MIN({year}), MAX({year}) FROM Energy GROUP BY {scenario} ORDER BY {scenario}")
+        return cursor.fetchall()
+
+    def test_loads_are_appended(self):
+        for staging in [False, True]:
+            with self.subTest(staging=staging):
+                self.connection.execute('DELETE FROM Energy')
+                loader = BulkLoader(SQLiteAdapter(self.connection), batch_size=3, staging=staging)
+                missing = energy_rows('B', 1.0)
+                missing.loc[0, 'value'] = float('nan')
+                loader.load('Energy', pd.concat([energy_rows('A', 1.0), missing], ignore_index=True))
+                loader.load('Energy', energy_rows('A', 2.0))
+                self.connection.commit()
+                # Missing values are loaded as NULL
+                self.assertEqual(self.rows(), [('A', 20, 20, 30.0, 2020, 2029), ('B', 10, 9, 9.0, 2020, 2029)])
+                self.assertEqual([(row['table'], row['rows'], row['rows_replaced']) for row in loader.stats],
+                                 [('Energy', 20, 0), ('Energy', 10, 0)])
+                # The staging table is dropped once copied
+                self.assertEqual(self.connection.execute('SELECT name FROM sqlite_temp_master').fetchall(), [])
+
+
+class ReplaceRunTest(unittest.TestCase):
+    def setUp(self):
+        self.connection = sqlite3.connect(':memory:')
+        columns = sql_columns(SQL_TABLES['Energy'] + [RUN_COLUMN])
+        self.connection.execute(f"CREATE TABLE Energy ({', '.join(columns)})")
+
+    def tearDown(self):
+        self.connection.close()
+
+    def load(self, run_id, df):
+        loader = BulkLoader(SQLiteAdapter(self.connection), batch_size=3, run_id=run_id)
+        loader.load('Energy', df)
+        self.connection.commit()
+        return loader.stats
+
+    def rows(self):
+        scenario, value = sql_columns(['scenario', 'value'])
+        cursor = self.connection.execute(f"SELECT {scenario}, {RUN_COLUMN}, COUNT(*), SUM({value}) FROM Energy "
+                                         f"GROUP BY {scenario}, {RUN_COLUMN} ORDER BY {scenario}, {RUN_COLUMN}")
+        return cursor.fetchall()
+
+    def test_reload_replaces_the_runs_rows(self):
+        self.load('run1', pd.concat([energy_rows('A', 1.0), energy_rows('B', 1.0)], ignore_index=True))
+        # Reloading a subset of the run (scenario A) replaces just those rows
+        self.load('run1', energy_rows('A', 2.0))
+        self.assertEqual(self.rows(), [('A', 'run1', 10, 20.0), ('B', 'run1', 10, 10.0)])
+
+    def test_other_runs_are_kept(self):
+        self.load('run1', energy_rows('A', 1.0))
+        self.load('run2', energy_rows('A', 3.0))
+        self.assertEqual(self.rows(), [('A', 'run1', 10, 10.0), ('A', 'run2', 10, 30.0)])
+
+    def test_missing_run_column(self):
+        connection = sqlite3.connect(':memory:')
+        connection.execute(f"CREATE TABLE Energy ({', '.join(sql_columns(SQL_TABLES['Energy']))})")
+        with self.assertRaises(ValueError):
+            BulkLoader(SQLiteAdapter(connection), run_id='run1').load('Energy', energy_rows('A', 1.0))
+        connection.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+"""Regression checks for sql_writer.py against a SQLite database file shared by several connections.
+
+Run from the austimes-results-processing directory:
+    python -m unittest discover tests
+"""
+import sqlite3
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from sql_loader import RUN_COLUMN, SQL_TABLES, SQLiteAdapter, sql_columns  # noqa: E402
+from sql_writer import ConcurrentWriter  # noqa: E402
+
+
+def table_rows(table, scenario, value, years=range(2020, 2030)):
+    """Rows of a table for one scenario of a study, with the same value every year."""
+    df = pd.DataFrame({column: '-' for column in SQL_TABLES[table]}, index=range(len(years)))
+    df['study'] = 'Study'
+    df['scenario'] = scenario
+    df['year'] = list(years)
+    df['value'] = value
+    return df
+
+
+class ConcurrentWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.database = str(Path(self.directory.name) / 'results.db')
+        self.connection = self.connect()
+        for table, columns in SQL_TABLES.items():
+            self.connection.execute(f"CREATE TABLE {table} ({', '.join(sql_columns(columns + [RUN_COLUMN]))})")
+        self.connection.commit()
+
+    def tearDown(self):
+        self.connection.close()
+        self.directory.cleanup()
+
+    def connect(self):
+        return sqlite3.connect(self.database, timeout=60)
+
+    def writer(self, run_id=None, connect=None):
+        # Batches of 3 rows and a short queue, so every table is spread over several workers
+        return ConcurrentWriter(connect or self.connect, SQLiteAdapter, workers=3, batch_size=3, queue_batches=2,
+                                run_id=run_id)
+
+    def write(self, run_id, scenarios, value):
+        writer = self.writer(run_id)
+        for table in SQL_TABLES:
+            writer.submit(table, pd.concat([table_rows(table, scenario, value) for scenario in scenarios],
+                                           ignore_index=True))
+        return writer.finish()
+
+    def rows(self, table):
+        scenario, value = sql_columns(['scenario', 'value'])
+        cursor = self.connection.execute(f"SELECT {scenario}, {RUN_COLUMN}, COUNT(*), SUM({value}) FROM {table} "
+                                         f"GROUP BY {scenario}, {RUN_COLUMN} ORDER BY {scenario}, {RUN_COLUMN}")
+        return cursor.fetchall()
+
+    def staging_tables(self):
+        return self.connection.execute("SELECT name FROM sqlite_master WHERE name LIKE '%staging%'").fetchall()
+
+    def test_every_table_lands_once(self):
+        stats = self.write('run1', ['A', 'B'], 1.0)
+        self.assertEqual([(row['table'], row['rows'], row['batches']) for row in stats],
+                         [(table, 20, 7) for table in SQL_TABLES])
+        for table in SQL_TABLES:
+            self.assertEqual(self.rows(table), [('A', 'run1', 10, 10.0), ('B', 'run1', 10, 10.0)])
+        self.assertEqual(self.staging_tables(), [])
+
+    def test_reload_replaces_only_the_runs_rows(self):
+        self.write('run1', ['A', 'B'], 1.0)
+        self.write('run2', ['A'], 3.0)
+        # Reloading a subset of run1 (scenario A) replaces just those rows
+        self.write('run1', ['A'], 2.0)
+        for table in SQL_TABLES:
+            self.assertEqual(self.rows(table), [('A', 'run1', 10, 20.0), ('A', 'run2', 10, 30.0),
+                                                ('B', 'run1', 10, 10.0)])
+        self.assertEqual(self.staging_tables(), [])
+
+    def test_abort_after_failed_submit(self):
+        writer = self.writer('run1')
+        writer.submit('Energy', table_rows('Energy', 'A', 1.0))
+        with self.assertRaises(KeyError):
+            writer.submit('Emissions', table_rows('Emissions', 'A', 1.0).drop(columns='value'))
+        writer.abort()
+        self.assertEqual(self.staging_tables(), [])
+        for table in SQL_TABLES:
+            self.assertEqual(self.rows(table), [])
+
+    def test_abort_after_worker_failure(self):
+        connections = []
+
+        def connect():
+            # Workers get a database without the staging tables, so their first insert fails
+            connections.append(None)
+            return self.connect() if len(connections) == 1 else sqlite3.connect(':memory:')
+
+        writer = self.writer('run1', connect)
+        with self.assertRaises(sqlite3.OperationalError):
+            for table in SQL_TABLES:
+                writer.submit(table, table_rows(table, 'A', 1.0))
+            writer.finish()
+        writer.abort()
+        self.assertEqual(self.staging_tables(), [])
+        for table in SQL_TABLES:
+            self.assertEqual(self.rows(table), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+"""Regression checks for summarize in processing.py.
+
+Run from the austimes-results-processing directory:
+    python -m unittest discover tests
+"""
+import sys
+import unittest
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import processing  # noqa: E402
+
+
+def sector_sums():
+    """Sums of three sectors: A reports 2020 and 2030, B 2020 to 2030 every five years and C 2025 and 2030."""
+    index = pd.MultiIndex.from_tuples([
+        ('A', 'x', 2020), ('A', 'x', 2030), ('A', 'y', 2030),
+        ('B', 'z', 2020), ('B', 'z', 2025), ('B', 'z', 2030),
+        ('C', 'w', 2025), ('C', 'w', 2030),
+    ], names=['sector', 'subsector', 'year'])
+    return pd.Series([1.0, 3.0, 2.0, 0.0, 5.0, 10.0, 4.0, 6.0], index=index)
+
+
+class SummarizeTest(unittest.TestCase):
+    def setUp(self):
+        self.wide_format = processing.WIDE_FORMAT
+
+    def tearDown(self):
+        processing.WIDE_FORMAT = self.wide_format
+
+    def summarize(self, wide, by=None):
+        processing.WIDE_FORMAT = wide
+        summary = processing.summarize(sector_sums(), by=by)
+        if wide:
+            summary = summary.set_index(['sector', 'subsector'])
+        else:
+            summary = summary.set_index(['sector', 'subsector', 'year'])['value'].unstack('year')
+        summary.columns = list(summary.columns)
+        return summary
+
+    def test_by_sector(self):
+        for wide in [True, False]:
+            with self.subTest(wide=wide):
+                summary = self.summarize(wide, by='sector')
+                # 2025 is interpolated for sector A, which does not report it
+                self.assertEqual(summary.loc[('A', 'x'), [2020, 2025, 2030]].tolist(), [1.0, 2.0, 3.0])
+                # A year the sector reports but a group has no sum for is 0
+                self.assertEqual(summary.loc[('A', 'y'), [2020, 2025, 2030]].tolist(), [0.0, 1.0, 2.0])
+                self.assertEqual(summary.loc[('B', 'z'), [2020, 2021, 2025]].tolist(), [0.0, 1.0, 5.0])
+                self.assertEqual(summary.loc[('C', 'w'), [2025, 2026, 2030]].tolist(), [4.0, 4.4, 6.0])
+        # Before sector C's first year, values are 0 in wide format and left out in long format
+        self.assertEqual(self.summarize(True, by='sector').loc[('C', 'w'), [2020, 2024]].tolist(), [0.0, 0.0])
+        self.assertTrue(self.summarize(False, by='sector').loc[('C', 'w'), [2020, 2024]].isna().all())
+
+    def test_all_groups_together(self):
+        for wide in [True, False]:
+            with self.subTest(wide=wide):
+                summary = self.summarize(wide)
+                # 2025 is reported by sectors B and C, so it is 0 wherever else it is missing
+                self.assertEqual(summary.loc[('A', 'x'), [2020, 2025, 2030]].tolist(), [1.0, 0.0, 3.0])
+                self.assertEqual(summary.loc[('C', 'w'), [2020, 2025, 2030]].tolist(), [0.0, 4.0, 6.0])
+                self.assertEqual(summary.loc[('C', 'w'), 2021], 0.8)
+
+
+if __name__ == '__main__':
+    unittest.main()